@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+"""
+Benchmark de latencia de páginas rápidas mientras hay llamadas de IA en curso.
+
+Mide /health/ y /lista/ sin carga (línea base) y luego con N solicitudes
+concurrentes al asistente (/peticion/<radicado>/asistente/procesar/).
+Sirve para comparar el modo WSGI (gunicorn sync) contra el modo ASGI
+(gunicorn + uvicorn-worker). Ver DEPLOYMENT_ASGI.md.
+
+Uso (con el servidor corriendo con GEMINI_BACKEND=fake y GEMINI_FAKE_LATENCIA=8):
+    python benchmark_latencia.py --url http://127.0.0.1:8000 \\
+        --cedula 1020458606 --password <clave> --radicado <radicado> --concurrencia 4
+"""
+
+import argparse
+import http.cookiejar
+import json
+import math
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def crear_sesion(url, cedula, password):
+    """Inicia sesión y retorna un opener con la cookie de sesión"""
+    cookies = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(cookies))
+
+    html = opener.open(f'{url}/login/').read().decode()
+    token = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', html).group(1)
+    datos = urllib.parse.urlencode({
+        'csrfmiddlewaretoken': token, 'cedula': cedula, 'password': password
+    }).encode()
+    solicitud = urllib.request.Request(f'{url}/login/', data=datos, headers={'Referer': f'{url}/login/'})
+    opener.open(solicitud)
+
+    if not any(cookie.name == 'sessionid' for cookie in cookies):
+        raise SystemExit('No fue posible iniciar sesión: revise cédula y contraseña')
+    return opener
+
+
+def medir(opener, url, rutas, duracion):
+    """Pide las rutas en ciclo durante `duracion` segundos y retorna las latencias por ruta"""
+    latencias = {ruta: [] for ruta in rutas}
+    fin = time.monotonic() + duracion
+    while time.monotonic() < fin:
+        for ruta in rutas:
+            inicio = time.monotonic()
+            opener.open(f'{url}{ruta}').read()
+            latencias[ruta].append(time.monotonic() - inicio)
+    return latencias
+
+
+def llamar_asistente(opener, url, radicado, resultados):
+    """Solicitud lenta: genera una respuesta con el asistente"""
+    cuerpo = json.dumps({'respuestas': [{'pregunta': '¿Contexto?', 'respuesta': 'Benchmark'}]}).encode()
+    solicitud = urllib.request.Request(
+        f'{url}/peticion/{radicado}/asistente/procesar/', data=cuerpo,
+        headers={'Content-Type': 'application/json'}
+    )
+    inicio = time.monotonic()
+    try:
+        data = json.loads(opener.open(solicitud, timeout=300).read())
+        resultados.append((time.monotonic() - inicio, data.get('success', False)))
+    except Exception as e:
+        resultados.append((time.monotonic() - inicio, False))
+        print(f'  Error en solicitud al asistente: {e}')
+
+
+def imprimir(titulo, latencias):
+    print(f'\n{titulo}')
+    print(f'  {"ruta":<12}{"n":>6}{"p50 (ms)":>12}{"p95 (ms)":>12}')
+    for ruta, valores in latencias.items():
+        p50, p95 = percentil(valores, 50), percentil(valores, 95)
+        print(f'  {ruta:<12}{len(valores):>6}{p50 * 1000:>12.1f}{p95 * 1000:>12.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--cedula', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--radicado', required=True, help='Petición ya transcrita para el asistente')
+    parser.add_argument('--concurrencia', type=int, default=4, help='Solicitudes simultáneas al asistente')
+    parser.add_argument('--duracion', type=float, default=10.0, help='Segundos de medición por fase')
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/')
+    rutas = ['/health/', '/lista/']
+
+    opener = crear_sesion(url, args.cedula, args.password)
+    imprimir('Línea base (sin llamadas de IA)', medir(opener, url, rutas, args.duracion))
+
+    resultados = []
+    hilos = [
+        threading.Thread(target=llamar_asistente, args=(crear_sesion(url, args.cedula, args.password), url, args.radicado, resultados))
+        for _ in range(args.concurrencia)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    time.sleep(0.5)  # Dar tiempo a que las llamadas de IA ocupen el servidor
+    imprimir(f'Con {args.concurrencia} llamadas de IA en curso', medir(opener, url, rutas, args.duracion))
+    for hilo in hilos:
+        hilo.join()
+
+    exitosas = sum(1 for _, ok in resultados if ok)
+    duraciones = [duracion for duracion, _ in resultados]
+    print(f'\nAsistente: {exitosas}/{len(resultados)} exitosas, p50 {percentil(duraciones, 50):.1f}s')
+
+
+if __name__ == '__main__':
+    main()
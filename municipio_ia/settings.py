@@ -37,7 +37,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Para servir archivos estáticos en producción
+    'peticiones.middleware.WhiteNoiseAsyncMiddleware',  # Archivos estáticos en producción (WhiteNoise, compatible con ASGI)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -116,13 +116,59 @@ if (BASE_DIR / 'static').exists():
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
-# Configuración de WhiteNoise para servir archivos estáticos en producción
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+# Almacenamiento de los archivos subidos: 'local' (MEDIA_ROOT, una sola instancia con su volumen)
+# u 'objetos' (S3 compatible, permite varias instancias de la aplicación)
+ALMACENAMIENTO_ARCHIVOS = config('ALMACENAMIENTO_ARCHIVOS', default='local')
+
+# Almacenamiento de objetos: cliente 's3' (boto3; AWS, MinIO, R2...) o 'local' (sustituto en disco para desarrollo y pruebas)
+OBJETOS_CLIENTE = config('OBJETOS_CLIENTE', default='s3')
+OBJETOS_BUCKET = config('OBJETOS_BUCKET', default='cividata-dpet')
+OBJETOS_ENDPOINT_URL = config('OBJETOS_ENDPOINT_URL', default='')  # Vacío para AWS; p. ej. http://minio:9000
+OBJETOS_REGION = config('OBJETOS_REGION', default='us-east-1')
+OBJETOS_ACCESS_KEY = config('OBJETOS_ACCESS_KEY', default='')
+OBJETOS_SECRET_KEY = config('OBJETOS_SECRET_KEY', default='')
+OBJETOS_URL_EXPIRA = config('OBJETOS_URL_EXPIRA', default=300, cast=int)  # Segundos de validez de las URLs firmadas
+OBJETOS_LOCAL_RAIZ = config('OBJETOS_LOCAL_RAIZ', default=str(BASE_DIR / 'objetos'))
+
+STORAGES = {
+    # Archivos subidos: uno por contenido distinto, nombrados por su SHA-256 (ver peticiones/storage.py)
+    'default': {
+        'BACKEND': 'peticiones.storage.AlmacenamientoObjetos' if ALMACENAMIENTO_ARCHIVOS == 'objetos'
+                   else 'peticiones.storage.AlmacenamientoContenido',
+    },
+    # Configuración de WhiteNoise para servir archivos estáticos en producción
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # Media files (uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Segundos que el navegador reutiliza un archivo media sin revalidarlo (siempre como caché privada)
+MEDIA_CACHE_SEGUNDOS = config('MEDIA_CACHE_SEGUNDOS', default=3600, cast=int)
+# Los archivos direccionados por contenido (miniaturas, PDF) no cambian nunca: el navegador los guarda un año
+MEDIA_CACHE_INMUTABLE_SEGUNDOS = config('MEDIA_CACHE_INMUTABLE_SEGUNDOS', default=365 * 24 * 3600, cast=int)
+
+# Entrega de archivos media por un proxy al frente: '' (Django los envía), 'x-accel-redirect'
+# (nginx, con una location internal en MEDIA_SENDFILE_PREFIJO que apunte a MEDIA_ROOT) o 'x-sendfile' (Apache)
+MEDIA_SENDFILE = config('MEDIA_SENDFILE', default='')
+MEDIA_SENDFILE_PREFIJO = config('MEDIA_SENDFILE_PREFIJO', default='/media-protegida/')
+
+# Subida de PDF por fragmentos (reanudable): carpeta local de los fragmentos (compartida si hay varias
+# instancias), bytes por fragmento (hasta DATA_UPLOAD_MAX_MEMORY_SIZE, 2.5MB), tamaño máximo del archivo y horas que se conserva una carga sin usar
+CARGAS_DIRECTORIO = config('CARGAS_DIRECTORIO', default=str(BASE_DIR / 'cargas'))
+CARGAS_TAMANO_FRAGMENTO = config('CARGAS_TAMANO_FRAGMENTO', default=1024 * 1024, cast=int)
+CARGAS_TAMANO_MAXIMO = config('CARGAS_TAMANO_MAXIMO', default=50 * 1024 * 1024, cast=int)
+CARGAS_VIGENCIA_HORAS = config('CARGAS_VIGENCIA_HORAS', default=24, cast=int)
+
+# Miniatura de la primera página (ancho en píxeles) y vista previa de las primeras páginas en baja
+# resolución (páginas y ancho; 0 páginas la desactiva). Con PyMuPDF instalado se renderizan las páginas reales
+MINIATURA_ANCHO = config('MINIATURA_ANCHO', default=200, cast=int)
+VISTA_PREVIA_PAGINAS = config('VISTA_PREVIA_PAGINAS', default=3, cast=int)
+VISTA_PREVIA_ANCHO = config('VISTA_PREVIA_ANCHO', default=500, cast=int)
+
 # Configuración de seguridad para producción
 if not DEBUG:
     # SSL/HTTPS settings
@@ -160,6 +206,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Gemini API Configuration
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
 
+# Reintentos ante errores transitorios de la API (429, 500, 503, timeouts) con espera exponencial
+GEMINI_MAX_REINTENTOS = config('GEMINI_MAX_REINTENTOS', default=3, cast=int)
+GEMINI_ESPERA_REINTENTO = config('GEMINI_ESPERA_REINTENTO', default=2.0, cast=float)  # Segundos antes del primer reintento
+
+# Contenido en caché de Gemini: las instrucciones fijas y la transcripción de cada petición se suben
+# una vez y las llamadas siguientes las referencian (si el SDK no lo soporta, el prompt va en línea)
+GEMINI_CACHE_CONTEXTO = config('GEMINI_CACHE_CONTEXTO', default=True, cast=bool)
+GEMINI_CACHE_TTL = config('GEMINI_CACHE_TTL', default=3600, cast=int)  # Segundos de vida del contenido en caché
+GEMINI_CACHE_TOKENS_MINIMOS = config('GEMINI_CACHE_TOKENS_MINIMOS', default=1024, cast=int)  # Mínimo que acepta la API
+
+# Cola de trabajos IA por urgencia: hilos por proceso, días hábiles que se suman a los trabajos
+# masivos y segundos de espera que equivalen a un día hábil menos (evita que un trabajo espere sin fin)
+COLA_IA_WORKERS = config('COLA_IA_WORKERS', default=2, cast=int)
+COLA_IA_PENALIZACION_MASIVO = config('COLA_IA_PENALIZACION_MASIVO', default=5, cast=int)
+COLA_IA_ENVEJECIMIENTO = config('COLA_IA_ENVEJECIMIENTO', default=120.0, cast=float)
+
+# Segundos tras los cuales un procesamiento IA 'procesando' se da por perdido (p. ej. el proceso se reinició)
+# y otra solicitud puede volver a procesar la petición
+PROCESAMIENTO_IA_BLOQUEO_MAXIMO = config('PROCESAMIENTO_IA_BLOQUEO_MAXIMO', default=900, cast=int)
+
+# Peticiones procesadas a la vez por el reprocesamiento masivo (comando reprocesar_peticiones y acción del admin)
+REPROCESAMIENTO_CONCURRENCIA = config('REPROCESAMIENTO_CONCURRENCIA', default=2, cast=int)
+
+# Descarga en lote de respuestas en Word (ZIP): hilos que generan documentos a la vez y máximo de peticiones por lote
+WORD_LOTE_WORKERS = config('WORD_LOTE_WORKERS', default=4, cast=int)
+WORD_LOTE_MAXIMO = config('WORD_LOTE_MAXIMO', default=200, cast=int)
+
+# Backend de IA: 'gemini' (API real) o 'fake' (sustituto local sin red para pruebas y benchmarks)
+GEMINI_BACKEND = config('GEMINI_BACKEND', default='gemini')
+
+# Parámetros del backend 'fake'
+GEMINI_FAKE_LATENCIA = config('GEMINI_FAKE_LATENCIA', default=0.0, cast=float)  # Segundos por llamada
+GEMINI_FAKE_LATENCIA_FRAGMENTO = config('GEMINI_FAKE_LATENCIA_FRAGMENTO', default=0.0, cast=float)  # Segundos entre fragmentos (stream)
+GEMINI_FAKE_TASA_ERROR = config('GEMINI_FAKE_TASA_ERROR', default=0.0, cast=float)  # Fracción de llamadas con error 500
+GEMINI_FAKE_TASA_429 = config('GEMINI_FAKE_TASA_429', default=0.0, cast=float)  # Fracción de llamadas con cuota agotada
+GEMINI_FAKE_SEMILLA = config('GEMINI_FAKE_SEMILLA', default=0, cast=int)  # Semilla para errores reproducibles
+
+# Presupuesto de tokens de entrada por llamada del asistente de respuestas: si el prompt con
+# la transcripción completa lo supera, se usa un resumen condensado de la petición (se genera una vez)
+ASISTENTE_PRESUPUESTO_TOKENS = config('ASISTENTE_PRESUPUESTO_TOKENS', default=8000, cast=int)
+ASISTENTE_TOKENS_RESUMEN = config('ASISTENTE_TOKENS_RESUMEN', default=1200, cast=int)  # Extensión objetivo del resumen
+
 # Custom User Model
 AUTH_USER_MODEL = 'peticiones.Usuario'
 
@@ -172,6 +260,18 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@municipio.gov.co')
 
+# Bandeja de salida: correos por conexión SMTP, intentos antes de descartar un correo, segundos de espera
+# del primer reintento (se duplica en cada intento) y segundos que un proceso reserva un correo al enviarlo
+CORREO_LOTE = config('CORREO_LOTE', default=50, cast=int)
+CORREO_MAX_INTENTOS = config('CORREO_MAX_INTENTOS', default=6, cast=int)
+CORREO_ESPERA_REINTENTO = config('CORREO_ESPERA_REINTENTO', default=60, cast=int)
+CORREO_BLOQUEO_SEGUNDOS = config('CORREO_BLOQUEO_SEGUNDOS', default=300, cast=int)
+
+# Alertas de vencimiento (comando enviar_alertas_vencimiento): días hábiles de anticipación y URL pública
+# del sistema para los enlaces del correo (vacía: el correo no lleva enlaces)
+ALERTAS_DIAS_ANTICIPACION = config('ALERTAS_DIAS_ANTICIPACION', default=3, cast=int)
+SITIO_URL = config('SITIO_URL', default='')
+
 # Login/Logout URLs
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
@@ -1,7 +1,24 @@
 # peticiones/admin.py
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import Peticion, ProcesamientoIA, RespuestaPeticion, Usuario, Dependencia, DiaNoHabil
+from django.urls import reverse
+from django.utils.html import format_html
+from .models import Peticion, ProcesamientoIA, IntentoProcesamientoIA, LoteReprocesamiento, ItemLoteReprocesamiento, AnalisisAsistente, BorradorRespuesta, RespuestaPeticion, Usuario, Dependencia, DiaNoHabil, CorreoSaliente, AlertaVencimientoEnviada
+
+def iniciar_lote_reprocesamiento(modeladmin, request, peticiones):
+    """Crea un lote con las peticiones y lo ejecuta en segundo plano"""
+    from .services.reprocesamiento_service import crear_lote, ejecutar_lote_en_background
+    
+    filtros = {'origen': 'admin', 'filtros_lista': request.GET.urlencode()}
+    lote = crear_lote(peticiones.exclude(archivo_pdf=''), filtros, usuario=request.user)
+    ejecutar_lote_en_background(lote)
+    
+    url = reverse('admin:peticiones_lotereprocesamiento_change', args=[lote.pk])
+    modeladmin.message_user(request, format_html(
+        'Lote de reprocesamiento <a href="{}">#{}</a> iniciado con {} peticiones. '
+        'Las que no cambiaron desde su último procesamiento se omiten.', url, lote.pk, lote.total
+    ))
+
 
 @admin.register(Peticion)
 class PeticionAdmin(admin.ModelAdmin):
@@ -14,7 +31,10 @@ class PeticionAdmin(admin.ModelAdmin):
         'fecha_radicacion',
         'fecha_vencimiento'
     ]
-    list_filter = ['estado', 'fuente', 'dependencia', 'fecha_radicacion']
+    list_filter = [
+        'estado', 'fuente', 'dependencia', 'fecha_radicacion',
+        'procesamiento_ia__estado_procesamiento', 'procesamiento_ia__modelo_ia_usado'
+    ]
     search_fields = [
         'radicado', 
         'peticionario_nombre', 
@@ -22,6 +42,11 @@ class PeticionAdmin(admin.ModelAdmin):
         'peticionario_correo'
     ]
     readonly_fields = ['radicado', 'fecha_vencimiento', 'fecha_actualizacion']
+    actions = ['reprocesar_con_ia']
+    
+    @admin.action(description='Reprocesar con IA (lote en segundo plano)')
+    def reprocesar_con_ia(self, request, queryset):
+        iniciar_lote_reprocesamiento(self, request, queryset)
     
     fieldsets = (
         ('Información del Radicado', {
@@ -53,8 +78,135 @@ class ProcesamientoIAAdmin(admin.ModelAdmin):
         'fecha_procesamiento',
         'tiempo_procesamiento'
     ]
-    list_filter = ['estado_procesamiento', 'fecha_procesamiento']
-    readonly_fields = ['fecha_procesamiento']
+    list_filter = ['estado_procesamiento', 'fecha_procesamiento', 'modelo_ia_usado', 'version_prompt', 'peticion__dependencia']
+    readonly_fields = ['fecha_procesamiento', 'hash_origen', 'version_prompt']
+    actions = ['reprocesar_con_ia']
+    
+    @admin.action(description='Reprocesar con IA (lote en segundo plano)')
+    def reprocesar_con_ia(self, request, queryset):
+        iniciar_lote_reprocesamiento(self, request, Peticion.objects.filter(procesamiento_ia__in=queryset))
+
+
+@admin.register(IntentoProcesamientoIA)
+class IntentoProcesamientoIAAdmin(admin.ModelAdmin):
+    list_display = [
+        'peticion__radicado',
+        'resultado',
+        'fecha_inicio',
+        'tiempo_total',
+        'tokens_entrada',
+        'tokens_salida',
+        'reintentos',
+        'modelo_ia_usado'
+    ]
+    list_filter = ['resultado', 'modelo_ia_usado', 'fecha_inicio']
+    search_fields = ['peticion__radicado']
+    date_hierarchy = 'fecha_inicio'
+    list_select_related = ['peticion']
+    readonly_fields = [field.name for field in IntentoProcesamientoIA._meta.fields]
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def changelist_view(self, request, extra_context=None):
+        # Resumen p50/p95 por etapa; la gráfica diaria se carga desde la vista JSON
+        from .services.metricas_ia_service import estadisticas_por_etapa
+        
+        estadisticas = estadisticas_por_etapa(dias=30)
+        extra_context = extra_context or {}
+        extra_context['resumen_etapas'] = [
+            {'nombre': nombre, **estadisticas['periodo'][campo]}
+            for campo, nombre in estadisticas['etapas'].items()
+        ]
+        return super().changelist_view(request, extra_context=extra_context)
+
+
+class ItemLoteReprocesamientoInline(admin.TabularInline):
+    model = ItemLoteReprocesamiento
+    fields = ['peticion', 'estado', 'mensaje_error', 'fecha_fin']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LoteReprocesamiento)
+class LoteReprocesamientoAdmin(admin.ModelAdmin):
+    list_display = [
+        'id',
+        'estado',
+        'progreso',
+        'eta',
+        'procesadas',
+        'omitidas',
+        'fallidas',
+        'concurrencia',
+        'creado_por',
+        'fecha_creacion'
+    ]
+    list_filter = ['estado', 'fecha_creacion']
+    readonly_fields = [
+        'filtros', 'estado', 'total', 'procesadas', 'omitidas', 'fallidas', 'progreso', 'eta',
+        'creado_por', 'fecha_creacion', 'fecha_inicio', 'fecha_fin', 'terminadas_al_iniciar'
+    ]
+    inlines = [ItemLoteReprocesamientoInline]
+    actions = ['reanudar']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    @admin.display(description='Progreso')
+    def progreso(self, lote):
+        return f"{lote.terminadas}/{lote.total} ({lote.porcentaje}%)"
+    
+    @admin.display(description='Tiempo restante')
+    def eta(self, lote):
+        segundos = lote.eta_segundos()
+        if segundos is None:
+            return '-'
+        minutos, segundos = divmod(round(segundos), 60)
+        return f"{minutos} min {segundos} s"
+    
+    @admin.action(description='Reanudar lotes interrumpidos')
+    def reanudar(self, request, queryset):
+        from .services.reprocesamiento_service import ejecutar_lote_en_background
+        
+        lotes = queryset.filter(estado='interrumpido')
+        for lote in lotes:
+            ejecutar_lote_en_background(lote)
+        self.message_user(request, f"{len(lotes)} lote(s) reanudado(s)")
+
+
+@admin.register(AnalisisAsistente)
+class AnalisisAsistenteAdmin(admin.ModelAdmin):
+    list_display = [
+        'peticion__radicado',
+        'fecha_generacion',
+        'modelo_ia_usado',
+        'generado_por'
+    ]
+    list_filter = ['fecha_generacion', 'modelo_ia_usado']
+    search_fields = ['peticion__radicado']
+    readonly_fields = ['fecha_generacion', 'hash_transcripcion']
+
+
+@admin.register(BorradorRespuesta)
+class BorradorRespuestaAdmin(admin.ModelAdmin):
+    list_display = [
+        'peticion__radicado',
+        'version',
+        'fecha_creacion',
+        'creado_por',
+        'modelo_ia_usado',
+        'tokens_entrada',
+        'tokens_salida',
+        'tiempo_generacion'
+    ]
+    list_filter = ['fecha_creacion', 'modelo_ia_usado']
+    search_fields = ['peticion__radicado']
+    readonly_fields = ['fecha_creacion']
 
 
 @admin.register(RespuestaPeticion)
@@ -67,6 +219,41 @@ class RespuestaPeticionAdmin(admin.ModelAdmin):
     list_filter = ['fecha_respuesta']
 
 
+@admin.register(CorreoSaliente)
+class CorreoSalienteAdmin(admin.ModelAdmin):
+    list_display = ['asunto', 'destinatarios', 'estado', 'intentos', 'proximo_intento', 'fecha_creacion', 'fecha_envio']
+    list_filter = ['estado', 'fecha_creacion']
+    search_fields = ['asunto', 'destinatarios']
+    # El cuerpo puede llevar contraseñas temporales: no se muestra
+    exclude = ['cuerpo']
+    readonly_fields = [field.name for field in CorreoSaliente._meta.fields if field.name != 'cuerpo']
+    actions = ['reintentar']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    @admin.action(description='Reintentar envío')
+    def reintentar(self, request, queryset):
+        from django.db import transaction
+        from django.utils import timezone
+        from .services.correo_service import remitente_correo
+        
+        reactivados = queryset.filter(estado='error').update(estado='pendiente', intentos=0, proximo_intento=timezone.now())
+        transaction.on_commit(remitente_correo.despertar)
+        self.message_user(request, f'{reactivados} correos vuelven a la bandeja de salida')
+
+
+
+@admin.register(AlertaVencimientoEnviada)
+class AlertaVencimientoEnviadaAdmin(admin.ModelAdmin):
+    list_display = ['peticion', 'usuario', 'tipo', 'dias_habiles_restantes', 'fecha_envio']
+    list_filter = ['tipo', 'fecha_envio']
+    search_fields = ['peticion__radicado', 'usuario__cedula', 'usuario__nombre_completo']
+    readonly_fields = ['usuario', 'peticion', 'tipo', 'dias_habiles_restantes', 'correo', 'fecha_envio']
+    
+    def has_add_permission(self, request):
+        return False
+
 @admin.register(Usuario)
 class UsuarioAdmin(BaseUserAdmin):
     list_display = [
@@ -117,9 +304,10 @@ class DependenciaAdmin(admin.ModelAdmin):
         'nombre_oficina',
         'ciudad',
         'activa',
+        'evaluar_respuestas_ia',
         'fecha_creacion'
     ]
-    list_filter = ['activa', 'ciudad']
+    list_filter = ['activa', 'evaluar_respuestas_ia', 'ciudad']
     search_fields = ['prefijo', 'nombre_oficina', 'ciudad']
     readonly_fields = ['fecha_creacion', 'fecha_actualizacion']
     
@@ -130,6 +318,9 @@ class DependenciaAdmin(admin.ModelAdmin):
         ('Estado', {
             'fields': ('activa',)
         }),
+        ('Asistente IA', {
+            'fields': ('evaluar_respuestas_ia',)
+        }),
         ('Fechas', {
             'fields': ('fecha_creacion', 'fecha_actualizacion')
         }),
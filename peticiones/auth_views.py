@@ -4,15 +4,14 @@ from django.contrib import messages
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
-from django.conf import settings
 from django.http import JsonResponse
 from datetime import timedelta
 from .models import Usuario, Dependencia, DiaNoHabil
 from .services.dias_habiles_service import DiasHabilesService
+from .services.correo_service import encolar_correo
 import logging
 import json
 
@@ -64,20 +63,12 @@ def is_staff_user(user):
 
 def is_jefe_juridica(user):
     """Verifica si el usuario pertenece a la dependencia 111 (Jefe Jurídica) o es el superuser"""
-    if not user.is_authenticated:
-        return False
-    # El superuser 1020458606 tiene acceso completo
-    if user.cedula == '1020458606' and user.is_superuser:
-        return True
-    # O si pertenece a la dependencia 111
-    return user.dependencia and user.dependencia.prefijo == '111'
+    return user.is_authenticated and user.ve_todas_las_peticiones
 
 
 def is_superuser_admin(user):
     """Verifica si el usuario es el superuser con cédula 1020458606"""
-    if not user.is_authenticated:
-        return False
-    return user.cedula == '1020458606' and user.is_superuser
+    return user.is_authenticated and user.es_superusuario_admin
 
 
 @user_passes_test(is_jefe_juridica)
@@ -144,18 +135,13 @@ Puedes acceder al sistema en: {request.build_absolute_uri('/')}
 Saludos,
 Equipo de Sistemas
 """
-                send_mail(
-                    asunto,
-                    mensaje,
-                    settings.DEFAULT_FROM_EMAIL,
-                    [email],
-                    fail_silently=False,
-                )
+                # Se envía en segundo plano: la respuesta no espera al servidor SMTP
+                encolar_correo(asunto, mensaje, [email])
                 
                 messages.success(
                     request,
                     f'Usuario {nombre_completo} registrado exitosamente. '
-                    f'Se ha enviado un correo con las credenciales a {email}'
+                    f'Se enviará un correo con las credenciales a {email}'
                 )
             except Exception as e:
                 logger.error(f"Error enviando correo de bienvenida: {str(e)}")
@@ -274,13 +260,8 @@ El enlace expirará en 24 horas.
 Saludos,
 Equipo de Sistemas
 """
-            send_mail(
-                asunto,
-                mensaje,
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
-            )
+            # Se envía en segundo plano: la respuesta no espera al servidor SMTP
+            encolar_correo(asunto, mensaje, [email])
             
             messages.success(
                 request,
@@ -360,6 +341,7 @@ def crear_dependencia(request):
             prefijo = request.POST.get('prefijo')
             nombre_oficina = request.POST.get('nombre_oficina')
             ciudad = request.POST.get('ciudad', '').strip() or None  # Convertir string vacío a None
+            evaluar_respuestas_ia = request.POST.get('evaluar_respuestas_ia') == 'on'
             
             # Validar que no exista el prefijo
             if Dependencia.objects.filter(prefijo=prefijo).exists():
@@ -370,7 +352,8 @@ def crear_dependencia(request):
             dependencia = Dependencia.objects.create(
                 prefijo=prefijo,
                 nombre_oficina=nombre_oficina,
-                ciudad=ciudad
+                ciudad=ciudad,
+                evaluar_respuestas_ia=evaluar_respuestas_ia
             )
             
             messages.success(
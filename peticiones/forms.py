@@ -1,12 +1,18 @@
 # forms.py
 from django import forms
-from .models import Peticion, Dependencia
+from .models import Peticion, Dependencia, CargaFragmentada
+from .services.validacion_pdf_service import analizar_pdf
 
 
 class PeticionForm(forms.ModelForm):
+    # PDF ya subido por fragmentos (en lugar de archivo_pdf)
+    carga_id = forms.UUIDField(required=False, widget=forms.HiddenInput())
+
     def __init__(self, *args, **kwargs):
         self.user = kwargs.pop('user', None)
+        self.carga = None
         super().__init__(*args, **kwargs)
+        self.fields['archivo_pdf'].required = False
         
         # El campo dependencia siempre está oculto
         # Se asigna automáticamente la dependencia del usuario logueado
@@ -79,8 +85,39 @@ class PeticionForm(forms.ModelForm):
                 raise forms.ValidationError('Solo se permiten archivos PDF.')
             if archivo.size > 10 * 1024 * 1024:  # 10MB máximo
                 raise forms.ValidationError('El archivo no puede ser mayor a 10MB.')
+            # Encabezado y estructura del PDF: un archivo dañado no llega a consumir un radicado
+            self.asignar_metadatos_pdf(analizar_pdf(archivo))
         return archivo
 
+    def asignar_metadatos_pdf(self, metadatos):
+        self.instance.pdf_paginas = metadatos.get('paginas')
+        self.instance.pdf_cifrado = metadatos.get('cifrado', False)
+        self.instance.pdf_escaneado = metadatos.get('escaneado')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        carga_id = cleaned_data.get('carga_id')
+        if carga_id:
+            self.carga = CargaFragmentada.objects.filter(
+                pk=carga_id, usuario=self.user, estado='completada'
+            ).first()
+            if self.carga is None:
+                self.add_error('archivo_pdf', 'La carga del archivo no existe o no ha terminado.')
+            else:
+                # El archivo ya está en el almacenamiento: solo se referencia
+                self.instance.archivo_pdf.name = self.carga.archivo
+                self.asignar_metadatos_pdf(self.carga.metadatos_pdf)
+                cleaned_data['archivo_pdf'] = self.instance.archivo_pdf
+        elif not cleaned_data.get('archivo_pdf') and 'archivo_pdf' not in self.errors:
+            self.add_error('archivo_pdf', 'Este campo es obligatorio.')
+        return cleaned_data
+
+    def save(self, commit=True):
+        peticion = super().save(commit=commit)
+        if self.carga:
+            CargaFragmentada.objects.filter(pk=self.carga.pk).update(estado='usada')
+        return peticion
+
 
 class MarcarRespondidoForm(forms.ModelForm):
     """Formulario para marcar una petición como respondida con archivos adjuntos"""
@@ -0,0 +1,45 @@
+# peticiones/management/commands/enviar_alertas_vencimiento.py
+from datetime import date
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from peticiones.services.alertas_vencimiento_service import enviar_alertas_vencimiento
+
+
+class Command(BaseCommand):
+    help = (
+        'Envía a los responsables de cada dependencia un resumen de sus peticiones por vencer y vencidas. '
+        'Cada alerta se envía una sola vez, así que puede programarse con cron varias veces al día.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None,
+                            help='Días hábiles de anticipación (por defecto ALERTAS_DIAS_ANTICIPACION)')
+        parser.add_argument('--fecha', default=None,
+                            help='Fecha de referencia AAAA-MM-DD (por defecto hoy)')
+        parser.add_argument('--simular', action='store_true',
+                            help='Solo contar las alertas, sin encolar ni enviar correos')
+
+    def handle(self, *args, **options):
+        hoy = None
+        if options['fecha']:
+            try:
+                hoy = date.fromisoformat(options['fecha'])
+            except ValueError:
+                raise CommandError(f"Fecha inválida: {options['fecha']} (use AAAA-MM-DD)")
+
+        inicio = time.monotonic()
+        resumen = enviar_alertas_vencimiento(hoy=hoy, dias=options['dias'], simular=options['simular'])
+        duracion = time.monotonic() - inicio
+
+        self.stdout.write(
+            f"{resumen['peticiones']} peticiones por vencer o vencidas, "
+            f"{resumen['alertas']} alertas nuevas en {resumen['correos']} correos"
+        )
+        if options['simular']:
+            self.stdout.write(self.style.WARNING('Simulación: no se encoló ni envió ningún correo'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"{resumen['enviados']} correos enviados, {resumen['fallidos']} con error ({duracion:.1f}s)"
+            ))
@@ -0,0 +1,34 @@
+# peticiones/management/commands/enviar_correos.py
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from peticiones.models import CorreoSaliente
+from peticiones.services.correo_service import enviar_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        'Envía los correos pendientes de la bandeja de salida (una conexión SMTP por lote). Los procesos web '
+        'ya los envían en segundo plano; sirve para programarlo con cron o vaciar la bandeja tras un reinicio.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reintentar-errores', action='store_true',
+                            help='Volver a poner como pendientes los correos que agotaron sus intentos')
+
+    def handle(self, *args, **options):
+        if options['reintentar_errores']:
+            reactivados = CorreoSaliente.objects.filter(estado='error').update(
+                estado='pendiente', intentos=0, proximo_intento=timezone.now()
+            )
+            self.stdout.write(f'{reactivados} correos con error vuelven a quedar pendientes')
+
+        enviados, fallidos = 0, 0
+        while True:
+            lote_enviados, lote_fallidos = enviar_pendientes()
+            enviados += lote_enviados
+            fallidos += lote_fallidos
+            if not lote_enviados + lote_fallidos:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f'{enviados} correos enviados, {fallidos} con error'))
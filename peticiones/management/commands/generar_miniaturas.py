@@ -0,0 +1,31 @@
+# peticiones/management/commands/generar_miniaturas.py
+from django.core.management.base import BaseCommand
+
+from peticiones.models import Peticion
+from peticiones.services.miniatura_service import generar_miniaturas
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera la miniatura y la vista previa de las peticiones que aún no las tienen (las anteriores a esta '
+        'función o aquellas cuyo procesamiento falló). Cada PDF distinto se renderiza una sola vez.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limite', type=int, help='Máximo de peticiones a revisar')
+
+    def handle(self, *args, **options):
+        peticiones = Peticion.objects.filter(miniatura='').exclude(archivo_pdf='').order_by('-fecha_radicacion')
+        if options['limite']:
+            peticiones = peticiones[:options['limite']]
+
+        generadas, errores = 0, 0
+        for peticion in peticiones.iterator():
+            try:
+                if generar_miniaturas(peticion):
+                    generadas += 1
+            except Exception as e:
+                errores += 1
+                self.stderr.write(f'{peticion.radicado}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'{generadas} peticiones con miniatura, {errores} con error'))
@@ -0,0 +1,84 @@
+# peticiones/management/commands/limpiar_archivos_huerfanos.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from peticiones.services.carga_fragmentada_service import limpiar_cargas_vencidas
+from peticiones.storage import (
+    DireccionadoPorContenido, campos_de_archivo, directorios_gestionados, nombres_referenciados, sha256_de_nombre
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Borra los archivos subidos que ningún registro referencia. Con --migrar, antes pasa al almacenamiento '
+        'configurado los archivos guardados con el nombre original o que siguen en MEDIA_ROOT (un archivo por contenido distinto).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=float, default=24,
+                            help='Solo borrar archivos con más de estas horas (subidas aún sin registro)')
+        parser.add_argument('--migrar', action='store_true',
+                            help='Mover los archivos con nombre original o en MEDIA_ROOT al almacenamiento configurado')
+        parser.add_argument('--simular', action='store_true', help='Solo mostrar qué se haría')
+
+    def handle(self, *args, **options):
+        if options['migrar']:
+            if not isinstance(default_storage, DireccionadoPorContenido):
+                raise CommandError('El almacenamiento configurado no es direccionado por contenido')
+            self.migrar(options['simular'])
+
+        # Las cargas por fragmentos vencidas se borran primero: sus archivos quedan huérfanos
+        if not options['simular']:
+            cargas = limpiar_cargas_vencidas()
+            if cargas:
+                self.stdout.write(f'{cargas} cargas por fragmentos vencidas borradas')
+
+        referenciados = nombres_referenciados()
+        limite = timezone.now() - timedelta(hours=options['horas'])
+        borrados, liberados = 0, 0
+
+        for nombre, tamano, modificado in list(default_storage.listar_archivos(directorios_gestionados())):
+            if nombre in referenciados or modificado > limite:
+                continue
+            borrados += 1
+            liberados += tamano
+            if not options['simular']:
+                default_storage.delete(nombre)
+
+        accion = 'se borrarían' if options['simular'] else 'borrados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{borrados} archivos huérfanos {accion} ({liberados / 1024 / 1024:.1f} MB)'
+        ))
+
+    def migrar(self, simular):
+        # Origen de los archivos que aún no están en el almacenamiento configurado (p. ej. al pasar a objetos)
+        media_root = FileSystemStorage(location=settings.MEDIA_ROOT)
+        migrados = {}
+        for modelo, campo in campos_de_archivo():
+            for pk, nombre in modelo._default_manager.values_list('pk', campo):
+                if not nombre:
+                    continue
+                if nombre not in migrados:
+                    if default_storage.exists(nombre):
+                        origen = None if sha256_de_nombre(nombre) else default_storage
+                    else:
+                        origen = media_root if media_root.exists(nombre) else None
+                    if origen is None:
+                        continue
+                    if simular:
+                        migrados[nombre] = nombre
+                    else:
+                        with origen.open(nombre) as archivo:
+                            migrados[nombre] = default_storage.save(nombre, archivo)
+                if not simular:
+                    modelo._default_manager.filter(pk=pk).update(**{campo: migrados[nombre]})
+
+        distintos = len(set(migrados.values()))
+        self.stdout.write(
+            f'{len(migrados)} archivos con nombre original '
+            + ('por migrar' if simular else f'migrados a {distintos} archivos por contenido')
+        )
@@ -0,0 +1,12 @@
+# peticiones/management/commands/reconstruir_indice_similitud.py
+from django.core.management.base import BaseCommand
+
+from peticiones.services.similitud_service import reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los vectores TF-IDF de las peticiones respondidas (búsqueda de peticiones similares)'
+
+    def handle(self, *args, **options):
+        indexadas = reconstruir_indice()
+        self.stdout.write(self.style.SUCCESS(f'Índice de similitud reconstruido: {indexadas} peticiones respondidas'))
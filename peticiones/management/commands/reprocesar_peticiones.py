@@ -0,0 +1,94 @@
+# peticiones/management/commands/reprocesar_peticiones.py
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from peticiones.models import LoteReprocesamiento
+from peticiones.services.reprocesamiento_service import seleccionar_peticiones, crear_lote, ejecutar_lote
+
+
+def fecha(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f'Fecha inválida: {valor} (use AAAA-MM-DD)')
+
+
+def formatear_duracion(segundos):
+    return str(timedelta(seconds=round(segundos)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Reprocesa con IA las peticiones seleccionadas por estado de procesamiento, fechas, dependencia '
+        'o modelo. Omite las que no cambiaron (mismo PDF y versión de prompts) y permite reanudar un lote interrumpido.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--estado', choices=['exitoso', 'error', 'pendiente', 'procesando', 'sin_procesar'],
+                            help='Estado del último procesamiento IA')
+        parser.add_argument('--desde', type=fecha, help='Fecha de radicación inicial (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=fecha, help='Fecha de radicación final (AAAA-MM-DD)')
+        parser.add_argument('--dependencia', help='Prefijo de la dependencia')
+        parser.add_argument('--modelo', help='Modelo IA con que se procesaron (ej. gemini-1.5-flash)')
+        parser.add_argument('--concurrencia', type=int, help='Peticiones procesadas a la vez')
+        parser.add_argument('--forzar', action='store_true', help='Reprocesar aunque no hayan cambiado')
+        parser.add_argument('--simular', action='store_true', help='Solo mostrar cuántas peticiones se seleccionan')
+        parser.add_argument('--reanudar', type=int, metavar='LOTE', help='Reanudar los pendientes de un lote')
+
+    def handle(self, *args, **options):
+        if options['reanudar']:
+            try:
+                lote = LoteReprocesamiento.objects.get(pk=options['reanudar'])
+            except LoteReprocesamiento.DoesNotExist:
+                raise CommandError(f"No existe el lote {options['reanudar']}")
+            if options['concurrencia']:
+                lote.concurrencia = options['concurrencia']
+                lote.save(update_fields=['concurrencia'])
+            self.stdout.write(f'Reanudando lote #{lote.pk}: {lote.terminadas}/{lote.total} ya terminadas')
+        else:
+            filtros = {
+                clave: str(options[clave])
+                for clave in ('estado', 'desde', 'hasta', 'dependencia', 'modelo')
+                if options[clave]
+            }
+            peticiones = seleccionar_peticiones(
+                estado=options['estado'],
+                desde=options['desde'],
+                hasta=options['hasta'],
+                dependencia=options['dependencia'],
+                modelo=options['modelo'],
+            )
+            if options['simular']:
+                self.stdout.write(f'{peticiones.count()} peticiones seleccionadas (simulación, no se procesó nada)')
+                return
+            if options['concurrencia'] is not None and options['concurrencia'] < 1:
+                raise CommandError('La concurrencia debe ser al menos 1')
+
+            lote = crear_lote(peticiones, filtros, concurrencia=options['concurrencia'], forzar=options['forzar'])
+            self.stdout.write(f'Lote #{lote.pk} creado con {lote.total} peticiones (concurrencia {lote.concurrencia})')
+
+        try:
+            lote = ejecutar_lote(lote, al_avanzar=self.mostrar_progreso)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING(
+                f'\nLote #{lote.pk} interrumpido. Para continuar: manage.py reprocesar_peticiones --reanudar {lote.pk}'
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Lote #{lote.pk} {lote.get_estado_display().lower()}: {lote.procesadas} procesadas, '
+            f'{lote.omitidas} omitidas sin cambios, {lote.fallidas} con error'
+        ))
+        if lote.estado == 'interrumpido':
+            # Ítems que otra solicitud estaba procesando
+            self.stdout.write(self.style.WARNING(
+                f'Quedaron peticiones pendientes. Para reintentarlas: manage.py reprocesar_peticiones --reanudar {lote.pk}'
+            ))
+
+    def mostrar_progreso(self, lote, item):
+        eta = lote.eta_segundos()
+        self.stdout.write(
+            f'[{lote.terminadas}/{lote.total} {lote.porcentaje}%] {item.peticion.radicado}: '
+            f'{item.get_estado_display()}' + (f' - ETA {formatear_duracion(eta)}' if eta is not None else '')
+        )
@@ -0,0 +1,231 @@
+# peticiones/media_views.py
+"""
+Descarga de los archivos subidos (MEDIA_ROOT): PDF de las peticiones,
+respuestas firmadas y constancias de envío.
+
+Solo los sirve a quien puede ver la petición a la que pertenecen, con
+ETag/Last-Modified (respuestas 304), Cache-Control privado (de un año e
+``immutable`` para los nombres direccionados por contenido, como las
+miniaturas) y rangos de bytes para que los visores de PDF puedan saltar de
+página sin descargar todo el archivo. Si hay un proxy al frente (MEDIA_SENDFILE), Django solo valida el
+permiso y le delega la transferencia con X-Accel-Redirect (nginx) o
+X-Sendfile (Apache). Con almacenamiento de objetos, después de validar el
+permiso redirige a una URL firmada.
+"""
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseRedirect, StreamingHttpResponse, FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from urllib.parse import quote
+from .models import Peticion, RespuestaPeticion
+from .storage import AlmacenamientoObjetos, ClienteObjetosLocal, sha256_de_nombre
+import mimetypes
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+TAMANO_BLOQUE = 64 * 1024
+
+
+# Campos que pueden guardar un archivo con cada prefijo (el upload_to de cada
+# FileField; 'respuestas' es RespuestaPeticion.archivo_respuesta). Los nombres
+# direccionados por contenido (contenido/...) no dicen de qué campo son y el
+# mismo archivo puede estar en varios: se buscan en todos.
+CAMPOS_POR_PREFIJO = {
+    'peticiones/': ['archivo_pdf'],
+    'miniaturas/': ['miniatura', 'vista_previa'],
+    'respuestas_firmadas/': ['archivo_respuesta_firmada'],
+    'constancias_envio/': ['archivo_constancia_envio'],
+    'respuestas/': ['respuestas'],
+}
+CAMPOS_ARCHIVO = [
+    'archivo_pdf', 'archivo_respuesta_firmada', 'archivo_constancia_envio', 'miniatura', 'vista_previa', 'respuestas'
+]
+
+
+def condicion_archivo(campo, nombre):
+    if campo == 'respuestas':
+        # Subconsulta en lugar de join: también usa el índice de archivo_respuesta
+        return Q(pk__in=RespuestaPeticion.objects.filter(archivo_respuesta=nombre).values('peticion_id'))
+    return Q(**{campo: nombre})
+
+
+def peticion_del_archivo(nombre, user):
+    """
+    Petición visible para el usuario a la que pertenece el archivo (nombre
+    relativo a MEDIA_ROOT), o None. Las columnas de archivo están indexadas:
+    es una búsqueda por índice en cada columna posible, no un recorrido de la
+    tabla.
+    """
+    prefijo = nombre.split('/', 1)[0] + '/'
+    filtro = Q()
+    for campo in CAMPOS_POR_PREFIJO.get(prefijo, CAMPOS_ARCHIVO):
+        filtro |= condicion_archivo(campo, nombre)
+    return Peticion.objects.visible_para(user).filter(filtro).first()
+
+
+def calcular_rango(encabezado, tamano):
+    """
+    (inicio, fin) inclusivos del encabezado Range, None si no aplica (ausente,
+    mal formado o con varios rangos: se envía el archivo completo) o False si
+    no se puede satisfacer
+    """
+    coincidencia = RANGO.match(encabezado.strip()) if encabezado else None
+    if not coincidencia or coincidencia.groups() == ('', ''):
+        return None
+
+    inicio, fin = coincidencia.groups()
+    if inicio == '':
+        # Los últimos N bytes
+        sufijo = int(fin)
+        if sufijo == 0:
+            return False
+        return max(tamano - sufijo, 0), tamano - 1
+
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+def leer_rango(ruta, inicio, fin):
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        restante = fin - inicio + 1
+        while restante > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, restante))
+            if not bloque:
+                break
+            restante -= len(bloque)
+            yield bloque
+
+
+def validadores(response, etag, last_modified, inmutable=False):
+    """ETag, Last-Modified y Cache-Control de un archivo servido"""
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Privado: el archivo depende de los permisos del usuario
+    if inmutable:
+        # El nombre lleva el hash del contenido: si el archivo cambia, cambia la URL
+        patch_cache_control(response, private=True, max_age=settings.MEDIA_CACHE_INMUTABLE_SEGUNDOS, immutable=True)
+    else:
+        patch_cache_control(response, private=True, max_age=settings.MEDIA_CACHE_SEGUNDOS)
+    return response
+
+
+def respuesta_sendfile(nombre, ruta):
+    """Respuesta vacía que le indica al proxy qué archivo enviar"""
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_PREFIJO + quote(nombre)
+    else:
+        response['X-Sendfile'] = ruta
+    # El tipo lo decide el proxy a partir del archivo
+    del response['Content-Type']
+    return response
+
+
+def respuesta_archivo(request, ruta, nombre, sendfile=False):
+    """
+    Respuesta para un archivo en disco: 304/412 según ETag y Last-Modified,
+    206 para un rango de bytes o el archivo completo; con ``sendfile`` el
+    envío queda a cargo del proxy
+    """
+    estado = os.stat(ruta)
+    # Con almacenamiento por contenido el hash del nombre identifica el archivo aunque se vuelva a copiar
+    sha256 = sha256_de_nombre(nombre)
+    etag = f'"{sha256}"' if sha256 else f'"{estado.st_mtime_ns:x}-{estado.st_size:x}"'
+    last_modified = int(estado.st_mtime)
+
+    # 304 (o 412) antes de abrir el archivo
+    validacion = validadores(HttpResponse(), etag, last_modified, inmutable=bool(sha256))
+    condicional = get_conditional_response(request, etag=etag, last_modified=last_modified, response=validacion)
+    if condicional is not validacion:
+        return condicional
+
+    if sendfile:
+        # El proxy maneja rangos y validaciones condicionales
+        response = respuesta_sendfile(nombre, ruta)
+    else:
+        rango = calcular_rango(request.headers.get('Range'), estado.st_size)
+
+        # If-Range: el rango solo vale si el archivo no cambió desde que el cliente tiene la primera parte
+        if_range = request.headers.get('If-Range')
+        if rango and if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+            rango = None
+
+        if rango is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{estado.st_size}'
+        elif rango:
+            inicio, fin = rango
+            response = StreamingHttpResponse(leer_rango(ruta, inicio, fin), status=206)
+            response['Content-Range'] = f'bytes {inicio}-{fin}/{estado.st_size}'
+            response['Content-Length'] = fin - inicio + 1
+        else:
+            response = FileResponse(open(ruta, 'rb'))
+
+        if not isinstance(response, FileResponse):
+            response['Content-Type'] = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+        response['Accept-Ranges'] = 'bytes'
+
+    return validadores(response, etag, last_modified, inmutable=bool(sha256))
+
+
+@login_required
+def servir_media(request, path):
+    """
+    Sirve un archivo subido si el usuario puede ver su petición: desde
+    MEDIA_ROOT, o redirigiendo a una URL firmada del almacenamiento de objetos
+    """
+    if peticion_del_archivo(path, request.user) is None:
+        # Igual que un archivo inexistente, para no revelar qué archivos hay
+        logger.warning(f"Acceso denegado a {path} para {request.user.cedula}")
+        raise Http404("Archivo no encontrado")
+
+    if isinstance(default_storage, AlmacenamientoObjetos):
+        if not default_storage.exists(path):
+            raise Http404("Archivo no encontrado")
+        response = HttpResponseRedirect(default_storage.url_firmada(path))
+        # La URL firmada vence: la redirección no se guarda
+        patch_cache_control(response, private=True, no_store=True)
+        return response
+
+    try:
+        ruta = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Archivo no encontrado")
+    if not os.path.isfile(ruta):
+        raise Http404("Archivo no encontrado")
+
+    return respuesta_archivo(request, ruta, path, sendfile=bool(settings.MEDIA_SENDFILE))
+
+
+def servir_objeto_local(request, bucket, clave):
+    """
+    Descarga por URL firmada del sustituto local de S3 (OBJETOS_CLIENTE='local');
+    la firma reemplaza la sesión, como en S3
+    """
+    if settings.OBJETOS_CLIENTE != 'local' or bucket != settings.OBJETOS_BUCKET:
+        raise Http404("Archivo no encontrado")
+    if not ClienteObjetosLocal.firma_valida(bucket, clave, request.GET.get('expira'), request.GET.get('firma')):
+        return HttpResponseForbidden('URL firmada inválida o vencida')
+
+    cliente = ClienteObjetosLocal(bucket)
+    try:
+        existe = cliente.existe(clave)
+    except SuspiciousFileOperation:
+        existe = False
+    if not existe:
+        raise Http404("Archivo no encontrado")
+
+    return respuesta_archivo(request, cliente.ruta(clave), clave)
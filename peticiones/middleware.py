@@ -1,28 +1,87 @@
 # peticiones/middleware.py
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.urls import resolve
+from whitenoise.middleware import WhiteNoiseMiddleware
 
 
 class AdminAccessMiddleware:
     """
     Middleware que restringe el acceso al admin de Django
     solo al superuser con cédula 1020458606
+    
+    Funciona tanto en WSGI como en ASGI: en modo asíncrono no obliga a Django
+    a pasar cada petición por un hilo.
     """
+    sync_capable = True
+    async_capable = True
     
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
     
-    def __call__(self, request):
+    def rechazar_admin(self, request, user):
+        """Retorna la redirección si el usuario no puede entrar al admin"""
         # Verificar si la ruta es del admin
         if request.path.startswith('/admin/'):
             # Si el usuario está autenticado
-            if request.user.is_authenticated:
+            if user.is_authenticated:
                 # Verificar si es el superuser autorizado
-                if not (request.user.cedula == '1020458606' and request.user.is_superuser):
+                if not user.es_superusuario_admin:
                     messages.error(request, 'No tienes permisos para acceder al panel de administración de Django')
                     return redirect('index')
             # Si no está autenticado, Django redirigirá al login del admin
+        return None
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        rechazo = self.rechazar_admin(request, request.user)
+        if rechazo:
+            return rechazo
         
         response = self.get_response(request)
         return response
+    
+    async def __acall__(self, request):
+        if request.path.startswith('/admin/'):
+            rechazo = self.rechazar_admin(request, await request.auser())
+            if rechazo:
+                return rechazo
+        
+        return await self.get_response(request)
+
+
+class WhiteNoiseAsyncMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware compatible con ASGI.
+    
+    WhiteNoise 6.6 solo es síncrono; en una cadena ASGI eso obliga a Django a
+    ejecutar las vistas asíncronas dentro de un hilo. Esta variante delega en
+    WhiteNoise para los archivos estáticos y deja pasar el resto sin cambiar
+    de contexto.
+    """
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+    
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0003_dianohabil_peticion_dependencia_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntentoProcesamientoIA',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_inicio', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('tiempo_total', models.FloatField(help_text='Tiempo en segundos')),
+                ('tiempo_lectura_pdf', models.FloatField(blank=True, null=True)),
+                ('tiempo_extraccion_texto', models.FloatField(blank=True, null=True)),
+                ('tiempo_transcripcion', models.FloatField(blank=True, null=True)),
+                ('tiempo_extraccion_datos', models.FloatField(blank=True, null=True)),
+                ('tiempo_guardado', models.FloatField(blank=True, null=True)),
+                ('tokens_entrada', models.PositiveIntegerField(default=0)),
+                ('tokens_salida', models.PositiveIntegerField(default=0)),
+                ('modelo_ia_usado', models.CharField(max_length=50)),
+                ('reintentos', models.PositiveIntegerField(default=0, help_text='Reintentos por errores transitorios de la API')),
+                ('resultado', models.CharField(choices=[('exitoso', 'Exitoso'), ('error', 'Error')], max_length=20)),
+                ('mensaje_error', models.TextField(blank=True, null=True)),
+                ('peticion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='intentos_procesamiento', to='peticiones.peticion')),
+            ],
+            options={
+                'verbose_name': 'Intento de Procesamiento IA',
+                'verbose_name_plural': 'Intentos de Procesamiento IA',
+                'ordering': ['-fecha_inicio'],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0004_intentoprocesamientoia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalisisAsistente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash_transcripcion', models.CharField(help_text='SHA-256 de la transcripción analizada', max_length=64)),
+                ('analisis', models.JSONField()),
+                ('modelo_ia_usado', models.CharField(max_length=50)),
+                ('fecha_generacion', models.DateTimeField(auto_now_add=True)),
+                ('generado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='analisis_asistente_generados', to=settings.AUTH_USER_MODEL)),
+                ('peticion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analisis_asistente', to='peticiones.peticion')),
+            ],
+            options={
+                'verbose_name': 'Análisis del Asistente IA',
+                'verbose_name_plural': 'Análisis del Asistente IA',
+                'ordering': ['-fecha_generacion'],
+                'constraints': [models.UniqueConstraint(fields=('peticion', 'hash_transcripcion'), name='analisis_unico_por_transcripcion')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0005_analisisasistente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorradorRespuesta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('contenido', models.TextField()),
+                ('respuestas_usuario', models.JSONField(default=list, help_text='Preguntas y respuestas del funcionario usadas en el prompt')),
+                ('evaluacion', models.JSONField(blank=True, null=True)),
+                ('modelo_ia_usado', models.CharField(max_length=50)),
+                ('tokens_entrada', models.PositiveIntegerField(default=0)),
+                ('tokens_salida', models.PositiveIntegerField(default=0)),
+                ('tiempo_generacion', models.FloatField(help_text='Tiempo en segundos')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='borradores_respuesta', to=settings.AUTH_USER_MODEL)),
+                ('peticion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='borradores', to='peticiones.peticion')),
+            ],
+            options={
+                'verbose_name': 'Borrador de Respuesta',
+                'verbose_name_plural': 'Borradores de Respuesta',
+                'ordering': ['-version'],
+                'constraints': [models.UniqueConstraint(fields=('peticion', 'version'), name='version_unica_por_peticion')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0006_borradorrespuesta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borradorrespuesta',
+            name='estado_evaluacion',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completada', 'Completada'), ('error', 'Error'), ('desactivada', 'Desactivada')], default='pendiente', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='dependencia',
+            name='evaluar_respuestas_ia',
+            field=models.BooleanField(default=True, help_text='Evalúa en segundo plano la calidad de las respuestas generadas por el asistente', verbose_name='Evaluar Respuestas IA'),
+        ),
+    ]
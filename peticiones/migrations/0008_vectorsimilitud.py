@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0007_evaluacion_respuestas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VectorSimilitud',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('terminos', models.JSONField(default=dict, help_text='Término -> frecuencia en la transcripción')),
+                ('activo', models.BooleanField(default=True)),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, db_index=True)),
+                ('peticion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='vector_similitud', to='peticiones.peticion')),
+            ],
+            options={
+                'verbose_name': 'Vector de Similitud',
+                'verbose_name_plural': 'Vectores de Similitud',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0008_vectorsimilitud'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='peticion',
+            name='hash_resumen',
+            field=models.CharField(blank=True, help_text='SHA-256 de la transcripción resumida', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='peticion',
+            name='resumen_condensado',
+            field=models.TextField(blank=True, help_text='Resumen condensado de la transcripción generado por IA'),
+        ),
+    ]
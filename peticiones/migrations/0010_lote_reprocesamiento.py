@@ -0,0 +1,66 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0009_resumen_condensado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='procesamientoia',
+            name='hash_origen',
+            field=models.CharField(blank=True, help_text='SHA-256 del PDF procesado', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='procesamientoia',
+            name='version_prompt',
+            field=models.CharField(blank=True, help_text='Versión de los prompts de transcripción', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='LoteReprocesamiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filtros', models.JSONField(blank=True, default=dict, help_text='Criterios con que se seleccionaron las peticiones')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('interrumpido', 'Interrumpido'), ('completado', 'Completado')], default='pendiente', max_length=20)),
+                ('concurrencia', models.PositiveIntegerField(default=2)),
+                ('forzar', models.BooleanField(default=False, help_text='Reprocesar aunque el PDF y la versión de prompts no hayan cambiado')),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('procesadas', models.PositiveIntegerField(default=0)),
+                ('omitidas', models.PositiveIntegerField(default=0)),
+                ('fallidas', models.PositiveIntegerField(default=0)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_inicio', models.DateTimeField(blank=True, help_text='Inicio de la ejecución actual', null=True)),
+                ('terminadas_al_iniciar', models.PositiveIntegerField(default=0, help_text='Ítems ya terminados al iniciar la ejecución actual')),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lotes_reprocesamiento', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Lote de Reprocesamiento IA',
+                'verbose_name_plural': 'Lotes de Reprocesamiento IA',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemLoteReprocesamiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('exitoso', 'Exitoso'), ('omitido', 'Omitido (sin cambios)'), ('error', 'Error')], db_index=True, default='pendiente', max_length=20)),
+                ('mensaje_error', models.TextField(blank=True, null=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('peticion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items_reprocesamiento', to='peticiones.peticion')),
+                ('lote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='peticiones.lotereprocesamiento')),
+            ],
+            options={
+                'verbose_name': 'Petición de Lote de Reprocesamiento',
+                'verbose_name_plural': 'Peticiones de Lote de Reprocesamiento',
+                'ordering': ['id'],
+                'unique_together': {('lote', 'peticion')},
+            },
+        ),
+    ]
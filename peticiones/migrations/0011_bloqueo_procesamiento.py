@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0010_lote_reprocesamiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='procesamientoia',
+            name='clave_idempotencia',
+            field=models.CharField(blank=True, help_text='Clave de la solicitud que inició el último procesamiento', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='procesamientoia',
+            name='inicio_proceso',
+            field=models.DateTimeField(blank=True, help_text='Inicio del último procesamiento', null=True),
+        ),
+        migrations.AlterField(
+            model_name='procesamientoia',
+            name='estado_procesamiento',
+            field=models.CharField(choices=[('exitoso', 'Exitoso'), ('error', 'Error'), ('pendiente', 'Pendiente'), ('procesando', 'Procesando')], default='pendiente', max_length=20),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0011_bloqueo_procesamiento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='procesamientoia',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
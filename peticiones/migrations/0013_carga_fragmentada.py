@@ -0,0 +1,35 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0012_procesamiento_fecha_actualizacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CargaFragmentada',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('tamano', models.PositiveBigIntegerField(help_text='Tamaño total en bytes')),
+                ('tamano_fragmento', models.PositiveIntegerField()),
+                ('sha256', models.CharField(blank=True, help_text='SHA-256 esperado del archivo completo (opcional)', max_length=64)),
+                ('estado', models.CharField(choices=[('en_curso', 'En curso'), ('completada', 'Completada'), ('usada', 'Usada')], default='en_curso', max_length=20)),
+                ('archivo', models.CharField(blank=True, help_text='Nombre del archivo armado en el almacenamiento', max_length=255)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cargas_fragmentadas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Carga Fragmentada',
+                'verbose_name_plural': 'Cargas Fragmentadas',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+    ]
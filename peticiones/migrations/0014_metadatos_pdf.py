@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0013_carga_fragmentada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cargafragmentada',
+            name='metadatos_pdf',
+            field=models.JSONField(blank=True, default=dict, help_text='Páginas, cifrado y escaneado del PDF armado'),
+        ),
+        migrations.AddField(
+            model_name='peticion',
+            name='pdf_cifrado',
+            field=models.BooleanField(default=False, help_text='El PDF está cifrado (se abre sin contraseña)'),
+        ),
+        migrations.AddField(
+            model_name='peticion',
+            name='pdf_escaneado',
+            field=models.BooleanField(blank=True, help_text='El PDF solo tiene imágenes, sin texto extraíble', null=True),
+        ),
+        migrations.AddField(
+            model_name='peticion',
+            name='pdf_paginas',
+            field=models.PositiveIntegerField(blank=True, help_text='Número de páginas del PDF', null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0014_metadatos_pdf'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='peticion',
+            name='miniatura',
+            field=models.FileField(blank=True, help_text='Miniatura PNG de la primera página', upload_to='miniaturas/'),
+        ),
+        migrations.AddField(
+            model_name='peticion',
+            name='vista_previa',
+            field=models.FileField(blank=True, help_text='Primeras páginas en baja resolución (JPEG)', upload_to='miniaturas/'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0016_correo_saliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertaVencimientoEnviada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('por_vencer', 'Por vencer'), ('vencida', 'Vencida')], max_length=20)),
+                ('dias_habiles_restantes', models.IntegerField()),
+                ('fecha_envio', models.DateTimeField(auto_now_add=True)),
+                ('correo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alertas', to='peticiones.correosaliente')),
+                ('peticion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas_vencimiento', to='peticiones.peticion')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertas_vencimiento', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Alerta de Vencimiento Enviada',
+                'verbose_name_plural': 'Alertas de Vencimiento Enviadas',
+                'ordering': ['-fecha_envio'],
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'peticion', 'tipo'), name='alerta_vencimiento_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('peticiones', '0017_alertas_vencimiento'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='peticion',
+            name='archivo_constancia_envio',
+            field=models.FileField(blank=True, db_index=True, help_text='Constancia de envío', null=True, upload_to='constancias_envio/'),
+        ),
+        migrations.AlterField(
+            model_name='peticion',
+            name='archivo_pdf',
+            field=models.FileField(db_index=True, help_text='Archivo PDF del derecho de petición', upload_to='peticiones/'),
+        ),
+        migrations.AlterField(
+            model_name='peticion',
+            name='archivo_respuesta_firmada',
+            field=models.FileField(blank=True, db_index=True, help_text='Respuesta firmada', null=True, upload_to='respuestas_firmadas/'),
+        ),
+        migrations.AlterField(
+            model_name='peticion',
+            name='miniatura',
+            field=models.FileField(blank=True, db_index=True, help_text='Miniatura PNG de la primera página', upload_to='miniaturas/'),
+        ),
+        migrations.AlterField(
+            model_name='peticion',
+            name='vista_previa',
+            field=models.FileField(blank=True, db_index=True, help_text='Primeras páginas en baja resolución (JPEG)', upload_to='miniaturas/'),
+        ),
+        migrations.AlterField(
+            model_name='respuestapeticion',
+            name='archivo_respuesta',
+            field=models.FileField(blank=True, db_index=True, null=True, upload_to='respuestas/'),
+        ),
+    ]
@@ -2,8 +2,15 @@
 from django.db import models
 from django.utils import timezone
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.utils.functional import cached_property
 import secrets
 import string
+import uuid
+
+
+# Oficina Jurídica y superuser con acceso a todas las peticiones
+PREFIJO_JURIDICA = '111'
+CEDULA_SUPERUSUARIO = '1020458606'
 
 
 # ========================================
@@ -36,6 +43,11 @@ class Dependencia(models.Model):
         default=True,
         verbose_name="Dependencia Activa"
     )
+    evaluar_respuestas_ia = models.BooleanField(
+        default=True,
+        verbose_name="Evaluar Respuestas IA",
+        help_text="Evalúa en segundo plano la calidad de las respuestas generadas por el asistente"
+    )
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_actualizacion = models.DateTimeField(auto_now=True)
     
@@ -170,6 +182,20 @@ class Usuario(AbstractBaseUser, PermissionsMixin):
     
     def get_short_name(self):
         return self.nombre_completo.split()[0] if self.nombre_completo else self.cedula
+    
+    @property
+    def es_superusuario_admin(self):
+        """El superuser con cédula 1020458606 (único con acceso al admin de Django)"""
+        return self.cedula == CEDULA_SUPERUSUARIO and self.is_superuser
+    
+    @cached_property
+    def ve_todas_las_peticiones(self):
+        """
+        Oficina Jurídica (prefijo 111) o el superuser: ven todas las peticiones.
+        Se calcula una vez por instancia, es decir una vez por request, y sin
+        consultas: el prefijo es la llave primaria de Dependencia.
+        """
+        return self.es_superusuario_admin or self.dependencia_id == PREFIJO_JURIDICA
 
 
 # ========================================
@@ -215,6 +241,19 @@ class DiaNoHabil(models.Model):
 # MODELOS DE PETICIONES
 # ========================================
 
+class PeticionQuerySet(models.QuerySet):
+    
+    def visible_para(self, user):
+        """
+        Peticiones que el usuario puede ver, filtradas en la misma consulta:
+        todas para la Oficina Jurídica y el superuser, las de su dependencia
+        para los demás
+        """
+        if user.ve_todas_las_peticiones:
+            return self
+        return self.filter(dependencia_id=user.dependencia_id)
+
+
 class Peticion(models.Model):
     ESTADO_CHOICES = [
         ('sin_responder', 'Sin Responder'),
@@ -227,6 +266,8 @@ class Peticion(models.Model):
         ('presencial', 'Presencial'),
     ]
     
+    objects = PeticionQuerySet.as_manager()
+    
     # Radicado único con formato dpetaaaammddxxxxx
     radicado = models.CharField(max_length=20, unique=True, editable=False)
     
@@ -262,18 +303,32 @@ class Peticion(models.Model):
     peticionario_direccion = models.TextField(blank=True, null=True)
     
     # Archivo PDF cargado
-    archivo_pdf = models.FileField(upload_to='peticiones/', help_text="Archivo PDF del derecho de petición")
+    # Los archivos se indexan: servir_media y la limpieza de huérfanos buscan la petición por nombre de archivo
+    archivo_pdf = models.FileField(upload_to='peticiones/', db_index=True, help_text="Archivo PDF del derecho de petición")
+    
+    # Metadatos del PDF, tomados al validarlo en la subida (None en peticiones anteriores)
+    pdf_paginas = models.PositiveIntegerField(null=True, blank=True, help_text="Número de páginas del PDF")
+    pdf_cifrado = models.BooleanField(default=False, help_text="El PDF está cifrado (se abre sin contraseña)")
+    pdf_escaneado = models.BooleanField(null=True, blank=True, help_text="El PDF solo tiene imágenes, sin texto extraíble")
+    
+    # Miniatura de la primera página y vista previa de baja resolución (se generan en segundo plano)
+    miniatura = models.FileField(upload_to='miniaturas/', blank=True, db_index=True, help_text="Miniatura PNG de la primera página")
+    vista_previa = models.FileField(upload_to='miniaturas/', blank=True, db_index=True, help_text="Primeras páginas en baja resolución (JPEG)")
     
     # Transcripción completa extraída por Gemini
     transcripcion_completa = models.TextField(blank=True, help_text="Transcripción completa del documento extraída por IA")
     
+    # Resumen condensado para prompts de peticiones extensas (válido mientras coincida el hash de la transcripción)
+    resumen_condensado = models.TextField(blank=True, help_text="Resumen condensado de la transcripción generado por IA")
+    hash_resumen = models.CharField(max_length=64, blank=True, help_text="SHA-256 de la transcripción resumida")
+    
     # Estado y fuente
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='sin_responder')
     fuente = models.CharField(max_length=20, choices=FUENTE_CHOICES)
     
     # Archivos adjuntos al marcar como respondido
-    archivo_respuesta_firmada = models.FileField(upload_to='respuestas_firmadas/', blank=True, null=True, help_text="Respuesta firmada")
-    archivo_constancia_envio = models.FileField(upload_to='constancias_envio/', blank=True, null=True, help_text="Constancia de envío")
+    archivo_respuesta_firmada = models.FileField(upload_to='respuestas_firmadas/', blank=True, null=True, db_index=True, help_text="Respuesta firmada")
+    archivo_constancia_envio = models.FileField(upload_to='constancias_envio/', blank=True, null=True, db_index=True, help_text="Constancia de envío")
     fecha_respuesta = models.DateTimeField(blank=True, null=True, help_text="Fecha en que se marcó como respondido")
     
     # Fecha de actualización automática
@@ -337,19 +392,258 @@ class ProcesamientoIA(models.Model):
     """
     peticion = models.OneToOneField(Peticion, on_delete=models.CASCADE, related_name='procesamiento_ia')
     fecha_procesamiento = models.DateTimeField(auto_now_add=True)
+    # Último cambio de estado; es el Last-Modified del endpoint de estado
+    fecha_actualizacion = models.DateTimeField(auto_now=True)
     tiempo_procesamiento = models.FloatField(help_text="Tiempo en segundos")
     modelo_ia_usado = models.CharField(max_length=50, default="gemini-1.5-flash")
     estado_procesamiento = models.CharField(max_length=20, choices=[
         ('exitoso', 'Exitoso'),
         ('error', 'Error'),
-        ('pendiente', 'Pendiente')
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'Procesando')
     ], default='pendiente')
     mensaje_error = models.TextField(blank=True, null=True)
     
+    # Bloqueo del procesamiento en curso: mientras el estado es 'procesando' (y
+    # no ha vencido) ninguna otra solicitud puede iniciar otro para la petición
+    clave_idempotencia = models.CharField(max_length=64, blank=True, help_text="Clave de la solicitud que inició el último procesamiento")
+    inicio_proceso = models.DateTimeField(blank=True, null=True, help_text="Inicio del último procesamiento")
+    
+    # Con qué se hizo el último procesamiento exitoso: si el PDF y la versión de
+    # los prompts no cambian, el reprocesamiento masivo lo omite
+    hash_origen = models.CharField(max_length=64, blank=True, help_text="SHA-256 del PDF procesado")
+    version_prompt = models.CharField(max_length=20, blank=True, help_text="Versión de los prompts de transcripción")
+    
     def __str__(self):
         return f"Procesamiento IA - {self.peticion.radicado}"
 
 
+class IntentoProcesamientoIA(models.Model):
+    """
+    Historial de cada intento de procesamiento con IA de una petición,
+    con la duración de cada etapa del pipeline
+    """
+    RESULTADO_CHOICES = [
+        ('exitoso', 'Exitoso'),
+        ('error', 'Error'),
+    ]
+
+    # Etapas del pipeline en orden de ejecución: (campo, nombre para mostrar)
+    ETAPAS = [
+        ('tiempo_lectura_pdf', 'Lectura PDF'),
+        ('tiempo_extraccion_texto', 'Extracción de texto'),
+        ('tiempo_transcripcion', 'Transcripción IA'),
+        ('tiempo_extraccion_datos', 'Extracción de datos'),
+        ('tiempo_guardado', 'Guardado en BD'),
+    ]
+
+    peticion = models.ForeignKey(Peticion, on_delete=models.CASCADE, related_name='intentos_procesamiento')
+    fecha_inicio = models.DateTimeField(auto_now_add=True, db_index=True)
+    tiempo_total = models.FloatField(help_text="Tiempo en segundos")
+
+    # Duración de cada etapa en segundos (nulo si la etapa no llegó a ejecutarse)
+    tiempo_lectura_pdf = models.FloatField(blank=True, null=True)
+    tiempo_extraccion_texto = models.FloatField(blank=True, null=True)
+    tiempo_transcripcion = models.FloatField(blank=True, null=True)
+    tiempo_extraccion_datos = models.FloatField(blank=True, null=True)
+    tiempo_guardado = models.FloatField(blank=True, null=True)
+
+    tokens_entrada = models.PositiveIntegerField(default=0)
+    tokens_salida = models.PositiveIntegerField(default=0)
+    modelo_ia_usado = models.CharField(max_length=50)
+    reintentos = models.PositiveIntegerField(default=0, help_text="Reintentos por errores transitorios de la API")
+    resultado = models.CharField(max_length=20, choices=RESULTADO_CHOICES)
+    mensaje_error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Intento de Procesamiento IA"
+        verbose_name_plural = "Intentos de Procesamiento IA"
+        ordering = ['-fecha_inicio']
+
+    def __str__(self):
+        return f"Intento IA - {self.peticion.radicado} ({self.fecha_inicio:%d/%m/%Y %H:%M})"
+
+
+class LoteReprocesamiento(models.Model):
+    """
+    Reprocesamiento con IA de un conjunto de peticiones. Cada petición queda
+    como un ItemLoteReprocesamiento, así que un lote interrumpido se reanuda
+    procesando solo los ítems pendientes.
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('interrumpido', 'Interrumpido'),
+        ('completado', 'Completado'),
+    ]
+
+    filtros = models.JSONField(default=dict, blank=True, help_text="Criterios con que se seleccionaron las peticiones")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    concurrencia = models.PositiveIntegerField(default=2)
+    forzar = models.BooleanField(default=False, help_text="Reprocesar aunque el PDF y la versión de prompts no hayan cambiado")
+    total = models.PositiveIntegerField(default=0)
+    procesadas = models.PositiveIntegerField(default=0)
+    omitidas = models.PositiveIntegerField(default=0)
+    fallidas = models.PositiveIntegerField(default=0)
+    creado_por = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='lotes_reprocesamiento'
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_inicio = models.DateTimeField(blank=True, null=True, help_text="Inicio de la ejecución actual")
+    terminadas_al_iniciar = models.PositiveIntegerField(default=0, help_text="Ítems ya terminados al iniciar la ejecución actual")
+    fecha_fin = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Lote de Reprocesamiento IA"
+        verbose_name_plural = "Lotes de Reprocesamiento IA"
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"Lote de reprocesamiento #{self.pk} ({self.terminadas}/{self.total})"
+
+    @property
+    def terminadas(self):
+        return self.procesadas + self.omitidas + self.fallidas
+
+    @property
+    def porcentaje(self):
+        return round(100 * self.terminadas / self.total) if self.total else 100
+
+    def eta_segundos(self):
+        """
+        Segundos estimados para terminar, según el ritmo de la ejecución actual
+        (None si aún no hay con qué estimar)
+        """
+        hechas = self.terminadas - self.terminadas_al_iniciar
+        if self.estado != 'en_proceso' or not self.fecha_inicio or hechas <= 0:
+            return None
+        transcurrido = (timezone.now() - self.fecha_inicio).total_seconds()
+        return transcurrido / hechas * (self.total - self.terminadas)
+
+
+class ItemLoteReprocesamiento(models.Model):
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('exitoso', 'Exitoso'),
+        ('omitido', 'Omitido (sin cambios)'),
+        ('error', 'Error'),
+    ]
+
+    lote = models.ForeignKey(LoteReprocesamiento, on_delete=models.CASCADE, related_name='items')
+    peticion = models.ForeignKey(Peticion, on_delete=models.CASCADE, related_name='items_reprocesamiento')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', db_index=True)
+    mensaje_error = models.TextField(blank=True, null=True)
+    fecha_fin = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Petición de Lote de Reprocesamiento"
+        verbose_name_plural = "Peticiones de Lote de Reprocesamiento"
+        ordering = ['id']
+        unique_together = ['lote', 'peticion']
+
+    def __str__(self):
+        return f"{self.peticion.radicado} - {self.get_estado_display()}"
+
+
+class AnalisisAsistente(models.Model):
+    """
+    Análisis y preguntas del asistente IA para una petición, guardados por hash
+    de la transcripción: se reutilizan hasta que la transcripción cambie o un
+    usuario pida regenerarlos
+    """
+    peticion = models.ForeignKey(Peticion, on_delete=models.CASCADE, related_name='analisis_asistente')
+    hash_transcripcion = models.CharField(max_length=64, help_text="SHA-256 de la transcripción analizada")
+    analisis = models.JSONField()
+    modelo_ia_usado = models.CharField(max_length=50)
+    fecha_generacion = models.DateTimeField(auto_now_add=True)
+    generado_por = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='analisis_asistente_generados'
+    )
+
+    class Meta:
+        verbose_name = "Análisis del Asistente IA"
+        verbose_name_plural = "Análisis del Asistente IA"
+        ordering = ['-fecha_generacion']
+        constraints = [
+            models.UniqueConstraint(fields=['peticion', 'hash_transcripcion'], name='analisis_unico_por_transcripcion')
+        ]
+
+    def __str__(self):
+        return f"Análisis asistente - {self.peticion.radicado}"
+
+
+class BorradorRespuesta(models.Model):
+    """
+    Versión de una respuesta generada por el asistente IA, con los datos con
+    que se generó, para poder reabrirla, compararla o descargarla en Word sin
+    volver a llamar al modelo
+    """
+    ESTADO_EVALUACION_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completada', 'Completada'),
+        ('error', 'Error'),
+        ('desactivada', 'Desactivada'),
+    ]
+
+    peticion = models.ForeignKey(Peticion, on_delete=models.CASCADE, related_name='borradores')
+    version = models.PositiveIntegerField()
+    contenido = models.TextField()
+    respuestas_usuario = models.JSONField(default=list, help_text="Preguntas y respuestas del funcionario usadas en el prompt")
+    evaluacion = models.JSONField(blank=True, null=True)
+    estado_evaluacion = models.CharField(max_length=20, choices=ESTADO_EVALUACION_CHOICES, default='pendiente')
+    modelo_ia_usado = models.CharField(max_length=50)
+    tokens_entrada = models.PositiveIntegerField(default=0)
+    tokens_salida = models.PositiveIntegerField(default=0)
+    tiempo_generacion = models.FloatField(help_text="Tiempo en segundos")
+    creado_por = models.ForeignKey(
+        Usuario,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='borradores_respuesta'
+    )
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Borrador de Respuesta"
+        verbose_name_plural = "Borradores de Respuesta"
+        ordering = ['-version']
+        constraints = [
+            models.UniqueConstraint(fields=['peticion', 'version'], name='version_unica_por_peticion')
+        ]
+
+    def __str__(self):
+        return f"Borrador v{self.version} - {self.peticion.radicado}"
+
+
+class VectorSimilitud(models.Model):
+    """
+    Frecuencia de términos de la transcripción de una petición respondida,
+    usada por el índice TF-IDF de peticiones similares. Las bajas se marcan
+    con activo=False para que cada proceso las vea al sincronizar su índice.
+    """
+    peticion = models.OneToOneField(Peticion, on_delete=models.CASCADE, related_name='vector_similitud')
+    terminos = models.JSONField(default=dict, help_text="Término -> frecuencia en la transcripción")
+    activo = models.BooleanField(default=True)
+    fecha_actualizacion = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Vector de Similitud"
+        verbose_name_plural = "Vectores de Similitud"
+
+    def __str__(self):
+        return f"Vector similitud - {self.peticion.radicado}"
+
+
 class RespuestaPeticion(models.Model):
     """
     Modelo para almacenar las respuestas a las peticiones
@@ -358,10 +652,117 @@ class RespuestaPeticion(models.Model):
     contenido_respuesta = models.TextField()
     fecha_respuesta = models.DateTimeField(auto_now_add=True)
     funcionario_responsable = models.CharField(max_length=200)
-    archivo_respuesta = models.FileField(upload_to='respuestas/', blank=True, null=True)
+    archivo_respuesta = models.FileField(upload_to='respuestas/', blank=True, null=True, db_index=True)
     
     class Meta:
         ordering = ['-fecha_respuesta']
     
     def __str__(self):
-        return f"Respuesta a {self.peticion.radicado}"
\ No newline at end of file
+        return f"Respuesta a {self.peticion.radicado}"
+
+
+class CargaFragmentada(models.Model):
+    """
+    Subida de un PDF por fragmentos (reanudable). Los fragmentos se guardan en
+    CARGAS_DIRECTORIO mientras llegan; al completarla se arma el archivo en el
+    almacenamiento y ``archivo`` queda con su nombre, listo para asignarlo a
+    una petición.
+    """
+    ESTADO_CHOICES = [
+        ('en_curso', 'En curso'),
+        ('completada', 'Completada'),
+        ('usada', 'Usada'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='cargas_fragmentadas')
+    nombre_archivo = models.CharField(max_length=255)
+    tamano = models.PositiveBigIntegerField(help_text="Tamaño total en bytes")
+    tamano_fragmento = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True, help_text="SHA-256 esperado del archivo completo (opcional)")
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='en_curso')
+    archivo = models.CharField(max_length=255, blank=True, help_text="Nombre del archivo armado en el almacenamiento")
+    metadatos_pdf = models.JSONField(default=dict, blank=True, help_text="Páginas, cifrado y escaneado del PDF armado")
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Carga Fragmentada"
+        verbose_name_plural = "Cargas Fragmentadas"
+        ordering = ['-fecha_creacion']
+
+    def __str__(self):
+        return f"{self.nombre_archivo} ({self.get_estado_display()})"
+
+    @property
+    def total_fragmentos(self):
+        return max(1, -(-self.tamano // self.tamano_fragmento))
+
+    def tamano_esperado(self, indice):
+        """Bytes que debe tener el fragmento ``indice`` (el último puede ser menor)"""
+        if indice < self.total_fragmentos - 1:
+            return self.tamano_fragmento
+        return self.tamano - self.tamano_fragmento * (self.total_fragmentos - 1)
+
+
+class CorreoSaliente(models.Model):
+    """
+    Bandeja de salida: los correos se guardan aquí y los envía en segundo plano
+    el remitente de correo_service, varios por conexión SMTP y con reintentos
+    """
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('error', 'Error'),
+    ]
+
+    asunto = models.CharField(max_length=255)
+    cuerpo = models.TextField(help_text="Se borra al enviarlo: puede llevar contraseñas temporales o enlaces de recuperación")
+    remitente = models.CharField(max_length=255)
+    destinatarios = models.JSONField(default=list)
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    proximo_intento = models.DateTimeField(default=timezone.now, help_text="No se intenta antes de esta fecha (espera entre reintentos)")
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_envio = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Correo Saliente"
+        verbose_name_plural = "Correos Salientes"
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento']),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} → {', '.join(self.destinatarios)} ({self.get_estado_display()})"
+
+
+class AlertaVencimientoEnviada(models.Model):
+    """
+    Registro de las alertas de vencimiento ya enviadas: cada usuario recibe
+    una sola alerta por petición y tipo (por vencer y, si llega, vencida)
+    """
+    TIPO_CHOICES = [
+        ('por_vencer', 'Por vencer'),
+        ('vencida', 'Vencida'),
+    ]
+
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='alertas_vencimiento')
+    peticion = models.ForeignKey(Peticion, on_delete=models.CASCADE, related_name='alertas_vencimiento')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    dias_habiles_restantes = models.IntegerField()
+    correo = models.ForeignKey(CorreoSaliente, on_delete=models.SET_NULL, null=True, blank=True, related_name='alertas')
+    fecha_envio = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Alerta de Vencimiento Enviada"
+        verbose_name_plural = "Alertas de Vencimiento Enviadas"
+        ordering = ['-fecha_envio']
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'peticion', 'tipo'], name='alerta_vencimiento_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.peticion.radicado} ({self.get_tipo_display()}) → {self.usuario.cedula}"
@@ -0,0 +1,150 @@
+# services/alertas_vencimiento_service.py
+"""
+Resumen diario de peticiones por vencer y vencidas, por dependencia.
+
+En una sola pasada toma las peticiones sin responder que vencen en los
+próximos ALERTAS_DIAS_ANTICIPACION días hábiles (o ya vencieron), calcula
+sus días hábiles restantes con un CalendarioHabil (sin consultas por día) y
+arma un correo por cada responsable de la dependencia (Dependencia.get_responsables)
+con las alertas que aún no había recibido. Las alertas enviadas quedan en
+AlertaVencimientoEnviada: cada usuario recibe una sola por petición y tipo,
+aunque el comando corra varias veces.
+
+Los correos pasan por la bandeja de salida y se envían al final por una sola
+conexión SMTP.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+from ..models import AlertaVencimientoEnviada, Dependencia, Peticion
+from .correo_service import encolar_correo, enviar_pendientes
+from .dias_habiles_service import CalendarioHabil
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def limite_calendario(hoy, dias):
+    """Fecha hasta la que pueden caer ``dias`` días hábiles (con margen para festivos y días no hábiles)"""
+    return hoy + timedelta(days=2 * dias + 15)
+
+
+def peticiones_a_alertar(hoy, dias):
+    """
+    {dependencia_id: [(peticion, dias_restantes, tipo)]} de las peticiones sin
+    responder que vencen en ``dias`` días hábiles o menos (negativo si ya venció)
+    """
+    limite = limite_calendario(hoy, dias)
+    peticiones = list(
+        Peticion.objects.filter(
+            estado='sin_responder', fecha_vencimiento__isnull=False, fecha_vencimiento__lte=limite,
+            dependencia__isnull=False,
+        ).only('radicado', 'dependencia_id', 'fecha_vencimiento', 'peticionario_nombre').order_by('fecha_vencimiento')
+    )
+    if not peticiones:
+        return {}
+
+    calendario = CalendarioHabil(min(peticiones[0].fecha_vencimiento, hoy), limite)
+    alertas = defaultdict(list)
+    for peticion in peticiones:
+        restantes = calendario.dias_habiles_restantes(hoy, peticion.fecha_vencimiento)
+        if restantes <= dias:
+            tipo = 'vencida' if peticion.fecha_vencimiento < hoy else 'por_vencer'
+            alertas[peticion.dependencia_id].append((peticion, restantes, tipo))
+    return alertas
+
+
+def describir(peticion, restantes):
+    fecha = peticion.fecha_vencimiento.strftime('%d/%m/%Y')
+    if restantes < 0:
+        plazo = f"venció el {fecha} (hace {-restantes} días hábiles)"
+    elif restantes == 0:
+        plazo = "vence HOY"
+    else:
+        plazo = f"vence el {fecha} (en {restantes} días hábiles)"
+    linea = f"- {peticion.radicado}: {plazo}"
+    if peticion.peticionario_nombre:
+        linea += f" - {peticion.peticionario_nombre}"
+    if settings.SITIO_URL:
+        linea += f"\n  {settings.SITIO_URL.rstrip('/')}{reverse('detalle_peticion', args=[peticion.radicado])}"
+    return linea
+
+
+def mensaje_resumen(usuario, dependencia, alertas):
+    vencidas = [(peticion, restantes) for peticion, restantes, tipo in alertas if tipo == 'vencida']
+    por_vencer = [(peticion, restantes) for peticion, restantes, tipo in alertas if tipo == 'por_vencer']
+
+    secciones = ''
+    if vencidas:
+        secciones += f"VENCIDAS ({len(vencidas)}):\n" + "\n".join(describir(p, r) for p, r in vencidas) + "\n\n"
+    if por_vencer:
+        secciones += f"POR VENCER ({len(por_vencer)}):\n" + "\n".join(describir(p, r) for p, r in por_vencer) + "\n\n"
+
+    return f"""
+Hola {usuario.nombre_completo},
+
+Estos derechos de petición de {dependencia.nombre_oficina} requieren atención:
+
+{secciones}Recibirás un nuevo aviso solo si alguna de ellas vence sin respuesta.
+
+Saludos,
+Equipo de Sistemas
+"""
+
+
+def enviar_alertas_vencimiento(hoy=None, dias=None, simular=False):
+    """
+    Encola un resumen por responsable con sus alertas nuevas y los envía.
+    Retorna {'peticiones', 'alertas', 'correos', 'enviados', 'fallidos'}.
+    """
+    hoy = hoy or timezone.localdate()
+    dias = settings.ALERTAS_DIAS_ANTICIPACION if dias is None else dias
+
+    por_dependencia = peticiones_a_alertar(hoy, dias)
+    enviadas = set(
+        AlertaVencimientoEnviada.objects.filter(
+            peticion__estado='sin_responder', peticion__fecha_vencimiento__lte=limite_calendario(hoy, dias)
+        ).values_list('usuario_id', 'peticion_id', 'tipo')
+    )
+
+    resumen = {
+        'peticiones': sum(len(alertas) for alertas in por_dependencia.values()),
+        'alertas': 0, 'correos': 0, 'enviados': 0, 'fallidos': 0,
+    }
+    for dependencia in Dependencia.objects.filter(pk__in=por_dependencia):
+        for usuario in dependencia.get_responsables():
+            nuevas = [
+                alerta for alerta in por_dependencia[dependencia.pk]
+                if (usuario.pk, alerta[0].pk, alerta[2]) not in enviadas
+            ]
+            if not nuevas or not usuario.email:
+                continue
+
+            resumen['alertas'] += len(nuevas)
+            resumen['correos'] += 1
+            if simular:
+                continue
+
+            asunto = f"{len(nuevas)} derechos de petición por vencer o vencidos - {dependencia.nombre_oficina}"
+            # El correo y el registro de lo enviado se guardan juntos: o quedan ambos o ninguno
+            with transaction.atomic():
+                correo = encolar_correo(asunto, mensaje_resumen(usuario, dependencia, nuevas), [usuario.email], despertar=False)
+                AlertaVencimientoEnviada.objects.bulk_create([
+                    AlertaVencimientoEnviada(
+                        usuario=usuario, peticion=peticion, tipo=tipo, dias_habiles_restantes=restantes, correo=correo
+                    )
+                    for peticion, restantes, tipo in nuevas
+                ], ignore_conflicts=True)
+
+    if resumen['correos'] and not simular:
+        # Todos los resúmenes por una sola conexión SMTP
+        resumen['enviados'], resumen['fallidos'] = enviar_pendientes(max(resumen['correos'], settings.CORREO_LOTE))
+
+    logger.info(
+        f"Alertas de vencimiento: {resumen['peticiones']} peticiones, {resumen['alertas']} alertas nuevas "
+        f"en {resumen['correos']} correos"
+    )
+    return resumen
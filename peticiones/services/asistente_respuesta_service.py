@@ -1,94 +1,346 @@
 # peticiones/services/asistente_respuesta_service.py
-import google.generativeai as genai
+import difflib
+import hashlib
 import json
+import re
+import threading
 import time
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from ..models import AnalisisAsistente, BorradorRespuesta, Peticion
+from .similitud_service import peticiones_similares, respuesta_final
+from .cache_contexto_service import generar_con_contexto, agenerar_con_contexto, prompt_en_linea
+from .modelo_ia_service import (
+    obtener_modelo, generar_contenido, agenerar_contenido, estimar_tokens, registrar_uso_llamada, tokens_cacheados,
+    MetricasIA
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def hash_transcripcion(peticion):
+    """SHA-256 de la transcripción: identifica el texto sobre el que se hizo un análisis"""
+    return hashlib.sha256((peticion.transcripcion_completa or '').encode('utf-8')).hexdigest()
+
+
+def analisis_guardado(peticion):
+    """
+    Retorna el AnalisisAsistente vigente (el de la transcripción actual) o None
+    """
+    return AnalisisAsistente.objects.filter(
+        peticion=peticion, hash_transcripcion=hash_transcripcion(peticion)
+    ).first()
+
+
+def crear_borrador(peticion, contenido, respuestas_usuario, modelo_ia_usado, tokens_entrada=0,
+                   tokens_salida=0, tiempo_generacion=0.0, usuario=None, evaluacion=None):
+    """
+    Guarda una respuesta generada como la siguiente versión de borrador de la petición
+    """
+    for intento in range(3):
+        ultima = BorradorRespuesta.objects.filter(peticion=peticion).aggregate(ultima=Max('version'))['ultima'] or 0
+        try:
+            with transaction.atomic():
+                return BorradorRespuesta.objects.create(
+                    peticion=peticion,
+                    version=ultima + 1,
+                    contenido=contenido,
+                    respuestas_usuario=respuestas_usuario,
+                    evaluacion=evaluacion,
+                    modelo_ia_usado=modelo_ia_usado,
+                    tokens_entrada=tokens_entrada,
+                    tokens_salida=tokens_salida,
+                    tiempo_generacion=round(tiempo_generacion, 3),
+                    creado_por=usuario
+                )
+        except IntegrityError:
+            # Otro usuario guardó la misma versión al mismo tiempo: tomar la siguiente
+            if intento == 2:
+                raise
+
+
+def comparar_borradores(anterior, actual):
+    """
+    Diferencias por línea entre dos borradores: lista de (tipo, texto) con
+    tipo 'igual', 'eliminada' o 'agregada'
+    """
+    tipos = {' ': 'igual', '-': 'eliminada', '+': 'agregada'}
+    return [
+        (tipos[linea[0]], linea[2:])
+        for linea in difflib.ndiff(anterior.contenido.splitlines(), actual.contenido.splitlines())
+        if linea[0] in tipos
+    ]
+
+
+def evaluacion_activa(peticion):
+    """La evaluación de calidad se hace salvo que la dependencia responsable la desactive"""
+    return peticion.dependencia is None or peticion.dependencia.evaluar_respuestas_ia
+
+
+def evaluar_borrador(borrador_id):
+    """
+    Evalúa la calidad de un borrador y guarda el resultado (se ejecuta en segundo plano)
+    """
+    try:
+        borrador = BorradorRespuesta.objects.get(pk=borrador_id)
+        borrador.estado_evaluacion = 'en_proceso'
+        borrador.save(update_fields=['estado_evaluacion'])
+        
+        evaluacion = AsistenteRespuestaService().evaluar_calidad_respuesta(borrador.contenido)
+        
+        borrador.evaluacion = evaluacion
+        borrador.estado_evaluacion = 'completada' if evaluacion else 'error'
+        borrador.save(update_fields=['evaluacion', 'estado_evaluacion'])
+        logger.info(f"Evaluación de borrador v{borrador.version} de {borrador.peticion_id}: {borrador.estado_evaluacion}")
+    except Exception as e:
+        logger.error(f"Error evaluando borrador {borrador_id}: {str(e)}")
+        BorradorRespuesta.objects.filter(pk=borrador_id).update(estado_evaluacion='error')
+
+
+def programar_evaluacion(borrador, forzar=False):
+    """
+    Lanza la evaluación del borrador en un hilo cuando la transacción actual
+    confirme. Si la dependencia la tiene desactivada (y no se fuerza) la marca
+    como 'desactivada'. Retorna True si quedó programada.
+    """
+    if not forzar and not evaluacion_activa(borrador.peticion):
+        borrador.estado_evaluacion = 'desactivada'
+        borrador.save(update_fields=['estado_evaluacion'])
+        return False
+    
+    borrador.estado_evaluacion = 'pendiente'
+    borrador.save(update_fields=['estado_evaluacion'])
+    
+    def evaluar_en_background():
+        try:
+            evaluar_borrador(borrador.pk)
+        finally:
+            # El hilo no pasa por el ciclo de petición de Django: cerrar su conexión
+            connection.close()
+    
+    def iniciar():
+        thread = threading.Thread(target=evaluar_en_background)
+        thread.daemon = True
+        thread.start()
+    
+    transaction.on_commit(iniciar)
+    return True
+
+
 class AsistenteRespuestaService:
+    MODELO = 'gemini-2.5-pro'
+    # La evaluación de calidad es una tarea más simple: se hace con el modelo rápido
+    MODELO_EVALUACION = 'gemini-2.5-flash'
+    # El resumen condensado de peticiones extensas también
+    MODELO_RESUMEN = 'gemini-2.5-flash'
+    
+    # Prefijo común del análisis y de la respuesta: junto con la transcripción se
+    # envía una sola vez como contenido en caché (ver cache_contexto_service)
+    INSTRUCCIONES_SISTEMA = (
+        "Eres un experto en derecho administrativo colombiano especializado en derechos de petición. "
+        "Apoyas a los funcionarios del municipio de El Carmen de Viboral, Antioquia, Colombia, "
+        "y siempre respondes en español latinoamericano."
+    )
+    
+    # Precedentes (peticiones similares respondidas) que se incluyen en el prompt
+    MAX_PRECEDENTES = 2
+    SIMILITUD_MINIMA_PRECEDENTE = 0.3
+    LONGITUD_MAXIMA_PRECEDENTE = 2000
+
     def __init__(self):
         """
         Servicio para generar respuestas inteligentes a derechos de petición
         """
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.5-pro')
+        self.model = obtener_modelo(self.MODELO)
+        self.modelo_evaluacion = obtener_modelo(self.MODELO_EVALUACION)
+        self.modelo_resumen = obtener_modelo(self.MODELO_RESUMEN)
+        self.metricas = MetricasIA()
+        self.precedentes = []
+        self.presupuesto = settings.ASISTENTE_PRESUPUESTO_TOKENS
+    
+    # ========================================
+    # PRESUPUESTO DE TOKENS Y RESUMEN CONDENSADO
+    # ========================================
+    
+    def construir_prompt_resumen(self, peticion):
+        """
+        Construye el prompt de condensación de una petición extensa
+        """
+        prompt = f"""
+        Eres un asistente especializado en derechos de petición ciudadanos para un municipio.
+        
+        Condensa el siguiente derecho de petición en máximo {settings.ASISTENTE_TOKENS_RESUMEN * 3 // 4} palabras para que un funcionario pueda responderlo sin leer el documento completo.
+        
+        CONSERVA SIEMPRE:
+        - Cada una de las solicitudes concretas, numeradas como en el original
+        - Hechos, fechas, direcciones, montos, números de radicado y normas citadas
+        - El nombre del peticionario y la calidad en la que actúa
+        
+        OMITE: saludos, fórmulas de cortesía, transcripciones de normas y argumentos repetidos.
+        
+        PETICIÓN A CONDENSAR:
+        {peticion.transcripcion_completa}
+        
+        RESUMEN CONDENSADO:
+        """
+        return prompt
     
-    def analizar_peticion_y_generar_preguntas(self, peticion):
+    def guardar_resumen(self, peticion, response):
         """
-        Analiza el derecho de petición y genera preguntas cortas y sencillas
-        para recopilar información necesaria para dar una respuesta precisa
+        Valida el resumen devuelto por el modelo y lo deja en la petición;
+        retorna (resumen, campos a guardar)
+        """
+        if not (response and response.text and response.text.strip()):
+            raise ValidationError("IA no devolvió resumen")
+        
+        peticion.resumen_condensado = response.text.strip()
+        peticion.hash_resumen = hash_transcripcion(peticion)
+        return peticion.resumen_condensado, {
+            'resumen_condensado': peticion.resumen_condensado,
+            'hash_resumen': peticion.hash_resumen,
+        }
+    
+    def resumen_vigente(self, peticion):
+        """El resumen guardado, si corresponde a la transcripción actual"""
+        if peticion.resumen_condensado and peticion.hash_resumen == hash_transcripcion(peticion):
+            return peticion.resumen_condensado
+        return None
+    
+    async def aobtener_resumen(self, peticion):
+        """
+        Resumen condensado de la petición: se genera una sola vez por
+        transcripción y se guarda en la petición. Si falla, se usa el texto completo.
         """
+        resumen = self.resumen_vigente(peticion)
+        if resumen:
+            return resumen
+        
         try:
-            if not peticion.transcripcion_completa:
-                raise ValidationError("La petición debe estar transcrita primero")
-            
-            prompt = f"""
-            Eres un experto en derecho administrativo y derechos de petición en Colombia.
-            
-            Tu tarea es analizar el siguiente derecho de petición y generar máximo 3 preguntas cortas y sencillas que permitan al funcionario municipal dar una respuesta precisa, completa y oportuna.
-
-            DERECHO DE PETICIÓN A ANALIZAR:
-            {peticion.transcripcion_completa}
-
-            INSTRUCCIONES:
-            1. Analiza cuidadosamente el contenido del derecho de petición
-            2. Identifica los puntos clave que requieren información adicional para responder adecuadamente
-            3. Genera entre 1 y 3 preguntas (solo las necesarias) que ayuden a:
-               - Clarificar aspectos técnicos o legales específicos
-               - Obtener información adicional necesaria para una respuesta completa
-               - Identificar la competencia exacta del municipio
-               - Determinar el procedimiento o normativa aplicable
-            4. Añade una pregunta final donde pidas que el servidor público agregue información relevante para el contexto de la respuesta (este cuadro siempre va al final)
-
-            Las que tú le harás al servidor público es la persona responsable de dat la respuesta así que asegurate que las preguntas deben ser:
-            - Específicas, corta, sencilla y fáciles de entender para el servidor público que es quien dará respuesta y relevantes al caso
-            - Orientadas a obtener información que mejore la calidad de la respuesta
-            - Enfocadas en la forma en que se complementatará la respuesta
-
-            RESPONDE EN EL SIGUIENTE FORMATO JSON:
-            {{
-                "resumen_peticion": "Breve resumen de qué solicita el peticionario",
-                "aspectos_clave": ["aspecto 1", "aspecto 2", "aspecto 3"],
-                "preguntas": [
-                    {{
-                        "pregunta": "¿Pregunta específica?",
-                         "respuesta y complemento que mejora el contexto": ["opción 1", "opción 2", "opción 3"]
-                    }}
-                ],
-                "urgencia": "alta|media|baja",
-                "competencia_municipal": "sí|no|parcial"
-            }}
-            """
+            prompt = self.construir_prompt_resumen(peticion)
+            response = await agenerar_contenido(self.modelo_resumen, prompt, self.metricas, etiqueta='resumen')
+            resumen, campos = self.guardar_resumen(peticion, response)
+            await Peticion.objects.filter(pk=peticion.pk).aupdate(**campos)
+            logger.info(f"Resumen condensado generado para {peticion.radicado}: ~{estimar_tokens(resumen)} tokens")
+            return resumen
+        except Exception as e:
+            logger.warning(f"No se pudo condensar {peticion.radicado}, se usa la transcripción completa: {str(e)}")
+            return peticion.transcripcion_completa
+    
+    def excede_presupuesto(self, peticion, prompt):
+        """Indica si el prompt con la transcripción completa supera el presupuesto de tokens"""
+        tokens_prompt = estimar_tokens(prompt)
+        if tokens_prompt <= self.presupuesto:
+            return False
+        logger.info(
+            f"Prompt de {peticion.radicado} (~{tokens_prompt} tokens) supera el presupuesto de "
+            f"{self.presupuesto}: se usa el resumen condensado"
+        )
+        return True
+    
+    async def atexto_segun_presupuesto(self, peticion, instrucciones):
+        """
+        Texto de la petición para un prompt con las ``instrucciones`` dadas: la
+        transcripción completa o, si con ella se excede el presupuesto, el resumen condensado
+        """
+        prompt = prompt_en_linea(self.INSTRUCCIONES_SISTEMA, self.construir_contexto(peticion.transcripcion_completa), instrucciones)
+        if not self.excede_presupuesto(peticion, prompt):
+            return peticion.transcripcion_completa
+        return await self.aobtener_resumen(peticion)
+    
+    def construir_contexto(self, texto_peticion):
+        """Parte del prompt compartida por el análisis y la respuesta de una petición"""
+        return f"DERECHO DE PETICIÓN:\n{texto_peticion}\n"
+    
+    # ========================================
+    # ANÁLISIS Y PREGUNTAS
+    # ========================================
+    
+    def instrucciones_analisis(self):
+        """
+        Parte propia del prompt de análisis (va después de la petición)
+        """
+        instrucciones = """
+        Tu tarea es analizar el derecho de petición anterior y generar máximo 3 preguntas cortas y sencillas que permitan al funcionario municipal dar una respuesta precisa, completa y oportuna.
+
+        INSTRUCCIONES:
+        1. Analiza cuidadosamente el contenido del derecho de petición
+        2. Identifica los puntos clave que requieren información adicional para responder adecuadamente
+        3. Genera entre 1 y 3 preguntas (solo las necesarias) que ayuden a:
+           - Clarificar aspectos técnicos o legales específicos
+           - Obtener información adicional necesaria para una respuesta completa
+           - Identificar la competencia exacta del municipio
+           - Determinar el procedimiento o normativa aplicable
+        4. Añade una pregunta final donde pidas que el servidor público agregue información relevante para el contexto de la respuesta (este cuadro siempre va al final)
+
+        Las que tú le harás al servidor público es la persona responsable de dat la respuesta así que asegurate que las preguntas deben ser:
+        - Específicas, corta, sencilla y fáciles de entender para el servidor público que es quien dará respuesta y relevantes al caso
+        - Orientadas a obtener información que mejore la calidad de la respuesta
+        - Enfocadas en la forma en que se complementatará la respuesta
+
+        RESPONDE EN EL SIGUIENTE FORMATO JSON:
+        {
+            "resumen_peticion": "Breve resumen de qué solicita el peticionario",
+            "aspectos_clave": ["aspecto 1", "aspecto 2", "aspecto 3"],
+            "preguntas": [
+                {
+                    "pregunta": "¿Pregunta específica?",
+                     "respuesta y complemento que mejora el contexto": ["opción 1", "opción 2", "opción 3"]
+                }
+            ],
+            "urgencia": "alta|media|baja",
+            "competencia_municipal": "sí|no|parcial"
+        }
+        """
+        return instrucciones
+    
+    def interpretar_analisis(self, response):
+        """
+        Extrae y valida el JSON de análisis devuelto por el modelo
+        """
+        if response and response.text:
+            # Limpiar respuesta y extraer JSON
+            respuesta_texto = response.text.strip()
             
-            response = self.model.generate_content(prompt)
+            # Buscar JSON en la respuesta
+            json_match = re.search(r'\{.*\}', respuesta_texto, re.DOTALL)
             
-            if response and response.text:
-                # Limpiar respuesta y extraer JSON
-                respuesta_texto = response.text.strip()
+            if json_match:
+                json_str = json_match.group()
+                analisis = json.loads(json_str)
                 
-                # Buscar JSON en la respuesta
-                import re
-                json_match = re.search(r'\{.*\}', respuesta_texto, re.DOTALL)
+                # Validar estructura mínima
+                required_fields = ['resumen_peticion', 'preguntas']
+                for field in required_fields:
+                    if field not in analisis:
+                        raise ValidationError(f"Respuesta de IA incompleta: falta {field}")
                 
-                if json_match:
-                    json_str = json_match.group()
-                    analisis = json.loads(json_str)
-                    
-                    # Validar estructura mínima
-                    required_fields = ['resumen_peticion', 'preguntas']
-                    for field in required_fields:
-                        if field not in analisis:
-                            raise ValidationError(f"Respuesta de IA incompleta: falta {field}")
-                    
-                    return analisis
-                else:
-                    raise ValidationError("IA no devolvió JSON válido")
+                return analisis
             else:
-                raise ValidationError("IA no devolvió respuesta")
+                raise ValidationError("IA no devolvió JSON válido")
+        else:
+            raise ValidationError("IA no devolvió respuesta")
+    
+    async def aanalizar_peticion_y_generar_preguntas(self, peticion):
+        """
+        Analiza el derecho de petición y genera preguntas cortas y sencillas
+        para recopilar información necesaria para dar una respuesta precisa
+        """
+        try:
+            if not peticion.transcripcion_completa:
+                raise ValidationError("La petición debe estar transcrita primero")
+            
+            instrucciones = self.instrucciones_analisis()
+            texto = await self.atexto_segun_presupuesto(peticion, instrucciones)
+            response = await agenerar_con_contexto(
+                self.model, self.INSTRUCCIONES_SISTEMA, self.construir_contexto(texto), instrucciones,
+                self.metricas, etiqueta='analisis', presupuesto=self.presupuesto
+            )
+            return self.interpretar_analisis(response)
                 
         except json.JSONDecodeError as e:
             logger.error(f"Error parseando JSON de IA: {str(e)}")
@@ -97,128 +349,295 @@ class AsistenteRespuestaService:
             logger.error(f"Error en análisis con IA: {str(e)}")
             raise ValidationError(f"Error en análisis: {str(e)}")
     
-    def generar_respuesta_sugerida(self, peticion, respuestas_usuario):
+    async def aobtener_analisis(self, peticion, usuario=None, regenerar=False):
+        """
+        Retorna (AnalisisAsistente, desde_cache) para la transcripción actual.
+        
+        Solo llama a la IA si no hay análisis guardado para ese hash o si se
+        pide regenerar; los análisis de transcripciones anteriores se descartan.
+        """
+            
+        hash_actual = hash_transcripcion(peticion)
+        
+        if not regenerar:
+            registro = await AnalisisAsistente.objects.filter(
+                peticion=peticion, hash_transcripcion=hash_actual
+            ).afirst()
+            if registro:
+                logger.info(f"Análisis del asistente servido desde caché: {peticion.radicado}")
+                return registro, True
+        
+        analisis = await self.aanalizar_peticion_y_generar_preguntas(peticion)
+        
+        registro, _ = await AnalisisAsistente.objects.aupdate_or_create(
+            peticion=peticion,
+            hash_transcripcion=hash_actual,
+            defaults={
+                'analisis': analisis,
+                'modelo_ia_usado': self.MODELO,
+                'generado_por': usuario,
+                'fecha_generacion': timezone.now(),
+            }
+        )
+        await AnalisisAsistente.objects.filter(peticion=peticion).exclude(hash_transcripcion=hash_actual).adelete()
+        logger.info(f"Análisis del asistente generado y guardado: {peticion.radicado}")
+        return registro, False
+    
+    def guardar_borrador(self, peticion, contenido, respuestas_usuario, tiempo_generacion, usuario=None):
+        """
+        Guarda la respuesta generada como nueva versión de borrador, con los
+        tokens acumulados por este servicio hasta el momento
+        """
+        return crear_borrador(
+            peticion, contenido, respuestas_usuario, self.MODELO,
+            tokens_entrada=self.metricas.tokens_entrada,
+            tokens_salida=self.metricas.tokens_salida,
+            tiempo_generacion=tiempo_generacion,
+            usuario=usuario
+        )
+    
+    def obtener_precedentes(self, peticion):
+        """
+        Respuestas de peticiones similares ya respondidas (índice TF-IDF local),
+        para que el modelo reutilice fundamentos y estructura
+        """
+        try:
+            similares = peticiones_similares(peticion, k=self.MAX_PRECEDENTES)
+        except Exception as e:
+            logger.warning(f"No se pudieron buscar precedentes para {peticion.radicado}: {str(e)}")
+            return []
+        
+        precedentes = []
+        for similar, similitud in similares:
+            if similitud < self.SIMILITUD_MINIMA_PRECEDENTE:
+                continue
+            respuesta = respuesta_final(similar)
+            if respuesta:
+                precedentes.append({
+                    'radicado': similar.radicado,
+                    'similitud': round(similitud, 3),
+                    'respuesta': respuesta[:self.LONGITUD_MAXIMA_PRECEDENTE]
+                })
+        return precedentes
+    
+    def instrucciones_respuesta(self, respuestas_usuario, precedentes=()):
+        """
+        Parte propia del prompt de respuesta (va después de la petición)
+        """
+        # Formatear las respuestas del usuario
+        respuestas_formateadas = ""
+        for i, respuesta in enumerate(respuestas_usuario, 1):
+            respuestas_formateadas += f"\nPregunta {i}: {respuesta.get('pregunta', '')}\nRespuesta: {respuesta.get('respuesta', '')}\n"
+        
+        seccion_precedentes = ""
+        if precedentes:
+            seccion_precedentes = "\nRESPUESTAS DADAS A PETICIONES SIMILARES (úsalas como referencia de fundamentos legales y estructura; no copies nombres, datos personales ni radicados):\n"
+            for i, precedente in enumerate(precedentes, 1):
+                seccion_precedentes += f"\nPrecedente {i}:\n{precedente['respuesta']}\n"
+        
+        instrucciones = f"""
+        Con base en el derecho de petición anterior y el contexto y las respuestas proporcionadas por el funcionario, genera una respuesta COMPLETA, PRECISA y LEGALMENTE FUNDAMENTADA.
+
+        INFORMACIÓN ADICIONAL PROPORCIONADA:
+        {respuestas_formateadas}
+        {seccion_precedentes}
+
+        INSTRUCCIONES PARA LA RESPUESTA:
+        1. Luego de Cordialmente, o Atentamente, no pongas nada más en la respuesta corta ahí
+        1.2 La respuesta debe ser formal y profesional
+        1.3 Siempre responde en español latinoamérica, recuerda que estás en el municipio de El Carmen de Viboral, Antioquia, Colombia
+        2. Debe citar las normas legales aplicables (Constitución, leyes, decretos)
+        3. Debe ser clara y comprensible para el ciudadano
+        4. Debe responder TODOS los puntos solicitados en la petición
+        5. Si algo no es competencia del municipio, explicar claramente y orientar
+        6. Incluir términos y procedimientos si aplica
+        7. Mantener un tono respetuoso y servicial
+        8. No uses negrita, ni subrayado, ni pasos a seguir ni indicaciones dentro del derecho de petición ponlo listo para copiar
+        9. No uses **
+        10. En la firma pon el nombre del funcionario y el cargo (extráelo de su nombre de inicio de sesión)
+        11. Nunca dejes información por completar ni vacía
+        12. Luego de Cordialmente, o Atentamente, no pongas nada más en la respuesta corta ahí
+
+        ESTRUCTURA SUGERIDA:
+        no empieces con la información preliminar, pasa a la respuesta directamente
+        1. Empieza por el Saludo cordial al peticionario
+        2. Respuesta punto por punto
+        3. Fundamentos legales (si aplica)
+        4. Pasos a seguir (si aplica)
+        5. Información de contacto para dudas (si aplica)
+        6. Despedida formal (acá termina la respuesta no sigas con información adicional)
+        7. No pongas información del servidor que está respondiendo ya que éste ya está conectado por base de datos
+        8. No uses **
+        9. Nunca dejes información por completar ni vacía
+        10. luego de la despedida no pongas nada más
+        11. No pongas informacion al final del servidor ni nada
+        12. No pongas información adicional que no sea la respuesta, ni pongas ALCALDE MUNICIPAL, la respuesta termina en Cordialmente, o Atentamente
+
+        ELEMENTOS QUE NO VAN EN LA RESPUESTA:
+        1. No tengas en cuenta la ciudad, ya está conectada previamente por base de datos
+        2. No pongas el asunto ni la información preliminar
+        3. No pongas la fecha, ya está conectada previamente por base de datos
+        4. No pongas el nombre del funcionario, ya está conectada previamente por base de datos
+        5. No pongas el cargo del funcionario, ya está conectada previamente por base de datos
+        6. No pongas el radicado, ya está conectada previamente por base de datos
+
+        GENERA UNA RESPUESTA COMPLETA Y LISTA PARA ENVIAR:
+        """
+        return instrucciones
+    
+    def interpretar_respuesta(self, response):
+        """
+        Arma el resultado de la generación de respuesta
+        """
+        if response and response.text:
+            return {
+                'respuesta_sugerida': response.text.strip(),
+                'fecha_generacion': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'modelo_usado': self.MODELO
+            }
+        else:
+            raise ValidationError("IA no pudo generar respuesta")
+    
+    async def apreparar_respuesta(self, peticion, respuestas_usuario):
+        """
+        Busca los precedentes y arma (contexto, instrucciones) del prompt de
+        respuesta, con el texto de la petición que cabe en el presupuesto
+        """
+        self.precedentes = await sync_to_async(self.obtener_precedentes)(peticion)
+        instrucciones = self.instrucciones_respuesta(respuestas_usuario, self.precedentes)
+        texto = await self.atexto_segun_presupuesto(peticion, instrucciones)
+        return self.construir_contexto(texto), instrucciones
+    
+    async def agenerar_respuesta_sugerida(self, peticion, respuestas_usuario):
         """
         Genera una respuesta sugerida basada en el análisis y las respuestas del usuario
         """
         try:
-            # Formatear las respuestas del usuario
-            respuestas_formateadas = ""
-            for i, respuesta in enumerate(respuestas_usuario, 1):
-                respuestas_formateadas += f"\nPregunta {i}: {respuesta.get('pregunta', '')}\nRespuesta: {respuesta.get('respuesta', '')}\n"
+            contexto, instrucciones = await self.apreparar_respuesta(peticion, respuestas_usuario)
+            response = await agenerar_con_contexto(
+                self.model, self.INSTRUCCIONES_SISTEMA, contexto, instrucciones,
+                self.metricas, etiqueta='respuesta', presupuesto=self.presupuesto
+            )
+            return self.interpretar_respuesta(response)
+                
+        except Exception as e:
+            logger.error(f"Error generando respuesta: {str(e)}")
+            raise ValidationError(f"Error generando respuesta: {str(e)}")
+    
+    async def agenerar_respuesta_sugerida_stream(self, peticion, respuestas_usuario):
+        """
+        Igual que agenerar_respuesta_sugerida, pero entrega el texto por fragmentos
+        a medida que el modelo lo produce (generador asíncrono, con stream=True)
+        """
+        contexto, instrucciones = await self.apreparar_respuesta(peticion, respuestas_usuario)
+        
+        try:
+            response = await agenerar_con_contexto(
+                self.model, self.INSTRUCCIONES_SISTEMA, contexto, instrucciones,
+                self.metricas, etiqueta='respuesta', presupuesto=self.presupuesto, stream=True
+            )
             
-            prompt = f"""
-            Eres un experto en derecho administrativo colombiano especializado en derechos de petición.
+            async for fragmento in response:
+                if fragmento.text:
+                    yield fragmento.text
             
-            Con base en el derecho de petición analizado y el contexto y las respuestas proporcionadas por el funcionario, genera una respuesta COMPLETA, PRECISA y LEGALMENTE FUNDAMENTADA.
-
-            DERECHO DE PETICIÓN:
-            {peticion.transcripcion_completa}
-
-            INFORMACIÓN ADICIONAL PROPORCIONADA:
-            {respuestas_formateadas}
-
-            INSTRUCCIONES PARA LA RESPUESTA:
-            1. Luego de Cordialmente, o Atentamente, no pongas nada más en la respuesta corta ahí
-            1.2 La respuesta debe ser formal y profesional
-            1.3 Siempre responde en español latinoamérica, recuerda que estás en el municipio de El Carmen de Viboral, Antioquia, Colombia
-            2. Debe citar las normas legales aplicables (Constitución, leyes, decretos)
-            3. Debe ser clara y comprensible para el ciudadano
-            4. Debe responder TODOS los puntos solicitados en la petición
-            5. Si algo no es competencia del municipio, explicar claramente y orientar
-            6. Incluir términos y procedimientos si aplica
-            7. Mantener un tono respetuoso y servicial
-            8. No uses negrita, ni subrayado, ni pasos a seguir ni indicaciones dentro del derecho de petición ponlo listo para copiar
-            9. No uses **
-            10. En la firma pon el nombre del funcionario y el cargo (extráelo de su nombre de inicio de sesión)
-            11. Nunca dejes información por completar ni vacía
-            12. Luego de Cordialmente, o Atentamente, no pongas nada más en la respuesta corta ahí
-
-            ESTRUCTURA SUGERIDA:
-            no empieces con la información preliminar, pasa a la respuesta directamente
-            1. Empieza por el Saludo cordial al peticionario
-            2. Respuesta punto por punto
-            3. Fundamentos legales (si aplica)
-            4. Pasos a seguir (si aplica)
-            5. Información de contacto para dudas (si aplica)
-            6. Despedida formal (acá termina la respuesta no sigas con información adicional)
-            7. No pongas información del servidor que está respondiendo ya que éste ya está conectado por base de datos
-            8. No uses **
-            9. Nunca dejes información por completar ni vacía
-            10. luego de la despedida no pongas nada más
-            11. No pongas informacion al final del servidor ni nada
-            12. No pongas información adicional que no sea la respuesta, ni pongas ALCALDE MUNICIPAL, la respuesta termina en Cordialmente, o Atentamente
-
-            ELEMENTOS QUE NO VAN EN LA RESPUESTA:
-            1. No tengas en cuenta la ciudad, ya está conectada previamente por base de datos
-            2. No pongas el asunto ni la información preliminar
-            3. No pongas la fecha, ya está conectada previamente por base de datos
-            4. No pongas el nombre del funcionario, ya está conectada previamente por base de datos
-            5. No pongas el cargo del funcionario, ya está conectada previamente por base de datos
-            6. No pongas el radicado, ya está conectada previamente por base de datos
-
-            GENERA UNA RESPUESTA COMPLETA Y LISTA PARA ENVIAR:
-            """
+            self.registrar_uso_stream(response, prompt_en_linea(self.INSTRUCCIONES_SISTEMA, contexto, instrucciones))
+                
+        except Exception as e:
+            logger.error(f"Error generando respuesta en streaming: {str(e)}")
+            raise ValidationError(f"Error generando respuesta: {str(e)}")
+    
+    def generar_respuesta_sugerida_stream(self, peticion, respuestas_usuario):
+        """
+        agenerar_respuesta_sugerida_stream para WSGI, donde la respuesta se
+        consume con un generador síncrono: la preparación es la misma
+        (async_to_sync) y solo el stream del modelo usa el SDK síncrono
+        """
+        contexto, instrucciones = async_to_sync(self.apreparar_respuesta)(peticion, respuestas_usuario)
+        
+        try:
+            response = generar_con_contexto(
+                self.model, self.INSTRUCCIONES_SISTEMA, contexto, instrucciones,
+                self.metricas, etiqueta='respuesta', presupuesto=self.presupuesto, stream=True
+            )
             
-            response = self.model.generate_content(prompt)
+            for fragmento in response:
+                if fragmento.text:
+                    yield fragmento.text
             
-            if response and response.text:
-                return {
-                    'respuesta_sugerida': response.text.strip(),
-                    'fecha_generacion': time.strftime('%Y-%m-%d %H:%M:%S'),
-                    'modelo_usado': 'gemini-1.5-flash'
-                }
-            else:
-                raise ValidationError("IA no pudo generar respuesta")
+            self.registrar_uso_stream(response, prompt_en_linea(self.INSTRUCCIONES_SISTEMA, contexto, instrucciones))
                 
         except Exception as e:
-            logger.error(f"Error generando respuesta: {str(e)}")
+            logger.error(f"Error generando respuesta en streaming: {str(e)}")
             raise ValidationError(f"Error generando respuesta: {str(e)}")
     
+    def registrar_uso_stream(self, response, prompt):
+        """
+        Registra el uso de una respuesta en streaming una vez consumidos todos
+        sus fragmentos (``prompt`` es el prompt completo, para estimar si el SDK no reporta uso)
+        """
+        tokens_entrada, tokens_salida = self.metricas.registrar(response, prompt)
+        registrar_uso_llamada(
+            self.model, estimar_tokens(prompt), tokens_entrada, tokens_salida,
+            etiqueta='respuesta', presupuesto=self.presupuesto, cacheados=tokens_cacheados(response)
+        )
+    
+    def construir_prompt_evaluacion(self, respuesta_generada):
+        """
+        Construye el prompt de evaluación de calidad de una respuesta
+        """
+        prompt = f"""
+        Evalúa la siguiente respuesta a un derecho de petición en una escala de 1-10 y sugiere mejoras:
+
+        RESPUESTA A EVALUAR:
+        {respuesta_generada}
+
+        CRITERIOS DE EVALUACIÓN:
+        1. Claridad y comprensibilidad (1-10)
+        2. Completitud de la respuesta (1-10)
+        3. Fundamentación legal adecuada (1-10)
+        4. Tono profesional y cordial (1-10)
+        5. Utilidad para el ciudadano (1-10)
+
+        RESPONDE EN JSON:
+        {{
+            "puntuacion_total": 0-10,
+            "evaluacion_detallada": {{
+                "claridad": 0-10,
+                "completitud": 0-10,
+                "fundamentacion_legal": 0-10,
+                "profesionalismo": 0-10,
+                "utilidad": 0-10
+            }},
+            "fortalezas": ["fortaleza 1", "fortaleza 2"],
+            "mejoras_sugeridas": ["mejora 1", "mejora 2"],
+            "recomendacion": "aceptar|revisar|rehacer"
+        }}
+        """
+        return prompt
+    
+    def interpretar_evaluacion(self, response):
+        """
+        Extrae el JSON de evaluación devuelto por el modelo (None si no hay)
+        """
+        if response and response.text:
+            json_match = re.search(r'\{.*\}', response.text, re.DOTALL)
+            if json_match:
+                return json.loads(json_match.group())
+        
+        return None
+    
     def evaluar_calidad_respuesta(self, respuesta_generada):
         """
         Evalúa la calidad de la respuesta generada y sugiere mejoras
         """
         try:
-            prompt = f"""
-            Evalúa la siguiente respuesta a un derecho de petición en una escala de 1-10 y sugiere mejoras:
-
-            RESPUESTA A EVALUAR:
-            {respuesta_generada}
-
-            CRITERIOS DE EVALUACIÓN:
-            1. Claridad y comprensibilidad (1-10)
-            2. Completitud de la respuesta (1-10)
-            3. Fundamentación legal adecuada (1-10)
-            4. Tono profesional y cordial (1-10)
-            5. Utilidad para el ciudadano (1-10)
-
-            RESPONDE EN JSON:
-            {{
-                "puntuacion_total": 0-10,
-                "evaluacion_detallada": {{
-                    "claridad": 0-10,
-                    "completitud": 0-10,
-                    "fundamentacion_legal": 0-10,
-                    "profesionalismo": 0-10,
-                    "utilidad": 0-10
-                }},
-                "fortalezas": ["fortaleza 1", "fortaleza 2"],
-                "mejoras_sugeridas": ["mejora 1", "mejora 2"],
-                "recomendacion": "aceptar|revisar|rehacer"
-            }}
-            """
-            
-            response = self.model.generate_content(prompt)
-            
-            if response and response.text:
-                import re
-                json_match = re.search(r'\{.*\}', response.text, re.DOTALL)
-                if json_match:
-                    return json.loads(json_match.group())
-            
-            return None
+            prompt = self.construir_prompt_evaluacion(respuesta_generada)
+            response = generar_contenido(
+                self.modelo_evaluacion, prompt, self.metricas, etiqueta='evaluacion', presupuesto=self.presupuesto
+            )
+            return self.interpretar_evaluacion(response)
             
         except Exception as e:
             logger.error(f"Error evaluando respuesta: {str(e)}")
-            return None
\ No newline at end of file
+            return None
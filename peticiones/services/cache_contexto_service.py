@@ -0,0 +1,173 @@
+# services/cache_contexto_service.py
+"""
+Reutilización del prefijo de los prompts con contenido en caché de Gemini.
+
+Los prompts se arman como instrucciones fijas + contexto (la transcripción de
+la petición o el texto del PDF) + la parte propia de cada llamada. Las
+instrucciones y el contexto se suben una vez como contenido en caché con un
+TTL (GEMINI_CACHE_TTL) y las siguientes llamadas sobre el mismo contexto solo
+envían su parte propia, referenciando la caché por su nombre.
+
+Si la caché no está disponible (desactivada, SDK sin ``genai.caching``,
+contexto por debajo del mínimo de la API o error al crearla o usarla) el
+prompt completo se envía en línea, con exactamente el mismo texto.
+"""
+import hashlib
+import threading
+import time
+import google.generativeai as genai
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from google.api_core import exceptions as google_exceptions
+from .modelo_ia_service import generar_contenido, agenerar_contenido, estimar_tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Margen antes del vencimiento a partir del cual un contenido en caché ya no se reutiliza
+MARGEN_VENCIMIENTO = 60
+
+# Contenidos en caché creados por este proceso: clave -> (contenido, vence_en)
+_contextos = {}
+_lock = threading.Lock()
+
+
+def prompt_en_linea(instrucciones, contexto, sufijo):
+    """Prompt completo equivalente a instrucciones + contexto en caché + sufijo"""
+    return f"{instrucciones}\n{contexto}\n{sufijo}"
+
+
+def clases_cache():
+    """
+    Retorna (CachedContent, GenerativeModel) del backend configurado, o None
+    si no soporta contenido en caché
+    """
+    if settings.GEMINI_BACKEND == 'fake':
+        from .gemini_fake_service import FakeCachedContent, FakeGenerativeModel
+        return FakeCachedContent, FakeGenerativeModel
+
+    caching = getattr(genai, 'caching', None)
+    if caching is None:
+        return None
+    return caching.CachedContent, genai.GenerativeModel
+
+
+def clave_contexto(nombre_modelo, instrucciones, contexto):
+    texto = f"{nombre_modelo}\0{instrucciones}\0{contexto}"
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def olvidar_contextos():
+    """Descarta las referencias locales y compartidas a contenidos en caché"""
+    with _lock:
+        claves = list(_contextos)
+        _contextos.clear()
+    cache.delete_many([f'contexto_ia:{clave}' for clave in claves])
+
+
+def _invalidar(clave):
+    with _lock:
+        _contextos.pop(clave, None)
+    cache.delete(f'contexto_ia:{clave}')
+
+
+def _contexto_vigente(clave, clase_contenido):
+    """
+    Contenido en caché ya creado para la clave: primero en este proceso y
+    luego en la caché de Django (compartida si el backend lo es)
+    """
+    ahora = time.time()
+    with _lock:
+        registro = _contextos.get(clave)
+    if registro and registro[1] - MARGEN_VENCIMIENTO > ahora:
+        return registro[0]
+
+    compartido = cache.get(f'contexto_ia:{clave}')
+    if compartido and compartido[1] - MARGEN_VENCIMIENTO > ahora:
+        try:
+            contenido = clase_contenido.get(compartido[0])
+        except Exception as e:
+            logger.info(f"Contenido en caché {compartido[0]} no disponible: {str(e)}")
+            return None
+        with _lock:
+            _contextos[clave] = (contenido, compartido[1])
+        return contenido
+    return None
+
+
+def obtener_contexto(modelo, instrucciones, contexto):
+    """
+    Retorna (clave, modelo ligado al contenido en caché) para el prefijo
+    instrucciones + contexto, creándolo si hace falta; o None si debe usarse el prompt en línea
+    """
+    if not settings.GEMINI_CACHE_CONTEXTO:
+        return None
+    clases = clases_cache()
+    if clases is None:
+        return None
+    clase_contenido, clase_modelo = clases
+
+    tokens = estimar_tokens(instrucciones) + estimar_tokens(contexto)
+    if tokens < settings.GEMINI_CACHE_TOKENS_MINIMOS:
+        # La API rechaza contenidos en caché por debajo del mínimo
+        return None
+
+    clave = clave_contexto(modelo.model_name, instrucciones, contexto)
+    contenido = _contexto_vigente(clave, clase_contenido)
+
+    if contenido is None:
+        ttl = settings.GEMINI_CACHE_TTL
+        try:
+            contenido = clase_contenido.create(
+                model=modelo.model_name,
+                system_instruction=instrucciones,
+                contents=[contexto],
+                ttl=ttl
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo crear el contenido en caché para {modelo.model_name}, se usa el prompt en línea: {str(e)}")
+            return None
+
+        vence_en = time.time() + ttl
+        with _lock:
+            _contextos[clave] = (contenido, vence_en)
+        cache.set(f'contexto_ia:{clave}', (contenido.name, vence_en), timeout=ttl)
+        logger.info(f"Contenido en caché {contenido.name} creado para {modelo.model_name}: ~{tokens} tokens, TTL {ttl}s")
+
+    return clave, clase_modelo.from_cached_content(contenido)
+
+
+def generar_con_contexto(modelo, instrucciones, contexto, sufijo, metricas=None, **kwargs):
+    """
+    Igual que generar_contenido, enviando instrucciones + contexto por
+    referencia a la caché cuando es posible y en línea si no
+    """
+    en_cache = obtener_contexto(modelo, instrucciones, contexto)
+    if en_cache is not None:
+        clave, modelo_cache = en_cache
+        try:
+            return generar_contenido(modelo_cache, sufijo, metricas, **kwargs)
+        except google_exceptions.NotFound:
+            # Venció o fue eliminado antes que nuestra referencia: se vuelve a crear en la próxima llamada
+            logger.warning(f"Contenido en caché de {modelo.model_name} no encontrado, se usa el prompt en línea")
+            _invalidar(clave)
+
+    return generar_contenido(modelo, prompt_en_linea(instrucciones, contexto, sufijo), metricas, **kwargs)
+
+
+async def agenerar_con_contexto(modelo, instrucciones, contexto, sufijo, metricas=None, **kwargs):
+    """
+    Versión asíncrona de generar_con_contexto
+    """
+    # Crear el contenido en caché es una llamada síncrona del SDK
+    en_cache = await sync_to_async(obtener_contexto)(modelo, instrucciones, contexto)
+    if en_cache is not None:
+        clave, modelo_cache = en_cache
+        try:
+            return await agenerar_contenido(modelo_cache, sufijo, metricas, **kwargs)
+        except google_exceptions.NotFound:
+            logger.warning(f"Contenido en caché de {modelo.model_name} no encontrado, se usa el prompt en línea")
+            _invalidar(clave)
+
+    return await agenerar_contenido(modelo, prompt_en_linea(instrucciones, contexto, sufijo), metricas, **kwargs)
@@ -0,0 +1,154 @@
+# services/carga_fragmentada_service.py
+"""
+Subida reanudable de PDF grandes por fragmentos.
+
+El navegador parte el archivo en fragmentos de CARGAS_TAMANO_FRAGMENTO bytes
+y envía cada uno con su SHA-256 (encabezado X-Checksum-SHA256); el servidor
+lo verifica y lo guarda en CARGAS_DIRECTORIO/<id>/<n>.parte. Si la conexión
+se corta, el navegador consulta qué fragmentos ya llegaron y envía solo los
+que faltan. Al completar la carga se arman los fragmentos en un archivo
+temporal (verificando el SHA-256 del archivo completo si se declaró y que
+sea un PDF válido), se guarda en el almacenamiento configurado y la
+petición se crea referenciando el id de la carga.
+
+Los fragmentos quedan en el disco local: con varias instancias de la
+aplicación CARGAS_DIRECTORIO debe ser un volumen compartido (o las
+solicitudes de una carga deben llegar a la misma instancia).
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from ..models import CargaFragmentada
+from .validacion_pdf_service import analizar_pdf
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def directorio_carga(carga):
+    return os.path.join(settings.CARGAS_DIRECTORIO, str(carga.pk))
+
+
+def ruta_fragmento(carga, indice):
+    return os.path.join(directorio_carga(carga), f'{indice}.parte')
+
+
+def iniciar_carga(usuario, nombre_archivo, tamano, sha256=''):
+    """Registra una carga nueva y retorna la CargaFragmentada"""
+    nombre_archivo = os.path.basename(nombre_archivo or '')[:255]
+    if not nombre_archivo.lower().endswith('.pdf'):
+        raise ValidationError('Solo se permiten archivos PDF.')
+    if tamano <= 0:
+        raise ValidationError('El archivo está vacío.')
+    if tamano > settings.CARGAS_TAMANO_MAXIMO:
+        raise ValidationError(
+            f'El archivo no puede ser mayor a {settings.CARGAS_TAMANO_MAXIMO // (1024 * 1024)}MB.'
+        )
+
+    carga = CargaFragmentada.objects.create(
+        usuario=usuario,
+        nombre_archivo=nombre_archivo,
+        tamano=tamano,
+        tamano_fragmento=settings.CARGAS_TAMANO_FRAGMENTO,
+        sha256=(sha256 or '').lower(),
+    )
+    os.makedirs(directorio_carga(carga), exist_ok=True)
+    logger.info(f"Carga {carga.pk} iniciada: {nombre_archivo} ({tamano} bytes)")
+    return carga
+
+
+def fragmentos_recibidos(carga):
+    """Índices de los fragmentos que ya están en disco, ordenados"""
+    try:
+        archivos = os.listdir(directorio_carga(carga))
+    except FileNotFoundError:
+        return []
+    return sorted(
+        int(archivo[:-len('.parte')]) for archivo in archivos
+        if archivo.endswith('.parte') and archivo[:-len('.parte')].isdigit()
+    )
+
+
+def guardar_fragmento(carga, indice, datos, sha256):
+    """
+    Verifica y guarda un fragmento. Reenviar un fragmento ya recibido lo
+    reemplaza, así un reintento tras una respuesta perdida no hace daño.
+    """
+    if carga.estado != 'en_curso':
+        raise ValidationError('La carga ya fue completada.')
+    if not 0 <= indice < carga.total_fragmentos:
+        raise ValidationError(f'Fragmento {indice} fuera de rango.')
+    if len(datos) != carga.tamano_esperado(indice):
+        raise ValidationError(
+            f'El fragmento {indice} debe tener {carga.tamano_esperado(indice)} bytes y llegaron {len(datos)}.'
+        )
+    if not sha256 or hashlib.sha256(datos).hexdigest() != sha256.lower():
+        raise ValidationError(f'El checksum del fragmento {indice} no coincide.')
+
+    # Temporal + renombrado: un fragmento a medio escribir nunca cuenta como recibido
+    directorio = directorio_carga(carga)
+    os.makedirs(directorio, exist_ok=True)
+    temporal = os.path.join(directorio, f'{indice}.{uuid.uuid4().hex}.tmp')
+    with open(temporal, 'wb') as archivo:
+        archivo.write(datos)
+    os.replace(temporal, ruta_fragmento(carga, indice))
+
+
+def completar_carga(carga):
+    """
+    Arma el archivo con todos los fragmentos, verifica su SHA-256 y lo guarda
+    en el almacenamiento. Retorna la carga con ``archivo`` asignado.
+    """
+    if carga.estado == 'completada':
+        return carga
+    if carga.estado != 'en_curso':
+        raise ValidationError('La carga ya fue usada.')
+
+    recibidos = set(fragmentos_recibidos(carga))
+    faltantes = [indice for indice in range(carga.total_fragmentos) if indice not in recibidos]
+    if faltantes:
+        raise ValidationError(f'Faltan {len(faltantes)} fragmentos.')
+
+    sha256 = hashlib.sha256()
+    with tempfile.TemporaryFile(dir=settings.CARGAS_DIRECTORIO) as armado:
+        for indice in range(carga.total_fragmentos):
+            with open(ruta_fragmento(carga, indice), 'rb') as fragmento:
+                for bloque in iter(lambda: fragmento.read(64 * 1024), b''):
+                    sha256.update(bloque)
+                    armado.write(bloque)
+
+        if carga.sha256 and sha256.hexdigest() != carga.sha256:
+            raise ValidationError('El checksum del archivo completo no coincide.')
+
+        # Se valida antes de subirlo al almacenamiento; los metadatos pasan a la petición
+        carga.metadatos_pdf = analizar_pdf(armado)
+        carga.archivo = default_storage.save(f'peticiones/{carga.nombre_archivo}', File(armado, carga.nombre_archivo))
+
+    carga.sha256 = sha256.hexdigest()
+    carga.estado = 'completada'
+    carga.save(update_fields=['archivo', 'sha256', 'estado', 'metadatos_pdf'])
+    shutil.rmtree(directorio_carga(carga), ignore_errors=True)
+    logger.info(f"Carga {carga.pk} completada: {carga.archivo}")
+    return carga
+
+
+def limpiar_cargas_vencidas():
+    """
+    Borra las cargas con más de CARGAS_VIGENCIA_HORAS y sus fragmentos. Los
+    archivos armados que no llegaron a una petición los borra después
+    limpiar_archivos_huerfanos. Retorna cuántas cargas se borraron.
+    """
+    limite = timezone.now() - timedelta(hours=settings.CARGAS_VIGENCIA_HORAS)
+    vencidas = list(CargaFragmentada.objects.filter(fecha_creacion__lt=limite))
+    for carga in vencidas:
+        shutil.rmtree(directorio_carga(carga), ignore_errors=True)
+    CargaFragmentada.objects.filter(pk__in=[carga.pk for carga in vencidas]).delete()
+    return len(vencidas)
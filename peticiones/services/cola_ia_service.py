@@ -0,0 +1,203 @@
+# services/cola_ia_service.py
+"""
+Cola de trabajos de IA ordenada por urgencia.
+
+La prioridad de cada trabajo son los días hábiles que le quedan a la petición
+antes de su fecha de vencimiento (menos es más urgente). Los trabajos masivos
+(lotes de reprocesamiento) suman COLA_IA_PENALIZACION_MASIVO días, así que las
+cargas interactivas pasan adelante. Para que nada espere indefinidamente, cada
+COLA_IA_ENVEJECIMIENTO segundos de espera restan un día.
+
+Como el envejecimiento avanza igual para todos los trabajos, el orden
+``prioridad - espera / envejecimiento`` equivale a ordenar por
+``prioridad + momento_encolado / envejecimiento``, que no cambia en el tiempo:
+basta un heap.
+
+Hay una cola por proceso, atendida por COLA_IA_WORKERS hilos.
+"""
+from collections import deque
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .dias_habiles_service import DiasHabilesService
+from .metricas_ia_service import percentil
+import heapq
+import itertools
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (nivel, máximo de días hábiles restantes); el último nivel no tiene máximo
+NIVELES = [
+    ('critica', 1),
+    ('alta', 3),
+    ('media', 7),
+    ('baja', None),
+]
+
+ORIGENES = ('interactivo', 'masivo')
+
+# Esperas recientes que se conservan por nivel para las estadísticas
+MUESTRAS_ESPERA = 200
+
+
+def dias_habiles_restantes(peticion, hoy=None):
+    """
+    Días hábiles entre hoy y el vencimiento de la petición (negativo si ya venció)
+    """
+    if not peticion.fecha_vencimiento:
+        return 15
+    hoy = hoy or timezone.localdate()
+    if peticion.fecha_vencimiento >= hoy:
+        return DiasHabilesService.contar_dias_habiles_entre_fechas(hoy, peticion.fecha_vencimiento)
+    return -DiasHabilesService.contar_dias_habiles_entre_fechas(peticion.fecha_vencimiento, hoy)
+
+
+def redondear(segundos):
+    return round(segundos, 1) if segundos is not None else None
+
+
+def nivel_prioridad(dias_restantes):
+    for nivel, maximo in NIVELES:
+        if maximo is None or dias_restantes <= maximo:
+            return nivel
+
+
+class TrabajoIA:
+    def __init__(self, funcion, args, radicado, nivel, origen, dias_restantes):
+        self.funcion = funcion
+        self.args = args
+        self.radicado = radicado
+        self.nivel = nivel
+        self.origen = origen
+        self.dias_restantes = dias_restantes
+        self.encolado = time.time()
+        self.futuro = Future()
+
+
+class ColaIA:
+    """
+    Cola de prioridad con hilos trabajadores; ``encolar`` retorna un Future
+    con el resultado del trabajo
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or settings.COLA_IA_WORKERS
+        self.heap = []
+        self.secuencia = itertools.count()
+        self.condicion = threading.Condition()
+        self.hilos = []
+        self.en_proceso = {nivel: 0 for nivel, _ in NIVELES}
+        self.completados = {nivel: 0 for nivel, _ in NIVELES}
+        self.esperas = {nivel: deque(maxlen=MUESTRAS_ESPERA) for nivel, _ in NIVELES}
+
+    def clave(self, dias_restantes, origen, encolado):
+        prioridad = dias_restantes
+        if origen == 'masivo':
+            prioridad += settings.COLA_IA_PENALIZACION_MASIVO
+        return prioridad + encolado / settings.COLA_IA_ENVEJECIMIENTO
+
+    def encolar(self, peticion, funcion, *args, origen='interactivo', iniciar=True):
+        """
+        Agrega ``funcion(*args)`` a la cola con la prioridad de la petición
+        """
+        if origen not in ORIGENES:
+            raise ValueError(f"Origen de trabajo IA inválido: {origen}")
+
+        dias = dias_habiles_restantes(peticion)
+        trabajo = TrabajoIA(funcion, args, peticion.radicado, nivel_prioridad(dias), origen, dias)
+
+        with self.condicion:
+            heapq.heappush(self.heap, (self.clave(dias, origen, trabajo.encolado), next(self.secuencia), trabajo))
+            self.condicion.notify()
+            if iniciar:
+                self._iniciar_hilos()
+
+        logger.info(
+            f"Trabajo IA encolado: {peticion.radicado} ({origen}, {dias} días hábiles, "
+            f"prioridad {trabajo.nivel}, {len(self.heap)} en cola)"
+        )
+        return trabajo.futuro
+
+    def _iniciar_hilos(self):
+        self.hilos = [hilo for hilo in self.hilos if hilo.is_alive()]
+        while len(self.hilos) < self.workers:
+            hilo = threading.Thread(target=self._atender, name=f'cola-ia-{len(self.hilos) + 1}')
+            hilo.daemon = True
+            hilo.start()
+            self.hilos.append(hilo)
+
+    def tomar_siguiente(self, bloquear=True):
+        """
+        Saca el trabajo más prioritario (None si no hay y no se bloquea);
+        los trabajos cancelados se descartan
+        """
+        with self.condicion:
+            while True:
+                while not self.heap:
+                    if not bloquear:
+                        return None
+                    self.condicion.wait()
+                _, _, trabajo = heapq.heappop(self.heap)
+                if trabajo.futuro.set_running_or_notify_cancel():
+                    self.en_proceso[trabajo.nivel] += 1
+                    self.esperas[trabajo.nivel].append(time.time() - trabajo.encolado)
+                    return trabajo
+
+    def ejecutar(self, trabajo):
+        try:
+            trabajo.futuro.set_result(trabajo.funcion(*trabajo.args))
+        except BaseException as e:
+            logger.error(f"Error en trabajo IA de {trabajo.radicado}: {str(e)}")
+            trabajo.futuro.set_exception(e)
+        finally:
+            with self.condicion:
+                self.en_proceso[trabajo.nivel] -= 1
+                self.completados[trabajo.nivel] += 1
+
+    def _atender(self):
+        while True:
+            trabajo = self.tomar_siguiente()
+            try:
+                self.ejecutar(trabajo)
+            finally:
+                # Los hilos de la cola no pasan por el ciclo de petición de Django
+                connection.close()
+
+    def estadisticas(self):
+        """
+        Profundidad de la cola y tiempos de espera (segundos) por nivel de
+        prioridad y origen, para este proceso
+        """
+        ahora = time.time()
+        with self.condicion:
+            en_cola = [trabajo for _, _, trabajo in self.heap if not trabajo.futuro.cancelled()]
+            niveles = {}
+            for nivel, maximo in NIVELES:
+                trabajos = [trabajo for trabajo in en_cola if trabajo.nivel == nivel]
+                esperas = sorted(self.esperas[nivel])
+                niveles[nivel] = {
+                    'dias_habiles_maximos': maximo,
+                    'en_cola': len(trabajos),
+                    'en_cola_por_origen': {
+                        origen: sum(1 for trabajo in trabajos if trabajo.origen == origen) for origen in ORIGENES
+                    },
+                    'en_proceso': self.en_proceso[nivel],
+                    'completados': self.completados[nivel],
+                    'espera_actual_maxima': round(max((ahora - t.encolado for t in trabajos), default=0), 1),
+                    'espera_p50': redondear(percentil(esperas, 50)),
+                    'espera_p95': redondear(percentil(esperas, 95)),
+                }
+
+        return {
+            'workers': self.workers,
+            'en_cola': len(en_cola),
+            'niveles': niveles,
+        }
+
+
+# Una cola por proceso
+cola_ia = ColaIA()
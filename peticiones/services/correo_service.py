@@ -0,0 +1,176 @@
+# services/correo_service.py
+"""
+Envío de correos en segundo plano con bandeja de salida (CorreoSaliente).
+
+Las vistas solo guardan el correo y retornan: el saludo SMTP con Gmail tarda
+de medio segundo a varios y no debe bloquear la respuesta. Un hilo remitente
+por proceso toma los correos pendientes de a CORREO_LOTE y los envía por una
+sola conexión SMTP. Si un envío falla se reintenta con espera exponencial
+(CORREO_ESPERA_REINTENTO, el doble en cada intento) hasta CORREO_MAX_INTENTOS.
+
+Cada correo se toma con una actualización condicional que lo deja
+'enviando' por CORREO_BLOQUEO_SEGUNDOS: varios procesos (o el comando
+enviar_correos) no envían el mismo correo dos veces, y si un proceso muere a
+mitad de envío el correo vuelve a quedar disponible al vencer ese plazo.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+from ..models import CorreoSaliente
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def encolar_correo(asunto, mensaje, destinatarios, remitente=None, despertar=True):
+    """
+    Guarda el correo en la bandeja de salida y despierta al remitente cuando
+    se confirme la transacción. Retorna el CorreoSaliente.
+
+    Con ``despertar=False`` el correo solo queda encolado: para quien encola
+    muchos y los envía después con enviar_pendientes (p. ej. un comando).
+    """
+    correo = CorreoSaliente.objects.create(
+        asunto=asunto,
+        cuerpo=mensaje,
+        remitente=remitente or settings.DEFAULT_FROM_EMAIL,
+        destinatarios=list(destinatarios),
+    )
+    if despertar:
+        transaction.on_commit(remitente_correo.despertar)
+    return correo
+
+
+def correos_disponibles(ahora):
+    """Pendientes cuyo reintento ya toca, y 'enviando' cuyo plazo venció (proceso caído)"""
+    return CorreoSaliente.objects.filter(estado__in=['pendiente', 'enviando'], proximo_intento__lte=ahora)
+
+
+def tomar_correos(limite):
+    """Marca como 'enviando' hasta ``limite`` correos disponibles y los retorna"""
+    ahora = timezone.now()
+    candidatos = correos_disponibles(ahora).order_by('proximo_intento').values_list('pk', flat=True)[:limite]
+    plazo = ahora + timedelta(seconds=settings.CORREO_BLOQUEO_SEGUNDOS)
+    tomados = [
+        pk for pk in list(candidatos)
+        if correos_disponibles(ahora).filter(pk=pk).update(estado='enviando', proximo_intento=plazo)
+    ]
+    return list(CorreoSaliente.objects.filter(pk__in=tomados).order_by('pk'))
+
+
+def registrar_envio(correo):
+    correo.estado = 'enviado'
+    correo.fecha_envio = timezone.now()
+    correo.intentos += 1
+    # El cuerpo puede llevar credenciales: no se guarda después de enviado
+    correo.cuerpo = ''
+    correo.ultimo_error = ''
+    correo.save(update_fields=['estado', 'fecha_envio', 'intentos', 'cuerpo', 'ultimo_error'])
+
+
+def registrar_fallo(correo, error):
+    correo.intentos += 1
+    correo.ultimo_error = str(error)[:1000]
+    if correo.intentos >= settings.CORREO_MAX_INTENTOS:
+        correo.estado = 'error'
+        logger.error(f"Correo {correo.pk} descartado tras {correo.intentos} intentos: {str(error)}")
+    else:
+        espera = settings.CORREO_ESPERA_REINTENTO * 2 ** (correo.intentos - 1)
+        correo.estado = 'pendiente'
+        correo.proximo_intento = timezone.now() + timedelta(seconds=espera)
+        logger.warning(f"Error enviando correo {correo.pk} (intento {correo.intentos}), reintento en {espera}s: {str(error)}")
+    correo.save(update_fields=['estado', 'intentos', 'ultimo_error', 'proximo_intento'])
+
+
+def enviar_pendientes(limite=None):
+    """
+    Envía un lote de correos disponibles por una sola conexión SMTP.
+    Retorna (enviados, fallidos).
+    """
+    correos = tomar_correos(limite or settings.CORREO_LOTE)
+    if not correos:
+        return 0, 0
+
+    conexion = get_connection(fail_silently=False)
+    try:
+        conexion.open()
+    except Exception as e:
+        for correo in correos:
+            registrar_fallo(correo, e)
+        return 0, len(correos)
+
+    enviados, fallidos = 0, 0
+    try:
+        for correo in correos:
+            mensaje = EmailMessage(
+                correo.asunto, correo.cuerpo, correo.remitente, correo.destinatarios, connection=conexion
+            )
+            try:
+                mensaje.send()
+            except Exception as e:
+                registrar_fallo(correo, e)
+                fallidos += 1
+                # La conexión pudo quedar inservible (p. ej. el servidor la cerró): se abre otra
+                conexion.close()
+                try:
+                    conexion.open()
+                except Exception:
+                    pass
+            else:
+                registrar_envio(correo)
+                enviados += 1
+    finally:
+        conexion.close()
+
+    logger.info(f"Lote de correos: {enviados} enviados, {fallidos} con error")
+    return enviados, fallidos
+
+
+def segundos_hasta_proximo():
+    """Segundos hasta el próximo correo por intentar, o None si no hay pendientes"""
+    proximo = CorreoSaliente.objects.filter(estado__in=['pendiente', 'enviando']).order_by('proximo_intento').values_list(
+        'proximo_intento', flat=True).first()
+    if proximo is None:
+        return None
+    return max(0.0, (proximo - timezone.now()).total_seconds())
+
+
+class RemitenteCorreo:
+    """
+    Hilo que vacía la bandeja de salida; duerme hasta que se encola un correo
+    o hasta que toca el siguiente reintento
+    """
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.candado = threading.Lock()
+        self.hilo = None
+
+    def despertar(self):
+        with self.candado:
+            if self.hilo is None or not self.hilo.is_alive():
+                self.hilo = threading.Thread(target=self._atender, name='remitente-correo', daemon=True)
+                self.hilo.start()
+        self.evento.set()
+
+    def _atender(self):
+        while True:
+            self.evento.clear()
+            try:
+                enviados, fallidos = enviar_pendientes()
+                # Lote completo: puede haber más esperando
+                espera = 0 if enviados + fallidos >= settings.CORREO_LOTE else segundos_hasta_proximo()
+            except Exception as e:
+                logger.error(f"Error en el remitente de correos: {str(e)}")
+                espera = settings.CORREO_ESPERA_REINTENTO
+            finally:
+                # El hilo no pasa por el ciclo de petición de Django
+                connection.close()
+            self.evento.wait(espera)
+
+
+# Un remitente por proceso
+remitente_correo = RemitenteCorreo()
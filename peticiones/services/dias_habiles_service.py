@@ -235,3 +235,53 @@ class DiasHabilesService:
             return dia_no_habil.descripcion
         
         return "Día hábil"
+
+
+class CalendarioHabil:
+    """
+    Días hábiles de un rango de fechas precalculados, para cálculos masivos:
+    una sola consulta de días no hábiles al crearlo y luego cada conteo es
+    O(1) y sin consultas (DiasHabilesService consulta la base de datos por
+    cada día).
+    
+    Usa las mismas reglas que DiasHabilesService.es_dia_habil.
+    """
+    
+    def __init__(self, desde, hasta):
+        self.desde = desde
+        self.hasta = hasta
+        
+        no_habiles = set(
+            DiaNoHabil.objects.filter(fecha__range=(desde, hasta), activo=True).values_list('fecha', flat=True)
+        )
+        for año in range(desde.year, hasta.year + 1):
+            no_habiles.update(date(año, mes, dia) for mes, dia in DiasHabilesService.FESTIVOS_FIJOS)
+            no_habiles.update(DiasHabilesService.obtener_festivos_movibles(año))
+            no_habiles.update(DiasHabilesService.calcular_semana_santa(año))
+        
+        # acumulados[i]: días hábiles entre desde (sin incluirla) y desde + i
+        self.acumulados = [0]
+        for dias in range(1, (hasta - desde).days + 1):
+            fecha = desde + timedelta(days=dias)
+            es_habil = fecha.weekday() < 5 and fecha not in no_habiles
+            self.acumulados.append(self.acumulados[-1] + es_habil)
+    
+    def indice(self, fecha):
+        if not self.desde <= fecha <= self.hasta:
+            raise ValueError(f"La fecha {fecha} está fuera del calendario ({self.desde} a {self.hasta})")
+        return (fecha - self.desde).days
+    
+    def contar_dias_habiles_entre_fechas(self, fecha_inicio, fecha_fin):
+        """Igual que DiasHabilesService.contar_dias_habiles_entre_fechas (sin incluir fecha_inicio)"""
+        if fecha_fin <= fecha_inicio:
+            return 0
+        return self.acumulados[self.indice(fecha_fin)] - self.acumulados[self.indice(fecha_inicio)]
+    
+    def dias_habiles_restantes(self, hoy, fecha_vencimiento):
+        """
+        Días hábiles de hoy al vencimiento; negativo si ya venció (al menos -1,
+        aunque hoy no sea día hábil, p. ej. un sábado con vencimiento el viernes)
+        """
+        if fecha_vencimiento >= hoy:
+            return self.contar_dias_habiles_entre_fechas(hoy, fecha_vencimiento)
+        return -max(1, self.contar_dias_habiles_entre_fechas(fecha_vencimiento, hoy))
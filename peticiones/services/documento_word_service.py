@@ -0,0 +1,274 @@
+# services/documento_word_service.py
+"""
+Generación del documento Word (.docx) de respuesta a partir de la plantilla
+institucional ``plantillas_word/plantilla_respuesta_peticion.docx``
+
+La plantilla se lee e indexa una vez por proceso: se guarda la posición de
+cada marcador ({{CIUDAD}}, {{FECHA}}...) en el cuerpo, tablas, encabezados y
+pies de página, aunque Word lo haya partido en varios runs. Cada documento es
+una copia de la plantilla ya leída en la que solo se tocan esos runs. La
+plantilla se vuelve a leer si cambia la fecha de modificación del archivo.
+"""
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from datetime import datetime
+from docx import Document
+from docx.oxml.ns import qn
+from docx.text.run import Run
+import copy
+import io
+import itertools
+import os
+import re
+import threading
+import zipfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Nombres de los meses en español (independiente del locale del sistema)
+MESES_ESPANOL = {
+    1: 'enero', 2: 'febrero', 3: 'marzo', 4: 'abril',
+    5: 'mayo', 6: 'junio', 7: 'julio', 8: 'agosto',
+    9: 'septiembre', 10: 'octubre', 11: 'noviembre', 12: 'diciembre'
+}
+
+CONTENT_TYPE_DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+MARCADOR = re.compile(r'\{\{[A-Z_]+\}\}')
+
+# Partes del .docx con texto: cuerpo (incluye tablas), encabezados y pies de página
+PARTES_CON_TEXTO = ('document.main+xml', 'header+xml', 'footer+xml')
+
+
+def partes_con_texto(documento):
+    """Elemento XML raíz de cada parte con texto, por nombre de parte"""
+    return {
+        str(parte.partname): parte.element
+        for parte in documento.part.package.iter_parts()
+        if parte.content_type.endswith(PARTES_CON_TEXTO)
+    }
+
+
+def runs_de_parrafo(parrafo):
+    """
+    Runs del párrafo (w:p), incluidos los de hipervínculos, sin los de
+    párrafos anidados (cuadros de texto)
+    """
+    return [
+        Run(run, None) for run in parrafo.iter(qn('w:r'))
+        if next(run.iterancestors(qn('w:p'))) is parrafo
+    ]
+
+
+class PlantillaIndexada:
+    """
+    Plantilla leída una vez con la ubicación de sus marcadores:
+    ``marcadores[(parte, indice_parrafo)]`` es una lista de
+    (marcador, [(indice_run, inicio, fin), ...]) en orden de aparición
+    """
+
+    def __init__(self, ruta):
+        self.mtime = os.path.getmtime(ruta)
+        self.documento = Document(ruta)
+        self.marcadores = {}
+
+        for parte, elemento in partes_con_texto(self.documento).items():
+            for indice_parrafo, parrafo in enumerate(elemento.iter(qn('w:p'))):
+                textos = [run.text for run in runs_de_parrafo(parrafo)]
+                encontrados = [
+                    (marcador.group(), self.ubicar(textos, marcador.start(), marcador.end()))
+                    for marcador in MARCADOR.finditer(''.join(textos))
+                ]
+                if encontrados:
+                    self.marcadores[(parte, indice_parrafo)] = encontrados
+
+    @staticmethod
+    def ubicar(textos, inicio, fin):
+        """Tramos (indice_run, inicio, fin) que ocupa [inicio, fin) del texto del párrafo"""
+        tramos = []
+        desplazamiento = 0
+        for indice, texto in enumerate(textos):
+            desde, hasta = max(inicio, desplazamiento), min(fin, desplazamiento + len(texto))
+            if desde < hasta:
+                tramos.append((indice, desde - desplazamiento, hasta - desplazamiento))
+            desplazamiento += len(texto)
+        return tramos
+
+    def rellenar(self, reemplazos):
+        """
+        Copia de la plantilla con los marcadores reemplazados. El valor queda
+        en el primer run del marcador, con su formato; el resto del marcador
+        se borra de los demás runs.
+        """
+        documento = copy.deepcopy(self.documento)
+        partes = partes_con_texto(documento)
+        parrafos = {}
+
+        for (parte, indice_parrafo), encontrados in self.marcadores.items():
+            if parte not in parrafos:
+                parrafos[parte] = list(partes[parte].iter(qn('w:p')))
+            runs = runs_de_parrafo(parrafos[parte][indice_parrafo])
+            textos = [run.text for run in runs]
+
+            # De atrás hacia adelante, para no correr las posiciones de los marcadores anteriores
+            for marcador, tramos in reversed(encontrados):
+                if marcador not in reemplazos:
+                    continue
+                for posicion, (indice, inicio, fin) in reversed(list(enumerate(tramos))):
+                    valor = reemplazos[marcador] if posicion == 0 else ''
+                    textos[indice] = textos[indice][:inicio] + valor + textos[indice][fin:]
+
+            for run, texto in zip(runs, textos):
+                if run.text != texto:
+                    run.text = texto
+
+        return documento
+
+
+# Plantillas indexadas en este proceso, por ruta
+_plantillas = {}
+_lock = threading.Lock()
+
+
+def obtener_plantilla(ruta):
+    """
+    Plantilla indexada de la ruta, leyéndola de nuevo si el archivo cambió
+    """
+    mtime = os.path.getmtime(ruta)
+    with _lock:
+        plantilla = _plantillas.get(ruta)
+        if plantilla is None or plantilla.mtime != mtime:
+            plantilla = PlantillaIndexada(ruta)
+            _plantillas[ruta] = plantilla
+            total = sum(len(encontrados) for encontrados in plantilla.marcadores.values())
+            logger.info(f"Plantilla Word cargada: {os.path.basename(ruta)} con {total} marcadores")
+        return plantilla
+
+
+class DocumentoWordService:
+
+    def __init__(self):
+        self.plantilla_path = os.path.join(settings.BASE_DIR, 'plantillas_word', 'plantilla_respuesta_peticion.docx')
+
+    def construir_reemplazos(self, peticion, contenido_respuesta, usuario):
+        """
+        Diccionario de marcadores de la plantilla y su valor
+        """
+        # Obtener ciudad de la dependencia, o usar valor por defecto
+        if usuario.dependencia and usuario.dependencia.ciudad:
+            ciudad = usuario.dependencia.ciudad
+        else:
+            ciudad = 'Ciudad'
+
+        fecha_actual = datetime.now()
+        fecha_formateada = f"{fecha_actual.day} de {MESES_ESPANOL[fecha_actual.month]} de {fecha_actual.year}"
+
+        return {
+            '{{CIUDAD}}': ciudad,
+            '{{FECHA}}': fecha_formateada,
+            '{{NOMBRE_PETICIONARIO}}': peticion.peticionario_nombre or 'Ciudadano(a)',
+            '{{DIRECCION_PETICIONARIO}}': peticion.peticionario_direccion or 'Dirección no especificada',
+            '{{RADICADO}}': peticion.radicado,
+            '{{CUERPO_RESPUESTA}}': contenido_respuesta,
+            '{{NOMBRE_FUNCIONARIO}}': usuario.nombre_completo,
+            '{{CARGO_FUNCIONARIO}}': usuario.cargo
+        }
+
+    def generar(self, peticion, contenido_respuesta, usuario):
+        """
+        Genera el documento de respuesta y retorna su contenido en bytes
+        """
+        if not os.path.exists(self.plantilla_path):
+            raise ValidationError('No se encontró la plantilla de Word. Por favor contacte al administrador.')
+
+        reemplazos = self.construir_reemplazos(peticion, contenido_respuesta, usuario)
+        doc = obtener_plantilla(self.plantilla_path).rellenar(reemplazos)
+
+        # Guardar documento en memoria
+        file_stream = io.BytesIO()
+        doc.save(file_stream)
+        return file_stream.getvalue()
+
+    @staticmethod
+    def nombre_archivo(peticion, version=None):
+        sufijo = f'_v{version}' if version else ''
+        return f'Respuesta_{peticion.radicado}{sufijo}_{datetime.now().strftime("%Y%m%d")}.docx'
+
+    def generar_lote(self, documentos, usuario, workers=None):
+        """
+        Genera los documentos de ``documentos`` (tuplas peticion, contenido,
+        version) con hasta ``workers`` hilos y los entrega a medida que terminan
+        como (peticion, nombre_archivo, bytes o None, error o None).
+        
+        Solo se adelantan unos pocos documentos por hilo, así que la memoria no
+        crece con el tamaño del lote. Las peticiones y el usuario deben venir
+        con sus relaciones cargadas: los hilos no consultan la base de datos.
+        """
+        workers = max(1, workers or settings.WORD_LOTE_WORKERS)
+
+        def generar_uno(peticion, contenido, version):
+            nombre = self.nombre_archivo(peticion, version)
+            try:
+                return peticion, nombre, self.generar(peticion, contenido, usuario), None
+            except Exception as e:
+                logger.error(f"Error generando documento Word para {peticion.radicado} v{version}: {str(e)}")
+                return peticion, nombre, None, str(e)
+
+        documentos = iter(documentos)
+        if workers == 1:
+            for documento in documentos:
+                yield generar_uno(*documento)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        en_curso = set()
+        try:
+            while True:
+                for documento in itertools.islice(documentos, 2 * workers - len(en_curso)):
+                    en_curso.add(executor.submit(generar_uno, *documento))
+                if not en_curso:
+                    break
+                listos, en_curso = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in listos:
+                    yield futuro.result()
+        finally:
+            # Si el cliente corta la descarga no se generan los que faltan
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SalidaZip:
+    """
+    Destino de escritura sin seek para zipfile: acumula lo escrito hasta que
+    se retira con ``vaciar``
+    """
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def zip_en_stream(archivos):
+    """
+    Arma un ZIP con los (nombre, bytes) de ``archivos`` y lo entrega por
+    partes a medida que se agrega cada archivo, sin tener el ZIP completo en
+    memoria. Los .docx ya vienen comprimidos, así que se guardan sin comprimir.
+    """
+    salida = SalidaZip()
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_STORED) as archivo_zip:
+        for nombre, contenido in archivos:
+            archivo_zip.writestr(nombre, contenido)
+            yield salida.vaciar()
+    yield salida.vaciar()
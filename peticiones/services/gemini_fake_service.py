@@ -0,0 +1,387 @@
+# services/gemini_fake_service.py
+"""
+Sustituto local de la API de Gemini para pruebas y mediciones de rendimiento.
+
+Imita la interfaz de ``google.generativeai.GenerativeModel`` que usa el sistema
+(``generate_content``, ``generate_content_async``, incluido ``stream=True``,
+``count_tokens`` y el contenido en caché de ``genai.caching``) sin hacer
+llamadas de red:
+- Devuelve transcripciones y JSON predefinidos según el tipo de prompt
+- Inyecta latencia configurable por llamada (y entre fragmentos con stream=True)
+- Inyecta errores 500 y 429 (cuota agotada) con la misma excepción que el SDK real
+- Cuenta los tokens de entrada y salida de cada llamada, y cuántos vinieron de caché
+
+Se activa con ``GEMINI_BACKEND=fake`` (ver settings.py).
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+from google.api_core import exceptions as google_exceptions
+
+from .modelo_ia_service import estimar_tokens
+
+
+class ContadorTokens:
+    """
+    Acumulador de uso compartido por todos los modelos simulados del proceso
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reiniciar()
+
+    def reiniciar(self):
+        with self._lock:
+            self.llamadas = 0
+            self.tokens_entrada = 0
+            self.tokens_salida = 0
+            self.tokens_cacheados = 0
+            self.contextos_creados = 0
+            self.errores = 0
+            self.errores_429 = 0
+            self.por_modelo = {}
+
+    def registrar(self, modelo, tokens_entrada, tokens_salida, tokens_cacheados=0):
+        with self._lock:
+            self.llamadas += 1
+            self.tokens_entrada += tokens_entrada
+            self.tokens_salida += tokens_salida
+            self.tokens_cacheados += tokens_cacheados
+            uso = self.por_modelo.setdefault(modelo, {'llamadas': 0, 'tokens_entrada': 0, 'tokens_salida': 0})
+            uso['llamadas'] += 1
+            uso['tokens_entrada'] += tokens_entrada
+            uso['tokens_salida'] += tokens_salida
+
+    def registrar_contexto(self):
+        with self._lock:
+            self.contextos_creados += 1
+
+    def registrar_error(self, es_429=False):
+        with self._lock:
+            if es_429:
+                self.errores_429 += 1
+            else:
+                self.errores += 1
+
+    def resumen(self):
+        with self._lock:
+            return {
+                'llamadas': self.llamadas,
+                'tokens_entrada': self.tokens_entrada,
+                'tokens_salida': self.tokens_salida,
+                'tokens_cacheados': self.tokens_cacheados,
+                'contextos_creados': self.contextos_creados,
+                'errores': self.errores,
+                'errores_429': self.errores_429,
+                'por_modelo': {modelo: dict(uso) for modelo, uso in self.por_modelo.items()},
+            }
+
+
+contador = ContadorTokens()
+
+# Generador aleatorio compartido para que la secuencia de errores sea reproducible
+_aleatorio = random.Random(getattr(settings, 'GEMINI_FAKE_SEMILLA', 0))
+_aleatorio_lock = threading.Lock()
+
+
+def reiniciar(semilla=None):
+    """Reinicia el contador de tokens, los contenidos en caché y la secuencia de errores simulados"""
+    contador.reiniciar()
+    FakeCachedContent.eliminar_todos()
+    with _aleatorio_lock:
+        _aleatorio.seed(settings.GEMINI_FAKE_SEMILLA if semilla is None else semilla)
+
+
+def _sortear():
+    with _aleatorio_lock:
+        return _aleatorio.random()
+
+
+# ========================================
+# RESPUESTAS PREDEFINIDAS
+# ========================================
+
+def _respuesta_transcripcion(prompt):
+    match = re.search(r'TEXTO EXTRAÍDO DEL PDF:\s*(.*?)\s*INSTRUCCIONES DE TRANSCRIPCIÓN\s*:', prompt, re.DOTALL)
+    texto = match.group(1) if match else ''
+    # Simular limpieza: quitar marcas de página y espacios repetidos
+    texto = re.sub(r'--- PÁGINA \d+ ---', '', texto)
+    texto = re.sub(r'[ \t]+', ' ', texto)
+    texto = re.sub(r'\n\s*\n+', '\n\n', texto).strip()
+    return texto or 'Transcripción simulada del derecho de petición.'
+
+
+def _respuesta_datos_peticionario(prompt):
+    correo = re.search(r'[\w.+-]+@[\w-]+\.[\w.]+', prompt.split('TEXTO EXTRAÍDO DEL PDF:')[-1])
+    return json.dumps({
+        'nombre': 'Peticionario de Prueba',
+        'documento': 'NO_ENCONTRADO',
+        'telefono': 'NO_ENCONTRADO',
+        'correo': correo.group() if correo else 'NO_ENCONTRADO',
+        'direccion': 'NO_ENCONTRADO',
+    }, ensure_ascii=False)
+
+
+def _respuesta_analisis(prompt):
+    return json.dumps({
+        'resumen_peticion': 'El peticionario solicita información a la administración municipal.',
+        'aspectos_clave': ['Solicitud de información', 'Competencia municipal'],
+        'preguntas': [
+            {'pregunta': '¿Qué dependencia tiene a cargo el asunto solicitado?'},
+            {'pregunta': '¿Desea agregar información relevante para el contexto de la respuesta?'},
+        ],
+        'urgencia': 'media',
+        'competencia_municipal': 'sí',
+    }, ensure_ascii=False)
+
+
+def _respuesta_evaluacion(prompt):
+    return json.dumps({
+        'puntuacion_total': 8,
+        'evaluacion_detallada': {
+            'claridad': 8,
+            'completitud': 8,
+            'fundamentacion_legal': 7,
+            'profesionalismo': 9,
+            'utilidad': 8,
+        },
+        'fortalezas': ['Responde todos los puntos', 'Tono respetuoso'],
+        'mejoras_sugeridas': ['Citar la norma específica aplicable'],
+        'recomendacion': 'aceptar',
+    }, ensure_ascii=False)
+
+
+def _respuesta_resumen(prompt):
+    match = re.search(r'PETICIÓN A CONDENSAR:\s*(.*?)\s*RESUMEN CONDENSADO\s*:', prompt, re.DOTALL)
+    palabras = (match.group(1) if match else '').split()
+    # Simular la condensación: conservar las primeras palabras
+    return ' '.join(palabras[:150]) or 'Resumen simulado del derecho de petición.'
+
+
+def _respuesta_sugerida(prompt):
+    return (
+        'Respetado(a) peticionario(a):\n\n'
+        'En atención a su derecho de petición, de conformidad con el artículo 23 de la '
+        'Constitución Política y la Ley 1755 de 2015, nos permitimos dar respuesta en los '
+        'siguientes términos.\n\n'
+        'La administración municipal ha revisado su solicitud y la información suministrada '
+        'por la dependencia competente, y le informa que su solicitud será atendida dentro '
+        'de los términos legales.\n\n'
+        'Cordialmente,'
+    )
+
+
+# Pares (marcador en el prompt, generador de respuesta), evaluados en orden
+RESPUESTAS_SIMULADAS = [
+    ('INSTRUCCIONES DE TRANSCRIPCIÓN:', _respuesta_transcripcion),
+    ('PETICIÓN A CONDENSAR:', _respuesta_resumen),
+    ('información personal del peticionario', _respuesta_datos_peticionario),
+    ('"preguntas"', _respuesta_analisis),
+    ('"puntuacion_total"', _respuesta_evaluacion),
+]
+
+
+def generar_texto_simulado(prompt):
+    """Devuelve la respuesta predefinida correspondiente al tipo de prompt"""
+    for marcador, generador in RESPUESTAS_SIMULADAS:
+        if marcador in prompt:
+            return generador(prompt)
+    return _respuesta_sugerida(prompt)
+
+
+# ========================================
+# OBJETOS CON LA MISMA FORMA QUE EL SDK
+# ========================================
+
+class FakeUsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count, cached_content_token_count=0):
+        # Como en la API real, prompt_token_count incluye los tokens tomados de caché
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeResponse:
+    """Respuesta simulada con los atributos ``text`` y ``usage_metadata``"""
+
+    def __init__(self, text, usage_metadata):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class FakeStreamResponse:
+    """
+    Respuesta simulada con ``stream=True``: se itera por fragmentos de pocas
+    palabras, con una pausa configurable entre ellos
+    """
+
+    def __init__(self, text, usage_metadata, latencia_fragmento=0.0, palabras_por_fragmento=5):
+        self.text = text
+        self.usage_metadata = usage_metadata
+        self.latencia_fragmento = latencia_fragmento
+        self.palabras_por_fragmento = palabras_por_fragmento
+
+    def fragmentos(self):
+        palabras = re.findall(r'\S+\s*', self.text)
+        for i in range(0, len(palabras), self.palabras_por_fragmento):
+            yield ''.join(palabras[i:i + self.palabras_por_fragmento])
+
+    def __iter__(self):
+        for i, fragmento in enumerate(self.fragmentos()):
+            if i and self.latencia_fragmento:
+                time.sleep(self.latencia_fragmento)
+            yield FakeResponse(fragmento, None)
+
+
+class FakeAsyncStreamResponse(FakeStreamResponse):
+    """Variante de FakeStreamResponse para ``generate_content_async(stream=True)``"""
+
+    async def __aiter__(self):
+        for i, fragmento in enumerate(self.fragmentos()):
+            if i and self.latencia_fragmento:
+                await asyncio.sleep(self.latencia_fragmento)
+            yield FakeResponse(fragmento, None)
+
+
+class FakeCountTokensResponse:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class FakeCachedContentUsage:
+    def __init__(self, total_token_count):
+        self.total_token_count = total_token_count
+
+
+class FakeCachedContent:
+    """
+    Contenido en caché simulado, compatible con ``genai.caching.CachedContent``
+    (``create``, ``get``, ``delete``). Vive en memoria del proceso hasta que vence su TTL.
+    """
+
+    _registro = {}
+    _lock = threading.Lock()
+
+    def __init__(self, name, model, texto, expire_time):
+        self.name = name
+        self.model = model
+        self.texto = texto
+        self.expire_time = expire_time
+        self.usage_metadata = FakeCachedContentUsage(estimar_tokens(texto))
+
+    @classmethod
+    def create(cls, model, system_instruction=None, contents=None, ttl=None, display_name=None):
+        if isinstance(ttl, (int, float)):
+            ttl = timedelta(seconds=ttl)
+        texto = '\n'.join(
+            parte for parte in (_texto_de_contenido(system_instruction or ''), _texto_de_contenido(contents or ''))
+            if parte
+        )
+        contenido = cls(f'cachedContents/{uuid.uuid4().hex}', model, texto, timezone.now() + (ttl or timedelta(hours=1)))
+        with cls._lock:
+            cls._registro[contenido.name] = contenido
+        contador.registrar_contexto()
+        return contenido
+
+    @classmethod
+    def get(cls, name):
+        with cls._lock:
+            contenido = cls._registro.get(name)
+        if contenido is None or contenido.expire_time <= timezone.now():
+            raise google_exceptions.NotFound(f'CachedContent not found: {name} (simulado)')
+        return contenido
+
+    @classmethod
+    def eliminar_todos(cls):
+        with cls._lock:
+            cls._registro.clear()
+
+    def delete(self):
+        with self._lock:
+            self._registro.pop(self.name, None)
+
+
+def _texto_de_contenido(contents):
+    """Convierte el argumento ``contents`` del SDK (str, lista o partes) en texto"""
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, dict):
+        if 'text' in contents:
+            return contents['text']
+        if 'parts' in contents:
+            return _texto_de_contenido(contents['parts'])
+        return ''
+    if isinstance(contents, (list, tuple)):
+        return '\n'.join(_texto_de_contenido(parte) for parte in contents)
+    return str(contents)
+
+
+class FakeGenerativeModel:
+    """
+    Modelo generativo simulado, compatible con ``genai.GenerativeModel``
+    """
+
+    def __init__(self, model_name='gemini-2.5-flash', latencia=None, tasa_error=None, tasa_429=None):
+        self.model_name = model_name
+        self.cached_content = None
+        self.latencia = settings.GEMINI_FAKE_LATENCIA if latencia is None else latencia
+        self.tasa_error = settings.GEMINI_FAKE_TASA_ERROR if tasa_error is None else tasa_error
+        self.tasa_429 = settings.GEMINI_FAKE_TASA_429 if tasa_429 is None else tasa_429
+
+    def _inyectar_fallas(self):
+        sorteo = _sortear()
+        if sorteo < self.tasa_429:
+            contador.registrar_error(es_429=True)
+            raise google_exceptions.ResourceExhausted('Resource has been exhausted (simulado)')
+        if sorteo < self.tasa_429 + self.tasa_error:
+            contador.registrar_error()
+            raise google_exceptions.InternalServerError('Error interno (simulado)')
+
+    @classmethod
+    def from_cached_content(cls, cached_content, **kwargs):
+        """Modelo ligado a un contenido en caché: cada prompt se agrega a continuación de él"""
+        modelo = cls(cached_content.model)
+        modelo.cached_content = cached_content
+        return modelo
+
+    def _responder(self, contents, stream, clase_stream):
+        prefijo = ''
+        if self.cached_content is not None:
+            # Falla igual que la API si el contenido venció o fue eliminado
+            prefijo = FakeCachedContent.get(self.cached_content.name).texto + '\n'
+        self._inyectar_fallas()
+
+        prompt = prefijo + _texto_de_contenido(contents)
+        texto = generar_texto_simulado(prompt)
+
+        tokens_entrada = estimar_tokens(prompt)
+        tokens_salida = estimar_tokens(texto)
+        tokens_cacheados = estimar_tokens(prefijo)
+        contador.registrar(self.model_name, tokens_entrada, tokens_salida, tokens_cacheados)
+
+        uso = FakeUsageMetadata(tokens_entrada, tokens_salida, tokens_cacheados)
+        if stream:
+            return clase_stream(texto, uso, settings.GEMINI_FAKE_LATENCIA_FRAGMENTO)
+        return FakeResponse(texto, uso)
+
+    def generate_content(self, contents, **kwargs):
+        if self.latencia:
+            time.sleep(self.latencia)
+        return self._responder(contents, kwargs.get('stream'), FakeStreamResponse)
+
+    async def generate_content_async(self, contents, **kwargs):
+        if self.latencia:
+            await asyncio.sleep(self.latencia)
+        return self._responder(contents, kwargs.get('stream'), FakeAsyncStreamResponse)
+
+    def count_tokens(self, contents):
+        return FakeCountTokensResponse(estimar_tokens(_texto_de_contenido(contents)))
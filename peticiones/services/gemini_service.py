@@ -1,36 +1,144 @@
 # services/gemini_service.py
-import google.generativeai as genai
 import PyPDF2
+import hashlib
 import time
 import json
 import re
+import uuid
+from datetime import timedelta
 from django.conf import settings
+from django.utils import timezone
 from django.core.files.base import ContentFile
+from contextlib import contextmanager
 from io import BytesIO
+from .modelo_ia_service import obtener_modelo, MetricasIA
+from .cache_contexto_service import generar_con_contexto
+from .similitud_service import indexar_peticion
+from .miniatura_service import generar_miniaturas
+from ..storage import sha256_de_nombre
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@contextmanager
+def medir_etapa(tiempos, etapa):
+    """Registra en tiempos[etapa] la duración en segundos del bloque"""
+    inicio = time.time()
+    try:
+        yield
+    finally:
+        tiempos[etapa] = time.time() - inicio
+
+
+def hash_pdf(pdf_content):
+    """SHA-256 del contenido del PDF: identifica el documento procesado"""
+    return hashlib.sha256(pdf_content).hexdigest()
+
+
+def adquirir_bloqueo(peticion, clave_idempotencia=None):
+    """
+    Marca la petición como 'procesando' si no tiene otro procesamiento en
+    curso (o si el que tiene superó PROCESAMIENTO_IA_BLOQUEO_MAXIMO segundos
+    y se da por perdido). Es un UPDATE condicional, así que entre solicitudes
+    simultáneas solo una lo obtiene.
+    
+    Retorna (adquirido, ProcesamientoIA); si no se adquirió, el registro es
+    el del procesamiento en curso. El bloqueo se libera al registrar el
+    resultado (registrar_intento).
+    """
+    from peticiones.models import ProcesamientoIA
+    
+    ProcesamientoIA.objects.get_or_create(peticion=peticion, defaults={'tiempo_procesamiento': 0})
+    
+    ahora = timezone.now()
+    vencido = ahora - timedelta(seconds=settings.PROCESAMIENTO_IA_BLOQUEO_MAXIMO)
+    adquirido = ProcesamientoIA.objects.filter(peticion=peticion).exclude(
+        estado_procesamiento='procesando', inicio_proceso__gte=vencido
+    ).update(
+        estado_procesamiento='procesando',
+        clave_idempotencia=clave_idempotencia or uuid.uuid4().hex,
+        inicio_proceso=ahora,
+        mensaje_error=None,
+        fecha_actualizacion=ahora,
+    ) == 1
+    
+    return adquirido, ProcesamientoIA.objects.get(peticion=peticion)
+
+
+def confirmar_bloqueo(peticion, clave_idempotencia):
+    """
+    Al empezar un trabajo encolado: confirma que el bloqueo sigue siendo el
+    que tomó la solicitud que lo encoló (misma clave) y renueva su inicio.
+    
+    El trabajo puede esperar en la cola más que PROCESAMIENTO_IA_BLOQUEO_MAXIMO
+    (los masivos van detrás de todo lo demás); entonces el bloqueo parece
+    vencido y otra solicitud puede tomarlo y encolar su propio trabajo. Solo
+    el trabajo de la clave vigente pasa este UPDATE condicional: los demás
+    no se ejecutan y nunca hay dos procesamientos a la vez de una petición.
+    """
+    from peticiones.models import ProcesamientoIA
+    
+    ahora = timezone.now()
+    return ProcesamientoIA.objects.filter(
+        peticion=peticion, estado_procesamiento='procesando', clave_idempotencia=clave_idempotencia
+    ).update(inicio_proceso=ahora, fecha_actualizacion=ahora) == 1
+
+
 class GeminiTranscriptionService:
+    MODELO = 'gemini-2.5-flash'
+    # Subir al cambiar los prompts de transcripción o extracción: el
+    # reprocesamiento masivo vuelve a procesar lo hecho con versiones anteriores
+    VERSION_PROMPT = '2'
+    
+    # Prefijo común de la transcripción y la extracción de datos: junto con el
+    # texto del PDF se envía una sola vez como contenido en caché
+    INSTRUCCIONES_SISTEMA = (
+        "Eres un asistente especializado en derechos de petición ciudadanos para un municipio. "
+        "Trabajas sobre el texto extraído de un PDF y eres completamente fiel al documento original."
+    )
+
     def __init__(self):
         """
         Inicializa el servicio de Gemini para transcripción de PDFs
         """
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model = obtener_modelo(self.MODELO)
+        self.metricas = MetricasIA()
     
     def extraer_texto_pdf(self, archivo_pdf):
         """
         Extrae el texto completo de un archivo PDF
         """
+        pdf_content = self.leer_pdf(archivo_pdf)
+        if pdf_content is None:
+            return None
+        return self.extraer_texto_de_bytes(pdf_content)
+    
+    def leer_pdf(self, archivo_pdf):
+        """
+        Lee el contenido binario del PDF desde el almacenamiento
+        """
         try:
-            # Leer el archivo PDF
+            archivo_pdf.open('rb')
             pdf_content = archivo_pdf.read()
+            archivo_pdf.seek(0)
+            return pdf_content
+        except Exception as e:
+            logger.error(f"Error leyendo el archivo PDF: {str(e)}")
+            return None
+    
+    def extraer_texto_de_bytes(self, pdf_content):
+        """
+        Extrae el texto de cada página del PDF con PyPDF2
+        """
+        try:
             pdf_file = BytesIO(pdf_content)
             
             # Usar PyPDF2 para extraer texto
             pdf_reader = PyPDF2.PdfReader(pdf_file)
+            if pdf_reader.is_encrypted:
+                # Solo con contraseña de propietario: se abre con la contraseña vacía
+                pdf_reader.decrypt('')
             texto_completo = ""
             
             for page_num in range(len(pdf_reader.pages)):
@@ -39,25 +147,25 @@ class GeminiTranscriptionService:
                 texto_completo += f"\n--- PÁGINA {page_num + 1} ---\n"
                 texto_completo += texto_pagina
             
-            # Resetear el puntero del archivo
-            archivo_pdf.seek(0)
-            
             return texto_completo
             
         except Exception as e:
             logger.error(f"Error extrayendo texto del PDF: {str(e)}")
             return None
     
+    def construir_contexto(self, texto_extraido):
+        """Parte del prompt compartida por todas las llamadas sobre un mismo PDF"""
+        return f"TEXTO EXTRAÍDO DEL PDF:\n{texto_extraido}\n"
+    
     def transcribir_con_gemini(self, texto_extraido):
         """
         Usa Gemini para limpiar y estructurar la transcripción completa
         """
         try:
-            prompt = f"""
-            Eres un asistente especializado en transcripción de derechos de petición ciudadanos para un municipio.
-
+            instrucciones = """
+            INSTRUCCIONES DE TRANSCRIPCIÓN:
             Tu tarea es:
-            1. Limpiar y estructurar el siguiente texto extraído de un PDF
+            1. Limpiar y estructurar el texto extraído del PDF anterior
             2. Corregir errores de OCR si los hay
             3. Mantener TODO el contenido original, no resumir ni omitir información, todo debe ser exactamente como está en el PDF
             4. Organizar el texto de manera clara y legible
@@ -69,14 +177,14 @@ class GeminiTranscriptionService:
             - Si hay información personal, consérvala tal como está
             - Organiza el texto en párrafos claros
 
-            TEXTO A TRANSCRIBIR:
-            {texto_extraido}
-
             TRANSCRIPCIÓN :
             """
             
             # Enviar a Gemini
-            response = self.model.generate_content(prompt)
+            response = generar_con_contexto(
+                self.model, self.INSTRUCCIONES_SISTEMA, self.construir_contexto(texto_extraido), instrucciones,
+                self.metricas, etiqueta='transcripcion'
+            )
             
             if response and response.text:
                 return response.text.strip()
@@ -93,8 +201,8 @@ class GeminiTranscriptionService:
         Extrae información del peticionario del texto usando Gemini
         """
         try:
-            prompt = f"""
-            Eres un especialista en extracción de datos de documentos legales. Analiza el siguiente texto de un derecho de petición y extrae ÚNICAMENTE la información personal del peticionario.
+            instrucciones = """
+            Actúa como especialista en extracción de datos de documentos legales. Analiza el texto anterior del derecho de petición y extrae ÚNICAMENTE la información personal del peticionario.
 
             Busca y extrae:
             - Nombre completo del peticionario
@@ -109,20 +217,20 @@ class GeminiTranscriptionService:
             - Extrae solo información que sea claramente del peticionario
             - Responde ÚNICAMENTE en el formato JSON especificado
 
-            TEXTO DEL DOCUMENTO:
-            {texto_extraido}
-
             RESPUESTA (solo JSON, sin explicaciones):
-            {{
+            {
                 "nombre": "nombre completo o NO_ENCONTRADO",
                 "documento": "número de documento o NO_ENCONTRADO", 
                 "telefono": "número de teléfono o NO_ENCONTRADO",
                 "correo": "correo electrónico o NO_ENCONTRADO",
                 "direccion": "dirección completa o NO_ENCONTRADO"
-            }}
+            }
             """
             
-            response = self.model.generate_content(prompt)
+            response = generar_con_contexto(
+                self.model, self.INSTRUCCIONES_SISTEMA, self.construir_contexto(texto_extraido), instrucciones,
+                self.metricas, etiqueta='datos_peticionario'
+            )
             
             if response and response.text:
                 # Limpiar respuesta y extraer JSON
@@ -152,27 +260,61 @@ class GeminiTranscriptionService:
             logger.error(f"Error extrayendo datos del peticionario: {str(e)}")
             return {}
     
-    def procesar_peticion_completa(self, peticion):
+    def procesar_peticion_completa(self, peticion, clave_bloqueo=None):
         """
-        Procesa una petición completa: extrae texto, transcribe con IA y extrae datos del peticionario
+        Procesa una petición completa: extrae texto, transcribe con IA y extrae datos del peticionario.
+        Cada ejecución queda registrada como un IntentoProcesamientoIA con la duración de sus etapas.
+        
+        Con ``clave_bloqueo`` (la clave_idempotencia del bloqueo que tomó quien
+        encoló el trabajo) se confirma que ese bloqueo sigue vigente
+        (confirmar_bloqueo); sin ella se adquiere aquí. Si el bloqueo es de otro
+        procesamiento no se hace nada y retorna False.
         """
+        if clave_bloqueo:
+            vigente = confirmar_bloqueo(peticion, clave_bloqueo)
+        else:
+            vigente = adquirir_bloqueo(peticion)[0]
+        if not vigente:
+            logger.warning(f"Procesamiento de {peticion.radicado} omitido: ya hay uno en curso")
+            return False
+        
         tiempo_inicio = time.time()
+        tiempos = {}
+        self.metricas = MetricasIA()
         
         try:
-            # 1. Extraer texto del PDF
+            # 1. Leer el PDF y extraer su texto
             logger.info(f"Iniciando procesamiento de {peticion.radicado}")
-            texto_extraido = self.extraer_texto_pdf(peticion.archivo_pdf)
+            with medir_etapa(tiempos, 'tiempo_lectura_pdf'):
+                pdf_content = self.leer_pdf(peticion.archivo_pdf)
+            hash_origen = hash_pdf(pdf_content) if pdf_content else ''
+            
+            # La miniatura no depende de la IA: se genera aunque el resto falle
+            if pdf_content:
+                try:
+                    generar_miniaturas(peticion, pdf_content)
+                except Exception as e:
+                    logger.warning(f"No se pudo generar la miniatura de {peticion.radicado}: {str(e)}")
+            
+            if peticion.pdf_escaneado:
+                # Detectado al subirlo: no hay texto que extraer ni que enviar a la IA
+                raise Exception("El PDF es escaneado (solo imágenes), no tiene texto extraíble: transcríbalo manualmente")
+            
+            with medir_etapa(tiempos, 'tiempo_extraccion_texto'):
+                texto_extraido = self.extraer_texto_de_bytes(pdf_content) if pdf_content else None
             
             if not texto_extraido:
                 raise Exception("No se pudo extraer texto del PDF")
             
             # 2. Transcribir con Gemini
             logger.info(f"Enviando a Gemini para transcripción: {peticion.radicado}")
-            transcripcion_limpia = self.transcribir_con_gemini(texto_extraido)
+            with medir_etapa(tiempos, 'tiempo_transcripcion'):
+                transcripcion_limpia = self.transcribir_con_gemini(texto_extraido)
             
             # 3. Extraer datos del peticionario si no fueron llenados manualmente
             logger.info(f"Extrayendo datos del peticionario: {peticion.radicado}")
-            datos_peticionario = self.extraer_datos_peticionario(texto_extraido)
+            with medir_etapa(tiempos, 'tiempo_extraccion_datos'):
+                datos_peticionario = self.extraer_datos_peticionario(texto_extraido)
             
             # 4. Actualizar petición con datos extraídos (solo si no existen)
             datos_actualizados = False
@@ -198,21 +340,20 @@ class GeminiTranscriptionService:
                 datos_actualizados = True
             
             # 5. Guardar transcripción y datos del peticionario
-            peticion.transcripcion_completa = transcripcion_limpia
-            peticion.save()
+            with medir_etapa(tiempos, 'tiempo_guardado'):
+                peticion.transcripcion_completa = transcripcion_limpia
+                peticion.save()
+            
+            # Una petición ya respondida que se reprocesa cambia su vector de similitud
+            if peticion.estado == 'respondido':
+                indexar_peticion(peticion)
             
             if datos_actualizados:
                 logger.info(f"Datos del peticionario actualizados automáticamente: {peticion.radicado}")
             
-            # 6. Crear registro de procesamiento IA
+            # 6. Registrar el resultado del procesamiento IA
             tiempo_total = time.time() - tiempo_inicio
-            
-            from peticiones.models import ProcesamientoIA
-            ProcesamientoIA.objects.create(
-                peticion=peticion,
-                tiempo_procesamiento=tiempo_total,
-                estado_procesamiento='exitoso'
-            )
+            self.registrar_intento(peticion, tiempo_total, tiempos, 'exitoso', hash_origen=hash_origen)
             
             logger.info(f"Procesamiento exitoso de {peticion.radicado} en {tiempo_total:.2f}s")
             return True
@@ -220,21 +361,72 @@ class GeminiTranscriptionService:
         except Exception as e:
             # Registrar error en el modelo
             tiempo_total = time.time() - tiempo_inicio
-            
-            from peticiones.models import ProcesamientoIA
-            ProcesamientoIA.objects.create(
-                peticion=peticion,
-                tiempo_procesamiento=tiempo_total,
-                estado_procesamiento='error',
-                mensaje_error=str(e)
-            )
+            self.registrar_intento(peticion, tiempo_total, tiempos, 'error', mensaje_error=str(e))
             
             logger.error(f"Error procesando {peticion.radicado}: {str(e)}")
             return False
     
-    def reanalizar_peticion(self, peticion):
+    def registrar_intento(self, peticion, tiempo_total, tiempos, resultado, mensaje_error=None, hash_origen=''):
+        """
+        Guarda el intento en el historial y actualiza el último estado en ProcesamientoIA
+        (uno por petición, por eso se actualiza en lugar de crear uno nuevo al reprocesar).
+        El hash del PDF y la versión de prompts solo quedan si el procesamiento fue exitoso.
+        """
+        from peticiones.models import ProcesamientoIA, IntentoProcesamientoIA
+        
+        IntentoProcesamientoIA.objects.create(
+            peticion=peticion,
+            tiempo_total=tiempo_total,
+            tokens_entrada=self.metricas.tokens_entrada,
+            tokens_salida=self.metricas.tokens_salida,
+            modelo_ia_usado=self.MODELO,
+            reintentos=self.metricas.reintentos,
+            resultado=resultado,
+            mensaje_error=mensaje_error,
+            **tiempos
+        )
+        
+        ProcesamientoIA.objects.update_or_create(
+            peticion=peticion,
+            defaults={
+                'tiempo_procesamiento': tiempo_total,
+                'modelo_ia_usado': self.MODELO,
+                'estado_procesamiento': resultado,
+                'mensaje_error': mensaje_error,
+                'hash_origen': hash_origen if resultado == 'exitoso' else '',
+                'version_prompt': self.VERSION_PROMPT if resultado == 'exitoso' else '',
+            }
+        )
+    
+    def hash_archivo(self, archivo_pdf):
+        """
+        SHA-256 del PDF: el de su nombre si está en el almacenamiento por
+        contenido (sin leerlo) o calculado leyéndolo; None si no se puede leer
+        """
+        sha256 = sha256_de_nombre(archivo_pdf.name)
+        if sha256:
+            return sha256
+        pdf_content = self.leer_pdf(archivo_pdf)
+        return hash_pdf(pdf_content) if pdf_content else None
+    
+    def esta_actualizada(self, peticion, hash_origen):
+        """
+        Indica si la petición ya fue procesada con éxito sobre el PDF con este
+        hash, con el modelo y la versión de prompts actuales
+        """
+        from peticiones.models import ProcesamientoIA
+        
+        return ProcesamientoIA.objects.filter(
+            peticion=peticion,
+            estado_procesamiento='exitoso',
+            modelo_ia_usado=self.MODELO,
+            version_prompt=self.VERSION_PROMPT,
+            hash_origen=hash_origen,
+        ).exists()
+    
+    def reanalizar_peticion(self, peticion, clave_bloqueo=None):
         """
         Re-analiza una petición que ya fue procesada anteriormente
         """
         logger.info(f"Re-analizando petición {peticion.radicado}")
-        return self.procesar_peticion_completa(peticion)
\ No newline at end of file
+        return self.procesar_peticion_completa(peticion, clave_bloqueo=clave_bloqueo)
\ No newline at end of file
@@ -0,0 +1,70 @@
+# services/metricas_ia_service.py
+"""
+Estadísticas de duración por etapa del procesamiento con IA (p50/p95),
+calculadas a partir del historial de IntentoProcesamientoIA
+"""
+import math
+from datetime import timedelta
+from django.utils import timezone
+from ..models import IntentoProcesamientoIA
+
+
+def percentil(valores_ordenados, p):
+    """
+    Percentil por rango más cercano de una lista ya ordenada
+    """
+    if not valores_ordenados:
+        return None
+    rango = max(1, math.ceil(p / 100 * len(valores_ordenados)))
+    return valores_ordenados[rango - 1]
+
+
+def resumir(valores):
+    """Retorna cantidad, p50 y p95 de una lista de duraciones"""
+    valores = sorted(v for v in valores if v is not None)
+    return {
+        'n': len(valores),
+        'p50': percentil(valores, 50),
+        'p95': percentil(valores, 95),
+    }
+
+
+def estadisticas_por_etapa(dias=30):
+    """
+    Calcula p50/p95 de cada etapa (y del total) por día y para todo el periodo
+
+    Returns:
+        dict con 'etapas' (campo -> nombre), 'periodo' (resumen global)
+        y 'serie' (un resumen por día, ordenado por fecha)
+    """
+    campos = [campo for campo, _ in IntentoProcesamientoIA.ETAPAS] + ['tiempo_total']
+    desde = timezone.now() - timedelta(days=dias)
+
+    filas = IntentoProcesamientoIA.objects.filter(
+        fecha_inicio__gte=desde
+    ).values_list('fecha_inicio', *campos)
+
+    por_dia = {}
+    periodo = {campo: [] for campo in campos}
+    for fila in filas:
+        dia = timezone.localtime(fila[0]).date().isoformat()
+        valores_dia = por_dia.setdefault(dia, {campo: [] for campo in campos})
+        for campo, valor in zip(campos, fila[1:]):
+            valores_dia[campo].append(valor)
+            periodo[campo].append(valor)
+
+    etapas = dict(IntentoProcesamientoIA.ETAPAS)
+    etapas['tiempo_total'] = 'Total'
+
+    return {
+        'dias': dias,
+        'etapas': etapas,
+        'periodo': {campo: resumir(valores) for campo, valores in periodo.items()},
+        'serie': [
+            {
+                'fecha': dia,
+                'etapas': {campo: resumir(valores) for campo, valores in valores_dia.items()},
+            }
+            for dia, valores_dia in sorted(por_dia.items())
+        ],
+    }
@@ -0,0 +1,159 @@
+# services/miniatura_service.py
+"""
+Miniatura de la primera página y vista previa de baja resolución de los PDF
+de las peticiones, para identificarlas en la lista y el detalle sin abrir el
+PDF completo.
+
+Se generan una vez por documento: peticiones con el mismo PDF (mismo hash)
+reutilizan las imágenes ya generadas, y como el almacenamiento es
+direccionado por contenido su nombre no cambia nunca, así que se sirven con
+caché de larga duración.
+
+Con PyMuPDF instalado (opcional, ``pip install pymupdf``) las páginas se
+renderizan tal como se ven. Sin él se usa PyPDF2 y Pillow: la imagen más
+grande de la página si es escaneada, o el texto de la página dibujado sobre
+una hoja en blanco.
+"""
+from django.conf import settings
+from django.core.files.base import ContentFile
+from io import BytesIO
+from PIL import Image, ImageDraw, ImageFont
+from ..models import Peticion
+import PyPDF2
+import textwrap
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ancho en píxeles al que se dibuja el texto antes de reducirlo (el texto reducido se ve como una página real)
+ANCHO_TEXTO = 900
+MARGEN_TEXTO = 60
+
+
+def renderizar_con_pymupdf(pdf_content, paginas, ancho):
+    """Imágenes de las primeras páginas con PyMuPDF, o None si no está instalado"""
+    try:
+        import fitz
+    except ImportError:
+        return None
+
+    imagenes = []
+    with fitz.open(stream=pdf_content, filetype='pdf') as documento:
+        for pagina in list(documento)[:paginas]:
+            escala = ancho / pagina.rect.width
+            pixmap = pagina.get_pixmap(matrix=fitz.Matrix(escala, escala), alpha=False)
+            imagenes.append(Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples))
+    return imagenes
+
+
+def imagen_de_pagina(pagina):
+    """La imagen más grande de una página escaneada, o None"""
+    try:
+        imagenes = pagina.images
+    except Exception as e:
+        logger.warning(f"No se pudieron leer las imágenes de la página: {str(e)}")
+        return None
+    for archivo in sorted(imagenes, key=lambda archivo: len(archivo.data), reverse=True):
+        try:
+            return Image.open(BytesIO(archivo.data)).convert('RGB')
+        except Exception:
+            continue
+    return None
+
+
+def texto_de_pagina(pagina, ancho, alto):
+    """Hoja en blanco con el texto de la página"""
+    imagen = Image.new('RGB', (ancho, alto), 'white')
+    dibujo = ImageDraw.Draw(imagen)
+    fuente = ImageFont.load_default(size=22)
+    try:
+        texto = pagina.extract_text() or ''
+    except Exception:
+        texto = ''
+
+    y = MARGEN_TEXTO
+    for parrafo in texto.splitlines():
+        for linea in textwrap.wrap(parrafo, width=70) or ['']:
+            if y > alto - MARGEN_TEXTO:
+                return imagen
+            dibujo.text((MARGEN_TEXTO, y), linea, fill='black', font=fuente)
+            y += 30
+    return imagen
+
+
+def renderizar_con_pypdf2(pdf_content, paginas):
+    lector = PyPDF2.PdfReader(BytesIO(pdf_content))
+    if lector.is_encrypted:
+        lector.decrypt('')
+
+    imagenes = []
+    for pagina in lector.pages[:paginas]:
+        ancho_pdf, alto_pdf = float(pagina.mediabox.width), float(pagina.mediabox.height)
+        imagen = imagen_de_pagina(pagina)
+        if imagen is None:
+            imagen = texto_de_pagina(pagina, ANCHO_TEXTO, int(ANCHO_TEXTO * alto_pdf / ancho_pdf))
+        imagenes.append(imagen)
+    return imagenes
+
+
+def renderizar_paginas(pdf_content, paginas, ancho):
+    """Imágenes RGB de las primeras ``paginas`` páginas, de ``ancho`` píxeles"""
+    imagenes = renderizar_con_pymupdf(pdf_content, paginas, ancho)
+    if imagenes is None:
+        imagenes = renderizar_con_pypdf2(pdf_content, paginas)
+    return [
+        imagen.resize((ancho, max(1, round(imagen.height * ancho / imagen.width))), Image.LANCZOS)
+        if imagen.width != ancho else imagen
+        for imagen in imagenes
+    ]
+
+
+def a_bytes(imagen, formato):
+    salida = BytesIO()
+    imagen.save(salida, formato, optimize=True, **({'quality': 70} if formato == 'JPEG' else {}))
+    return salida.getvalue()
+
+
+def generar_miniaturas(peticion, pdf_content=None):
+    """
+    Genera y guarda la miniatura y la vista previa de la petición si aún no
+    las tiene. Retorna True si la petición quedó con miniatura.
+    """
+    if peticion.miniatura:
+        return True
+
+    # Otra petición con el mismo PDF ya las tiene: se reutilizan sin renderizar
+    existente = Peticion.objects.filter(archivo_pdf=peticion.archivo_pdf.name).exclude(miniatura='').exclude(
+        pk=peticion.pk).values('miniatura', 'vista_previa').first()
+    if existente:
+        Peticion.objects.filter(pk=peticion.pk).update(**existente)
+        peticion.miniatura.name, peticion.vista_previa.name = existente['miniatura'], existente['vista_previa']
+        return True
+
+    if pdf_content is None:
+        with peticion.archivo_pdf.open('rb') as archivo:
+            pdf_content = archivo.read()
+
+    paginas = max(1, settings.VISTA_PREVIA_PAGINAS)
+    imagenes = renderizar_paginas(pdf_content, paginas, settings.VISTA_PREVIA_ANCHO)
+    if not imagenes:
+        return False
+
+    miniatura = imagenes[0].copy()
+    miniatura.thumbnail((settings.MINIATURA_ANCHO, settings.MINIATURA_ANCHO * 2), Image.LANCZOS)
+    peticion.miniatura.save('miniatura.png', ContentFile(a_bytes(miniatura, 'PNG')), save=False)
+
+    if settings.VISTA_PREVIA_PAGINAS > 0:
+        # Las páginas una debajo de otra en una sola imagen
+        tira = Image.new('RGB', (settings.VISTA_PREVIA_ANCHO, sum(imagen.height for imagen in imagenes)), 'white')
+        y = 0
+        for imagen in imagenes:
+            tira.paste(imagen, (0, y))
+            y += imagen.height
+        peticion.vista_previa.save('vista_previa.jpg', ContentFile(a_bytes(tira, 'JPEG')), save=False)
+
+    Peticion.objects.filter(pk=peticion.pk).update(
+        miniatura=peticion.miniatura.name, vista_previa=peticion.vista_previa.name or ''
+    )
+    logger.info(f"Miniatura generada para {peticion.radicado}: {len(imagenes)} páginas")
+    return True
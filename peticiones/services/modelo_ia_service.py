@@ -0,0 +1,185 @@
+# services/modelo_ia_service.py
+"""
+Punto único de creación y llamada de modelos generativos.
+
+El backend se selecciona con el setting ``GEMINI_BACKEND``:
+- 'gemini': API real de Google Gemini (por defecto)
+- 'fake': sustituto local sin red (ver gemini_fake_service.py)
+"""
+import google.generativeai as genai
+from django.conf import settings
+from google.api_core import exceptions as google_exceptions
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Errores de la API que vale la pena reintentar (cuota, sobrecarga, timeouts)
+ERRORES_TRANSITORIOS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+
+def obtener_modelo(nombre_modelo):
+    """
+    Retorna un modelo generativo para el backend configurado
+    """
+    if settings.GEMINI_BACKEND == 'fake':
+        from .gemini_fake_service import FakeGenerativeModel
+        return FakeGenerativeModel(nombre_modelo)
+
+    genai.configure(api_key=settings.GEMINI_API_KEY)
+    return genai.GenerativeModel(nombre_modelo)
+
+
+def estimar_tokens(texto):
+    """
+    Estima la cantidad de tokens de un texto (~4 caracteres por token,
+    la misma aproximación que publica Google para Gemini)
+    """
+    if not texto or not isinstance(texto, str):
+        return 0
+    return max(1, len(texto) // 4)
+
+
+class MetricasIA:
+    """
+    Acumula el uso de IA de una operación compuesta por varias llamadas
+    """
+
+    def __init__(self):
+        self.llamadas = 0
+        self.tokens_entrada = 0
+        self.tokens_salida = 0
+        self.reintentos = 0
+
+    def registrar(self, response, prompt):
+        """Suma los tokens de una respuesta (reales si el SDK los reporta, estimados si no)"""
+        tokens_entrada, tokens_salida = uso_tokens(response, prompt)
+        self.llamadas += 1
+        self.tokens_entrada += tokens_entrada
+        self.tokens_salida += tokens_salida
+        return tokens_entrada, tokens_salida
+
+
+def uso_tokens(response, prompt):
+    """
+    Retorna (tokens_entrada, tokens_salida) de una respuesta del modelo
+    """
+    uso = getattr(response, 'usage_metadata', None)
+    if uso is not None:
+        return uso.prompt_token_count or 0, uso.candidates_token_count or 0
+
+    try:
+        texto_respuesta = response.text
+    except ValueError:
+        # El SDK lanza ValueError si la respuesta fue bloqueada y no tiene texto
+        texto_respuesta = ''
+    return estimar_tokens(prompt), estimar_tokens(texto_respuesta)
+
+
+def _espera_reintento(modelo, error, intento, max_reintentos, metricas):
+    """Calcula la espera antes del siguiente reintento y lo registra"""
+    espera = settings.GEMINI_ESPERA_REINTENTO * (2 ** intento)
+    logger.warning(
+        f"Error transitorio de {modelo.model_name} ({error.__class__.__name__}), "
+        f"reintento {intento + 1}/{max_reintentos} en {espera:.1f}s"
+    )
+    if metricas is not None:
+        metricas.reintentos += 1
+    return espera
+
+
+def medir_prompt(modelo, prompt, etiqueta=None, presupuesto=None):
+    """
+    Estima los tokens del prompt antes de la llamada y avisa si supera el presupuesto
+    """
+    tokens_prompt = estimar_tokens(prompt)
+    if presupuesto and tokens_prompt > presupuesto:
+        logger.warning(
+            f"Prompt [{etiqueta or 'sin etiqueta'}] de {modelo.model_name} excede el presupuesto: "
+            f"~{tokens_prompt} > {presupuesto} tokens"
+        )
+    return tokens_prompt
+
+
+def tokens_cacheados(response):
+    """Tokens de entrada que la API tomó de contenido en caché (0 si no reporta)"""
+    uso = getattr(response, 'usage_metadata', None)
+    return getattr(uso, 'cached_content_token_count', 0) or 0
+
+
+def registrar_uso_llamada(modelo, tokens_prompt, tokens_entrada, tokens_salida, etiqueta=None, presupuesto=None,
+                          cacheados=0):
+    """Deja en el log el presupuesto y el uso real de tokens de una llamada"""
+    logger.info(
+        f"Uso IA [{etiqueta or 'sin etiqueta'}] {modelo.model_name}: "
+        f"prompt ~{tokens_prompt} tokens (presupuesto {presupuesto or 'sin límite'}), "
+        f"real {tokens_entrada} entrada ({cacheados} de caché) / {tokens_salida} salida"
+    )
+
+
+def _finalizar_llamada(modelo, prompt, response, metricas, tokens_prompt, etiqueta, presupuesto, stream):
+    """Registra métricas y uso de una llamada terminada (con stream=True lo hace el llamador)"""
+    if stream:
+        return
+    if metricas is not None:
+        tokens_entrada, tokens_salida = metricas.registrar(response, prompt)
+    else:
+        tokens_entrada, tokens_salida = uso_tokens(response, prompt)
+    registrar_uso_llamada(
+        modelo, tokens_prompt, tokens_entrada, tokens_salida, etiqueta, presupuesto, tokens_cacheados(response)
+    )
+
+
+def generar_contenido(modelo, prompt, metricas=None, etiqueta=None, presupuesto=None, **kwargs):
+    """
+    Llama a ``modelo.generate_content`` reintentando los errores transitorios
+    con espera exponencial (GEMINI_MAX_REINTENTOS, GEMINI_ESPERA_REINTENTO).
+    
+    ``etiqueta`` y ``presupuesto`` (tokens de entrada) solo se usan para el log
+    de uso por llamada.
+    
+    Con ``stream=True`` el uso de tokens no se registra aquí: el llamador debe
+    invocar ``metricas.registrar`` después de consumir todos los fragmentos.
+    """
+    max_reintentos = settings.GEMINI_MAX_REINTENTOS
+    tokens_prompt = medir_prompt(modelo, prompt, etiqueta, presupuesto)
+
+    for intento in range(max_reintentos + 1):
+        try:
+            response = modelo.generate_content(prompt, **kwargs)
+            break
+        except ERRORES_TRANSITORIOS as e:
+            if intento >= max_reintentos:
+                raise
+            time.sleep(_espera_reintento(modelo, e, intento, max_reintentos, metricas))
+
+    _finalizar_llamada(modelo, prompt, response, metricas, tokens_prompt, etiqueta, presupuesto, kwargs.get('stream'))
+    return response
+
+
+async def agenerar_contenido(modelo, prompt, metricas=None, etiqueta=None, presupuesto=None, **kwargs):
+    """
+    Versión asíncrona de generar_contenido (``generate_content_async``): mientras
+    espera al modelo no ocupa un worker, lo que permite atender otras peticiones
+    cuando se sirve con ASGI
+    """
+    max_reintentos = settings.GEMINI_MAX_REINTENTOS
+    tokens_prompt = medir_prompt(modelo, prompt, etiqueta, presupuesto)
+
+    for intento in range(max_reintentos + 1):
+        try:
+            response = await modelo.generate_content_async(prompt, **kwargs)
+            break
+        except ERRORES_TRANSITORIOS as e:
+            if intento >= max_reintentos:
+                raise
+            await asyncio.sleep(_espera_reintento(modelo, e, intento, max_reintentos, metricas))
+
+    _finalizar_llamada(modelo, prompt, response, metricas, tokens_prompt, etiqueta, presupuesto, kwargs.get('stream'))
+    return response
@@ -0,0 +1,206 @@
+# services/reprocesamiento_service.py
+"""
+Reprocesamiento masivo con IA (comando ``reprocesar_peticiones`` y acción
+del admin).
+
+Las peticiones seleccionadas quedan en un LoteReprocesamiento y se procesan
+con hasta ``concurrencia`` a la vez: en el comando, con su propio pool de
+hilos; desde el admin, en la cola IA del servidor como trabajos masivos,
+detrás de las cargas interactivas y de las peticiones más urgentes. Cada ítem guarda su
+resultado apenas termina, de modo que un lote interrumpido se reanuda con los
+ítems pendientes. Las peticiones cuyo PDF y versión de prompts no cambiaron
+desde el último procesamiento exitoso se omiten sin llamar al modelo.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from ..models import Peticion, LoteReprocesamiento, ItemLoteReprocesamiento
+from .gemini_service import GeminiTranscriptionService, adquirir_bloqueo
+from .cola_ia_service import cola_ia
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTADORES_POR_ESTADO = {'exitoso': 'procesadas', 'omitido': 'omitidas', 'error': 'fallidas'}
+
+
+def seleccionar_peticiones(estado=None, desde=None, hasta=None, dependencia=None, modelo=None):
+    """
+    Peticiones con PDF filtradas por estado de ProcesamientoIA ('sin_procesar'
+    para las que no tienen), rango de fecha de radicación, prefijo de la
+    dependencia y modelo con que se procesaron
+    """
+    peticiones = Peticion.objects.exclude(archivo_pdf='')
+
+    if estado == 'sin_procesar':
+        peticiones = peticiones.filter(procesamiento_ia__isnull=True)
+    elif estado:
+        peticiones = peticiones.filter(procesamiento_ia__estado_procesamiento=estado)
+    if desde:
+        peticiones = peticiones.filter(fecha_radicacion__date__gte=desde)
+    if hasta:
+        peticiones = peticiones.filter(fecha_radicacion__date__lte=hasta)
+    if dependencia:
+        peticiones = peticiones.filter(dependencia__prefijo=dependencia)
+    if modelo:
+        peticiones = peticiones.filter(procesamiento_ia__modelo_ia_usado=modelo)
+
+    return peticiones.order_by('fecha_radicacion')
+
+
+def crear_lote(peticiones, filtros=None, usuario=None, concurrencia=None, forzar=False):
+    """
+    Crea un lote con las peticiones dadas (queryset o lista)
+    """
+    lote = LoteReprocesamiento.objects.create(
+        filtros=filtros or {},
+        concurrencia=concurrencia or settings.REPROCESAMIENTO_CONCURRENCIA,
+        forzar=forzar,
+        creado_por=usuario,
+    )
+    ItemLoteReprocesamiento.objects.bulk_create(
+        [ItemLoteReprocesamiento(lote=lote, peticion=peticion) for peticion in peticiones],
+        batch_size=500
+    )
+    lote.total = lote.items.count()
+    lote.save(update_fields=['total'])
+    return lote
+
+
+def procesar_item(item_id, forzar=False):
+    """
+    Reprocesa la petición de un ítem (u omite si no cambió) y guarda el
+    resultado en el ítem y en los contadores del lote. Si otra solicitud la
+    está procesando, el ítem queda pendiente para reintentarlo al reanudar el
+    lote. Retorna el ítem.
+    """
+    item = ItemLoteReprocesamiento.objects.select_related('peticion').get(pk=item_id)
+    peticion = item.peticion
+    servicio = GeminiTranscriptionService()
+    item.mensaje_error = ''
+
+    try:
+        hash_origen = servicio.hash_archivo(peticion.archivo_pdf)
+        if not forzar and hash_origen and servicio.esta_actualizada(peticion, hash_origen):
+            item.estado = 'omitido'
+        else:
+            adquirido, procesamiento = adquirir_bloqueo(peticion)
+            if not adquirido:
+                # No cuenta como terminado: sigue pendiente y se reintenta al reanudar
+                item.mensaje_error = 'Procesamiento en curso por otra solicitud'
+                item.save(update_fields=['mensaje_error'])
+                return item
+            if servicio.procesar_peticion_completa(peticion, clave_bloqueo=procesamiento.clave_idempotencia):
+                item.estado = 'exitoso'
+            else:
+                item.estado = 'error'
+                item.mensaje_error = peticion.procesamiento_ia.mensaje_error
+    except Exception as e:
+        logger.error(f"Error reprocesando {peticion.radicado} en lote {item.lote_id}: {str(e)}")
+        item.estado = 'error'
+        item.mensaje_error = str(e)
+
+    item.fecha_fin = timezone.now()
+    item.save(update_fields=['estado', 'mensaje_error', 'fecha_fin'])
+    LoteReprocesamiento.objects.filter(pk=item.lote_id).update(
+        **{CONTADORES_POR_ESTADO[item.estado]: F(CONTADORES_POR_ESTADO[item.estado]) + 1}
+    )
+    return item
+
+
+def _procesar_item_en_hilo(item_id, forzar):
+    try:
+        return procesar_item(item_id, forzar)
+    finally:
+        # Cada hilo del pool abre su propia conexión
+        connection.close()
+
+
+def ejecutar_lote(lote, al_avanzar=None, cola=None):
+    """
+    Procesa los ítems pendientes del lote con hasta ``lote.concurrencia``
+    peticiones a la vez, o en la ``cola`` IA indicada (con su prioridad por
+    vencimiento). ``al_avanzar(lote, item)`` se llama al terminar cada ítem
+    con el lote actualizado. Si se interrumpe (Ctrl+C) el lote queda
+    'interrumpido' y puede reanudarse.
+    """
+    pendientes = list(lote.items.filter(estado='pendiente').select_related('peticion'))
+
+    lote.estado = 'en_proceso'
+    lote.fecha_inicio = timezone.now()
+    lote.fecha_fin = None
+    lote.terminadas_al_iniciar = lote.terminadas
+    lote.save(update_fields=['estado', 'fecha_inicio', 'fecha_fin', 'terminadas_al_iniciar'])
+    logger.info(f"Lote de reprocesamiento {lote.pk}: {len(pendientes)} pendientes, concurrencia {lote.concurrencia}")
+
+    def avanzar(item):
+        lote.refresh_from_db(fields=['procesadas', 'omitidas', 'fallidas'])
+        if al_avanzar:
+            al_avanzar(lote, item)
+
+    try:
+        if cola is not None:
+            # Solo ``concurrencia`` ítems en la cola a la vez: el resto espera aquí
+            # y el lote no acapara los trabajadores de la cola
+            por_encolar = iter(pendientes)
+            en_cola = set()
+            try:
+                for item in por_encolar:
+                    en_cola.add(cola.encolar(item.peticion, procesar_item, item.pk, lote.forzar, origen='masivo'))
+                    if len(en_cola) < lote.concurrencia:
+                        continue
+                    terminados, en_cola = wait(en_cola, return_when=FIRST_COMPLETED)
+                    for futuro in terminados:
+                        avanzar(futuro.result())
+                for futuro in as_completed(en_cola):
+                    avanzar(futuro.result())
+            finally:
+                for futuro in en_cola:
+                    futuro.cancel()
+        elif lote.concurrencia <= 1:
+            for item in pendientes:
+                avanzar(procesar_item(item.pk, lote.forzar))
+        else:
+            executor = ThreadPoolExecutor(max_workers=lote.concurrencia)
+            try:
+                futuros = [executor.submit(_procesar_item_en_hilo, item.pk, lote.forzar) for item in pendientes]
+                for futuro in as_completed(futuros):
+                    avanzar(futuro.result())
+            finally:
+                # Al interrumpir, no iniciar los ítems que no alcanzaron a empezar
+                executor.shutdown(wait=True, cancel_futures=True)
+    except BaseException:
+        LoteReprocesamiento.objects.filter(pk=lote.pk).update(estado='interrumpido')
+        lote.estado = 'interrumpido'
+        raise
+
+    lote.refresh_from_db()
+    lote.estado = 'completado' if not lote.items.filter(estado='pendiente').exists() else 'interrumpido'
+    lote.fecha_fin = timezone.now()
+    lote.save(update_fields=['estado', 'fecha_fin'])
+    logger.info(
+        f"Lote de reprocesamiento {lote.pk} {lote.estado}: {lote.procesadas} procesadas, "
+        f"{lote.omitidas} omitidas, {lote.fallidas} con error"
+    )
+    return lote
+
+
+def ejecutar_lote_en_background(lote):
+    """
+    Ejecuta el lote en la cola IA del servidor (acción del admin); el hilo solo
+    espera los resultados. El progreso se consulta en el admin.
+    """
+    def ejecutar():
+        try:
+            ejecutar_lote(lote, cola=cola_ia)
+        except Exception as e:
+            logger.error(f"Error ejecutando lote de reprocesamiento {lote.pk}: {str(e)}")
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=ejecutar)
+    thread.daemon = True
+    thread.start()
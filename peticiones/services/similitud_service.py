@@ -0,0 +1,218 @@
+# services/similitud_service.py
+"""
+Índice TF-IDF local de peticiones respondidas para encontrar precedentes.
+
+Cada petición respondida guarda la frecuencia de sus términos en
+VectorSimilitud; cada proceso mantiene el índice invertido en memoria y lo
+sincroniza de forma incremental (solo los vectores modificados desde la
+última consulta), así que varios workers comparten el mismo índice sin
+reconstruirlo.
+"""
+from collections import Counter, defaultdict
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from ..models import Peticion, VectorSimilitud
+import math
+import re
+import threading
+import unicodedata
+import logging
+
+logger = logging.getLogger(__name__)
+
+PALABRAS_VACIAS = set("""
+    a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo bien cada como con contra cual
+    cuales cuando de del desde donde dos el ella ellas ello ellos en entre era eran es esa esas ese eso esos
+    esta estan estas este esto estos fue fueron ha han hasta hay la las le les lo los mas me mi mis mucho muy
+    ni no nos nuestra nuestro o otra otras otro otros para pero por porque que quien se sea segun ser si sin
+    sobre son su sus tal tambien tan te tiene tienen todo todos tu tus un una unas uno unos usted ustedes ya
+    senor senora senores cordial cordialmente atentamente saludo respetuosamente
+""".split())
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def tokenizar(texto):
+    """
+    Términos de un texto: palabras de 3+ letras sin palabras vacías, con el
+    plural simple recortado (luminarias -> luminaria)
+    """
+    terminos = []
+    for palabra in re.findall(r'[a-z]{3,}', normalizar(texto or '')):
+        if palabra in PALABRAS_VACIAS:
+            continue
+        if len(palabra) > 4 and palabra.endswith('s'):
+            palabra = palabra[:-1]
+        terminos.append(palabra)
+    return terminos
+
+
+class IndiceSimilitud:
+    """
+    Índice invertido TF-IDF con similitud coseno (tf = 1 + log(frecuencia))
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.documentos = {}                 # peticion_id -> {termino: frecuencia}
+        self.postings = defaultdict(dict)    # termino -> {peticion_id: peso tf}
+        self.normas = {}                     # peticion_id -> norma del vector tf-idf
+        self.normas_vigentes = False
+        self.sincronizado_hasta = None
+
+    def idf(self, termino):
+        return math.log((1 + len(self.documentos)) / (1 + len(self.postings.get(termino, ())))) + 1
+
+    def _quitar(self, peticion_id):
+        for termino in self.documentos.pop(peticion_id, {}):
+            docs = self.postings.get(termino)
+            if docs is not None:
+                docs.pop(peticion_id, None)
+                if not docs:
+                    del self.postings[termino]
+        self.normas_vigentes = False
+
+    def _agregar(self, peticion_id, terminos):
+        self._quitar(peticion_id)
+        self.documentos[peticion_id] = terminos
+        for termino, frecuencia in terminos.items():
+            self.postings[termino][peticion_id] = 1 + math.log(frecuencia)
+        self.normas_vigentes = False
+
+    def _calcular_normas(self):
+        """Las normas dependen del idf, que cambia con cada alta o baja"""
+        normas = defaultdict(float)
+        for termino, docs in self.postings.items():
+            idf = self.idf(termino)
+            for peticion_id, peso in docs.items():
+                normas[peticion_id] += (peso * idf) ** 2
+        self.normas = {peticion_id: math.sqrt(valor) for peticion_id, valor in normas.items()}
+        self.normas_vigentes = True
+
+    def sincronizar(self):
+        """Aplica los vectores creados, modificados o dados de baja desde la última sincronización"""
+        cambios = VectorSimilitud.objects.order_by('fecha_actualizacion')
+        if self.sincronizado_hasta is not None:
+            # >= porque varios cambios pueden compartir marca de tiempo; reaplicarlos no tiene efecto
+            cambios = cambios.filter(fecha_actualizacion__gte=self.sincronizado_hasta)
+        cambios = list(cambios.values_list('peticion_id', 'terminos', 'activo', 'fecha_actualizacion'))
+
+        with self.lock:
+            for peticion_id, terminos, activo, fecha in cambios:
+                if activo:
+                    self._agregar(peticion_id, terminos)
+                else:
+                    self._quitar(peticion_id)
+                self.sincronizado_hasta = fecha
+
+    def buscar(self, texto, k=5, excluir=None):
+        """
+        Retorna [(peticion_id, similitud)] de los k documentos más parecidos al texto
+        """
+        self.sincronizar()
+        consulta = Counter(tokenizar(texto))
+
+        with self.lock:
+            if not self.normas_vigentes:
+                self._calcular_normas()
+
+            puntajes = defaultdict(float)
+            norma_consulta = 0.0
+            for termino, frecuencia in consulta.items():
+                docs = self.postings.get(termino)
+                if not docs:
+                    continue
+                idf = self.idf(termino)
+                peso_consulta = (1 + math.log(frecuencia)) * idf
+                norma_consulta += peso_consulta ** 2
+                for peticion_id, peso in docs.items():
+                    puntajes[peticion_id] += peso_consulta * peso * idf
+
+            puntajes.pop(excluir, None)
+            if not puntajes:
+                return []
+
+            norma_consulta = math.sqrt(norma_consulta)
+            resultados = [
+                (peticion_id, puntaje / (norma_consulta * self.normas[peticion_id]))
+                for peticion_id, puntaje in puntajes.items()
+            ]
+
+        resultados.sort(key=lambda resultado: resultado[1], reverse=True)
+        return resultados[:k]
+
+
+# Un índice por proceso
+indice = IndiceSimilitud()
+
+
+def indexar_peticion(peticion):
+    """
+    Agrega (o actualiza) la petición en el índice si está respondida y
+    transcrita; en otro caso la da de baja
+    """
+    if peticion.estado == 'respondido' and peticion.transcripcion_completa:
+        terminos = Counter(tokenizar(peticion.transcripcion_completa))
+        VectorSimilitud.objects.update_or_create(
+            peticion=peticion,
+            defaults={'terminos': dict(terminos), 'activo': True}
+        )
+    else:
+        # update() no toca auto_now: la fecha se fija para que los demás procesos vean la baja
+        VectorSimilitud.objects.filter(peticion=peticion, activo=True).update(activo=False, fecha_actualizacion=timezone.now())
+
+
+def reconstruir_indice():
+    """
+    Recalcula los vectores de todas las peticiones respondidas. Retorna cuántas quedaron indexadas.
+    """
+    indexadas = 0
+    for peticion in Peticion.objects.filter(estado='respondido').exclude(transcripcion_completa=''):
+        indexar_peticion(peticion)
+        indexadas += 1
+    VectorSimilitud.objects.exclude(peticion__estado='respondido').filter(activo=True).update(
+        activo=False, fecha_actualizacion=timezone.now()
+    )
+    return indexadas
+
+
+def respuesta_final(peticion):
+    """
+    Texto de la respuesta dada a una petición: la respuesta registrada o, si
+    no hay, el último borrador del asistente. Sin consultas si las respuestas
+    y borradores vienen precargados (peticiones_similares los precarga).
+    """
+    respuesta = next(iter(peticion.respuestas.all()[:1]), None)
+    if respuesta:
+        return respuesta.contenido_respuesta
+    borrador = next(iter(peticion.borradores.all()[:1]), None)
+    return borrador.contenido if borrador else ''
+
+
+def peticiones_similares(peticion, k=5, visibles=None):
+    """
+    Retorna [(Peticion, similitud)] de las peticiones respondidas más
+    parecidas, de mayor a menor similitud, con sus respuestas y borradores
+    precargados. Con ``visibles`` (queryset, p. ej. visible_para(usuario))
+    solo incluye esas: se piden más candidatos al índice porque algunos
+    pueden quedar por fuera.
+    """
+    if visibles is None:
+        visibles = Peticion.objects.all()
+        candidatos = k
+    else:
+        candidatos = k * 4
+
+    resultados = indice.buscar(peticion.transcripcion_completa, k=candidatos, excluir=peticion.pk)
+    peticiones = visibles.select_related('dependencia').in_bulk([peticion_id for peticion_id, _ in resultados])
+    similares = [
+        (peticiones[peticion_id], similitud)
+        for peticion_id, similitud in resultados
+        if peticion_id in peticiones
+    ][:k]
+    prefetch_related_objects([similar for similar, _ in similares], 'respuestas', 'borradores')
+    return similares
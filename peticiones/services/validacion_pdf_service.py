@@ -0,0 +1,89 @@
+# services/validacion_pdf_service.py
+"""
+Validación barata de los PDF subidos, antes de crear la petición.
+
+Confirma que el archivo es un PDF por su encabezado (%PDF- en el primer KB)
+y abriéndolo con PyPDF2, que solo lee la tabla de referencias cruzadas y el
+trailer: las páginas se cargan al pedirlas. Así un archivo dañado o que no es
+PDF se rechaza en el formulario y no consume un radicado para fallar luego en
+el procesamiento en segundo plano.
+
+Además entrega los metadatos que guarda la petición: número de páginas, si
+está cifrado y si es escaneado (solo imágenes, sin texto extraíble), para que
+el procesamiento IA elija el camino de extracción desde el principio.
+"""
+from django.core.exceptions import ValidationError
+import PyPDF2
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bytes del inicio del archivo en los que debe aparecer el encabezado (la norma tolera basura antes)
+BYTES_ENCABEZADO = 1024
+
+# Páginas que se revisan para decidir si el PDF es escaneado y caracteres de texto que
+# debe tener cada una en promedio para considerarlo con texto
+PAGINAS_MUESTRA = 3
+CARACTERES_MINIMOS_PAGINA = 20
+
+
+def abrir_pdf(archivo):
+    """
+    PdfReader del archivo, descifrado si solo tiene contraseña de propietario
+    (se abre sin contraseña). Lanza ValidationError si no es un PDF legible.
+    """
+    archivo.seek(0)
+    if b'%PDF-' not in archivo.read(BYTES_ENCABEZADO):
+        raise ValidationError('El archivo no es un PDF válido.')
+
+    archivo.seek(0)
+    try:
+        lector = PyPDF2.PdfReader(archivo)
+    except Exception as e:
+        logger.warning(f"PDF rechazado, no se pudo leer su estructura: {str(e)}")
+        raise ValidationError('El archivo PDF está dañado o incompleto.')
+
+    if lector.is_encrypted:
+        try:
+            descifrado = lector.decrypt('')
+        except Exception as e:
+            logger.warning(f"PDF cifrado que no se pudo descifrar: {str(e)}")
+            descifrado = 0
+        if not descifrado:
+            raise ValidationError('El PDF está protegido con contraseña. Suba una copia sin contraseña.')
+    return lector
+
+
+def es_escaneado(lector):
+    """True si las primeras páginas no tienen texto extraíble (son imágenes)"""
+    muestra = min(len(lector.pages), PAGINAS_MUESTRA)
+    caracteres = 0
+    for indice in range(muestra):
+        try:
+            caracteres += len((lector.pages[indice].extract_text() or '').strip())
+        except Exception as e:
+            logger.warning(f"No se pudo extraer texto de la página {indice + 1}: {str(e)}")
+    return caracteres < CARACTERES_MINIMOS_PAGINA * muestra
+
+
+def analizar_pdf(archivo):
+    """
+    Valida el PDF (objeto de archivo con seek) y retorna sus metadatos:
+    {'paginas', 'cifrado', 'escaneado'}. Lanza ValidationError si no sirve.
+    """
+    lector = abrir_pdf(archivo)
+    try:
+        paginas = len(lector.pages)
+    except Exception as e:
+        logger.warning(f"PDF rechazado, no se pudieron contar sus páginas: {str(e)}")
+        raise ValidationError('El archivo PDF está dañado o incompleto.')
+    if not paginas:
+        raise ValidationError('El PDF no tiene páginas.')
+
+    metadatos = {
+        'paginas': paginas,
+        'cifrado': lector.is_encrypted,
+        'escaneado': es_escaneado(lector),
+    }
+    archivo.seek(0)
+    return metadatos
@@ -0,0 +1,333 @@
+# peticiones/storage.py
+"""
+Almacenamiento de los archivos subidos direccionado por contenido.
+
+Cada archivo se guarda una sola vez como ``contenido/ab/cd/<sha256>.<ext>``,
+sin importar el ``upload_to`` del campo ni el nombre original: el mismo PDF
+recibido por correo y por ventanilla ocupa un solo archivo en disco y en los
+respaldos, y el nombre ya trae el hash para quien lo necesite (ETag de la
+descarga, reprocesamiento sin cambios).
+
+Como varios registros pueden apuntar al mismo archivo, ``delete`` solo lo
+borra cuando ningún campo de archivo de los modelos lo referencia. Los
+archivos que quedan sin referencias los elimina el comando
+``limpiar_archivos_huerfanos``.
+
+Los archivos pueden estar en MEDIA_ROOT (AlmacenamientoContenido) o en un
+almacenamiento de objetos S3 compatible (AlmacenamientoObjetos), según
+ALMACENAMIENTO_ARCHIVOS.
+"""
+from datetime import datetime, timezone as dt_timezone
+from urllib.parse import quote, urlencode
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.db import models
+from django.utils._os import safe_join
+from django.utils.functional import cached_property
+import hashlib
+import hmac
+import io
+import mimetypes
+import os
+import re
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_CONTENIDO = 'contenido'
+NOMBRE_CONTENIDO = re.compile(rf'^{DIRECTORIO_CONTENIDO}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/([0-9a-f]{{64}})(\.[a-z0-9]+)?$')
+
+
+def sha256_de_nombre(nombre):
+    """SHA-256 del archivo si su nombre es direccionado por contenido, o None"""
+    coincidencia = NOMBRE_CONTENIDO.match(nombre or '')
+    return coincidencia.group(1) if coincidencia else None
+
+
+def nombre_por_contenido(sha256, nombre_original):
+    extension = os.path.splitext(nombre_original)[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,10}', extension):
+        extension = ''
+    return f'{DIRECTORIO_CONTENIDO}/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}'
+
+
+def campos_de_archivo():
+    """(modelo, nombre_campo) de todos los FileField de los modelos instalados"""
+    return [
+        (modelo, campo.name)
+        for modelo in apps.get_models()
+        for campo in modelo._meta.get_fields()
+        if isinstance(campo, models.FileField)
+    ]
+
+
+def directorios_gestionados():
+    """
+    Directorios de MEDIA_ROOT con archivos de los modelos: el del contenido y
+    los ``upload_to`` con que se guardaron los archivos anteriores a este almacenamiento
+    """
+    directorios = {DIRECTORIO_CONTENIDO}
+    for modelo, nombre_campo in campos_de_archivo():
+        upload_to = modelo._meta.get_field(nombre_campo).upload_to
+        if isinstance(upload_to, str) and upload_to.strip('/'):
+            directorios.add(upload_to.strip('/').split('/')[0])
+    return sorted(directorios)
+
+
+def contar_referencias(nombre):
+    """Registros que apuntan al archivo, sumando todos los campos de archivo"""
+    return sum(modelo._default_manager.filter(**{campo: nombre}).count() for modelo, campo in campos_de_archivo())
+
+
+def nombres_referenciados():
+    """Nombres de todos los archivos referenciados por algún registro"""
+    nombres = set()
+    for modelo, campo in campos_de_archivo():
+        nombres.update(nombre for nombre in modelo._default_manager.values_list(campo, flat=True) if nombre)
+    return nombres
+
+
+class DireccionadoPorContenido:
+    """
+    Base de los almacenamientos que nombran cada archivo por el SHA-256 de su
+    contenido y no guardan dos veces el mismo contenido. Cada backend define
+    ``_guardar_nuevo``, ``_eliminar`` y ``listar_archivos``.
+    """
+
+    def _save(self, name, content):
+        sha256 = hashlib.sha256()
+        for bloque in content.chunks():
+            sha256.update(bloque)
+        nombre = nombre_por_contenido(sha256.hexdigest(), name)
+
+        if self.exists(nombre):
+            logger.info(f"Archivo {name} ya almacenado como {nombre}")
+            return nombre
+
+        content.seek(0)
+        self._guardar_nuevo(nombre, content)
+        return nombre
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre definitivo sale del contenido en _save: no hace falta buscar uno libre
+        return name
+
+    def delete(self, name):
+        referencias = contar_referencias(name)
+        if referencias:
+            logger.info(f"Archivo {name} no se borra: tiene {referencias} referencias")
+            return
+        self._eliminar(name)
+
+
+class AlmacenamientoContenido(DireccionadoPorContenido, FileSystemStorage):
+    """
+    Archivos en MEDIA_ROOT direccionados por contenido
+    """
+
+    def _guardar_nuevo(self, nombre, content):
+        # Se escribe con un nombre temporal y se renombra: dos subidas simultáneas
+        # del mismo contenido terminan en el mismo archivo completo
+        temporal = FileSystemStorage._save(self, f'{nombre}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporal), self.path(nombre))
+
+    def _eliminar(self, name):
+        FileSystemStorage.delete(self, name)
+        # Quitar las carpetas de reparto que quedan vacías (contenido/ab/cd)
+        if sha256_de_nombre(name):
+            carpeta = os.path.dirname(self.path(name))
+            for _ in range(2):
+                try:
+                    os.rmdir(carpeta)
+                except OSError:
+                    break
+                carpeta = os.path.dirname(carpeta)
+
+    def listar_archivos(self, directorios):
+        """(nombre, tamaño, fecha de modificación) de los archivos bajo los directorios"""
+        for directorio in directorios:
+            for carpeta, _, archivos in os.walk(self.path(directorio)):
+                for archivo in archivos:
+                    nombre = os.path.relpath(os.path.join(carpeta, archivo), self.location).replace(os.sep, '/')
+                    yield nombre, self.size(nombre), self.get_modified_time(nombre)
+
+
+class ClienteObjetosLocal:
+    """
+    Sustituto local de un servicio S3 compatible (tipo MinIO) para desarrollo
+    y pruebas: guarda los objetos en OBJETOS_LOCAL_RAIZ/<bucket>/ y firma las
+    URLs de descarga con HMAC, que valida la vista ``servir_objeto_local``
+    """
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.raiz = os.path.join(settings.OBJETOS_LOCAL_RAIZ, bucket)
+
+    def ruta(self, clave):
+        return safe_join(self.raiz, clave)
+
+    def subir(self, clave, contenido, tipo):
+        ruta = self.ruta(clave)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        temporal = f'{ruta}.{uuid.uuid4().hex}.tmp'
+        with open(temporal, 'wb') as archivo:
+            for bloque in contenido.chunks():
+                archivo.write(bloque)
+        os.replace(temporal, ruta)
+
+    def existe(self, clave):
+        return os.path.isfile(self.ruta(clave))
+
+    def abrir(self, clave):
+        return File(open(self.ruta(clave), 'rb'), name=clave)
+
+    def tamano(self, clave):
+        return os.path.getsize(self.ruta(clave))
+
+    def modificado(self, clave):
+        return datetime.fromtimestamp(os.path.getmtime(self.ruta(clave)), tz=dt_timezone.utc)
+
+    def eliminar(self, clave):
+        if self.existe(clave):
+            os.remove(self.ruta(clave))
+
+    def listar(self, prefijo):
+        for carpeta, _, archivos in os.walk(self.ruta(prefijo)):
+            for archivo in archivos:
+                clave = os.path.relpath(os.path.join(carpeta, archivo), self.raiz).replace(os.sep, '/')
+                yield clave, self.tamano(clave), self.modificado(clave)
+
+    @staticmethod
+    def firma(bucket, clave, expira):
+        mensaje = f'{bucket}/{clave}:{expira}'.encode('utf-8')
+        return hmac.new(settings.SECRET_KEY.encode('utf-8'), mensaje, hashlib.sha256).hexdigest()
+
+    @classmethod
+    def firma_valida(cls, bucket, clave, expira, firma):
+        try:
+            vigente = int(expira) >= time.time()
+        except (TypeError, ValueError):
+            return False
+        return vigente and hmac.compare_digest(cls.firma(bucket, clave, expira), firma or '')
+
+    def url_firmada(self, clave, segundos):
+        expira = int(time.time()) + segundos
+        consulta = urlencode({'expira': expira, 'firma': self.firma(self.bucket, clave, expira)})
+        return f'/objetos/{self.bucket}/{quote(clave)}?{consulta}'
+
+
+class ClienteS3:
+    """
+    Cliente de un servicio S3 compatible (AWS, MinIO, R2...) con boto3
+    """
+
+    def __init__(self, bucket):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise ImproperlyConfigured('El almacenamiento S3 requiere boto3 (pip install boto3)')
+
+        self.bucket = bucket
+        self.ClientError = ClientError
+        self.s3 = boto3.client(
+            's3',
+            endpoint_url=settings.OBJETOS_ENDPOINT_URL or None,
+            region_name=settings.OBJETOS_REGION,
+            aws_access_key_id=settings.OBJETOS_ACCESS_KEY or None,
+            aws_secret_access_key=settings.OBJETOS_SECRET_KEY or None,
+        )
+
+    def cabecera(self, clave):
+        try:
+            return self.s3.head_object(Bucket=self.bucket, Key=clave)
+        except self.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def subir(self, clave, contenido, tipo):
+        self.s3.upload_fileobj(contenido, self.bucket, clave, ExtraArgs={'ContentType': tipo})
+
+    def existe(self, clave):
+        return self.cabecera(clave) is not None
+
+    def abrir(self, clave):
+        # Los PDF se leen completos para extraer su texto
+        cuerpo = self.s3.get_object(Bucket=self.bucket, Key=clave)['Body']
+        return File(io.BytesIO(cuerpo.read()), name=clave)
+
+    def tamano(self, clave):
+        return self.cabecera(clave)['ContentLength']
+
+    def modificado(self, clave):
+        return self.cabecera(clave)['LastModified']
+
+    def eliminar(self, clave):
+        self.s3.delete_object(Bucket=self.bucket, Key=clave)
+
+    def listar(self, prefijo):
+        paginas = self.s3.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=f'{prefijo}/')
+        for pagina in paginas:
+            for objeto in pagina.get('Contents', []):
+                yield objeto['Key'], objeto['Size'], objeto['LastModified']
+
+    def url_firmada(self, clave, segundos):
+        return self.s3.generate_presigned_url(
+            'get_object', Params={'Bucket': self.bucket, 'Key': clave}, ExpiresIn=segundos
+        )
+
+
+CLIENTES_OBJETOS = {
+    's3': ClienteS3,
+    'local': ClienteObjetosLocal,
+}
+
+
+class AlmacenamientoObjetos(DireccionadoPorContenido, Storage):
+    """
+    Archivos direccionados por contenido en un almacenamiento de objetos
+    (OBJETOS_CLIENTE), para correr varias instancias de la aplicación sin un
+    volumen compartido.
+
+    ``url`` sigue apuntando a /media/, donde se validan los permisos de la
+    petición; la descarga en sí es una redirección a una URL firmada de corta
+    duración (``url_firmada``), así que la aplicación no transmite los bytes.
+    """
+
+    @cached_property
+    def cliente(self):
+        return CLIENTES_OBJETOS[settings.OBJETOS_CLIENTE](settings.OBJETOS_BUCKET)
+
+    def _open(self, name, mode='rb'):
+        return self.cliente.abrir(name)
+
+    def _guardar_nuevo(self, nombre, content):
+        self.cliente.subir(nombre, content, mimetypes.guess_type(nombre)[0] or 'application/octet-stream')
+
+    def _eliminar(self, name):
+        self.cliente.eliminar(name)
+
+    def exists(self, name):
+        return self.cliente.existe(name)
+
+    def size(self, name):
+        return self.cliente.tamano(name)
+
+    def get_modified_time(self, name):
+        return self.cliente.modificado(name)
+
+    def url(self, name):
+        return f'{settings.MEDIA_URL}{quote(name)}'
+
+    def url_firmada(self, name):
+        return self.cliente.url_firmada(name, settings.OBJETOS_URL_EXPIRA)
+
+    def listar_archivos(self, directorios):
+        for directorio in directorios:
+            yield from self.cliente.listar(directorio)
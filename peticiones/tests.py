@@ -1,3 +1,1204 @@
-from django.test import TestCase
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from google.api_core import exceptions as google_exceptions
+from PIL import Image
+
+from .models import Peticion, ProcesamientoIA, IntentoProcesamientoIA, LoteReprocesamiento, AnalisisAsistente, BorradorRespuesta, RespuestaPeticion, Usuario, Dependencia, CorreoSaliente, DiaNoHabil, AlertaVencimientoEnviada
+from .services import cache_contexto_service, gemini_fake_service, similitud_service
+from .services.gemini_fake_service import FakeGenerativeModel
+from .services.gemini_service import GeminiTranscriptionService, adquirir_bloqueo
+from .services.asistente_respuesta_service import AsistenteRespuestaService, evaluar_borrador
+from .services.modelo_ia_service import generar_contenido, MetricasIA
+from .services.cola_ia_service import ColaIA
+from .services.documento_word_service import obtener_plantilla
+from .services.validacion_pdf_service import analizar_pdf
+from .services.miniatura_service import generar_miniaturas
+from .services.correo_service import encolar_correo, enviar_pendientes
+from .services.dias_habiles_service import DiasHabilesService, CalendarioHabil
+from .media_views import peticion_del_archivo
+from .storage import sha256_de_nombre
+from .services.reprocesamiento_service import crear_lote, ejecutar_lote, procesar_item, seleccionar_peticiones
+
+
+def crear_pdf(texto):
+    """Construye un PDF mínimo de una página con el texto indicado"""
+    contenido = f"BT /F1 12 Tf 72 720 Td ({texto}) Tj ET".encode('latin-1')
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>",
+        b"<< /Length " + str(len(contenido)).encode() + b" >>\nstream\n" + contenido + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for numero, objeto in enumerate(objetos, 1):
+        offsets.append(len(pdf))
+        pdf += f"{numero} 0 obj\n".encode() + objeto + b"\nendobj\n"
+    inicio_xref = len(pdf)
+    pdf += f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        pdf += f"{offset:010d} 00000 n \n".encode()
+    pdf += f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode()
+    return pdf
+
+
+def analizar(peticion):
+    """El análisis del asistente por el mismo camino asíncrono que usan las vistas"""
+    return async_to_sync(AsistenteRespuestaService().aanalizar_peticion_y_generar_preguntas)(peticion)
+
+
+def generar_respuesta(peticion, respuestas_usuario):
+    return async_to_sync(AsistenteRespuestaService().agenerar_respuesta_sugerida)(peticion, respuestas_usuario)
+
+
+class BaseIATestCase(TestCase):
+    """Pruebas que usan el backend simulado de Gemini y un MEDIA_ROOT temporal"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(
+            GEMINI_BACKEND='fake',
+            GEMINI_FAKE_LATENCIA=0.0,
+            GEMINI_FAKE_TASA_ERROR=0.0,
+            GEMINI_FAKE_TASA_429=0.0,
+            GEMINI_ESPERA_REINTENTO=0.0,
+            MEDIA_ROOT=self.media_root,
+        )
+        self.override.enable()
+        gemini_fake_service.reiniciar()
+        cache_contexto_service.olvidar_contextos()
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def crear_peticion(self, texto='Solicito informacion sobre el alumbrado publico'):
+        peticion = Peticion(fecha_radicacion=timezone.now(), fuente='presencial')
+        peticion.archivo_pdf.save('peticion.pdf', ContentFile(crear_pdf(texto)), save=False)
+        peticion.save()
+        return peticion
+
+    def crear_usuario(self, cedula='1001', prefijo='111'):
+        dependencia, _ = Dependencia.objects.get_or_create(prefijo=prefijo, defaults={'nombre_oficina': f'Oficina {prefijo}'})
+        return Usuario.objects.create_user(
+            cedula=cedula, nombre_completo='Funcionario Prueba', email=f'{cedula}@municipio.gov.co',
+            password='clave-segura-123', cargo='Profesional', dependencia=dependencia
+        )
+
+
+class GeminiFakeServiceTests(BaseIATestCase):
+
+    def test_transcripcion_conserva_texto_y_cuenta_tokens(self):
+        peticion = self.crear_peticion()
+
+        self.assertTrue(GeminiTranscriptionService().procesar_peticion_completa(peticion))
+
+        peticion.refresh_from_db()
+        self.assertIn('alumbrado publico', peticion.transcripcion_completa)
+        self.assertEqual(peticion.peticionario_nombre, 'Peticionario de Prueba')
+        self.assertEqual(peticion.procesamiento_ia.estado_procesamiento, 'exitoso')
+
+        uso = gemini_fake_service.contador.resumen()
+        self.assertEqual(uso['llamadas'], 2)
+        self.assertGreater(uso['tokens_entrada'], uso['tokens_salida'])
+
+    def test_asistente_devuelve_json_predefinido(self):
+        peticion = self.crear_peticion()
+        peticion.transcripcion_completa = 'Solicito informacion sobre el alumbrado publico'
+        peticion.save()
+
+        analisis = analizar(peticion)
+
+        self.assertIn('preguntas', analisis)
+        self.assertEqual(gemini_fake_service.contador.resumen()['por_modelo']['gemini-2.5-pro']['llamadas'], 1)
+
+    def test_inyeccion_de_errores_429_y_500(self):
+        with self.assertRaises(google_exceptions.ResourceExhausted):
+            FakeGenerativeModel(tasa_429=1.0).generate_content('hola')
+        with self.assertRaises(google_exceptions.InternalServerError):
+            FakeGenerativeModel(tasa_error=1.0).generate_content('hola')
+
+        uso = gemini_fake_service.contador.resumen()
+        self.assertEqual((uso['errores_429'], uso['errores'], uso['llamadas']), (1, 1, 0))
+
+    def test_error_en_pipeline_queda_registrado(self):
+        peticion = self.crear_peticion()
+
+        with override_settings(GEMINI_FAKE_TASA_ERROR=1.0):
+            GeminiTranscriptionService().procesar_peticion_completa(peticion)
+
+        # La transcripción cae al texto extraído del PDF cuando la IA falla
+        peticion.refresh_from_db()
+        self.assertIn('alumbrado publico', peticion.transcripcion_completa)
+        self.assertTrue(ProcesamientoIA.objects.filter(peticion=peticion).exists())
+
+
+class ModeloFallaUnaVez(FakeGenerativeModel):
+    """Modelo simulado que responde 429 en la primera llamada"""
+
+    def __init__(self):
+        super().__init__(latencia=0)
+        self.fallos_pendientes = 1
+
+    def generate_content(self, contents, **kwargs):
+        if self.fallos_pendientes:
+            self.fallos_pendientes -= 1
+            raise google_exceptions.ResourceExhausted('Resource has been exhausted (simulado)')
+        return super().generate_content(contents, **kwargs)
+
+
+class HistorialProcesamientoTests(BaseIATestCase):
+
+    def test_reprocesar_conserva_historial_con_tiempos_por_etapa(self):
+        peticion = self.crear_peticion()
+        servicio = GeminiTranscriptionService()
+
+        servicio.procesar_peticion_completa(peticion)
+        servicio.reanalizar_peticion(peticion)
+
+        intentos = IntentoProcesamientoIA.objects.filter(peticion=peticion)
+        self.assertEqual(intentos.count(), 2)
+        self.assertEqual(ProcesamientoIA.objects.filter(peticion=peticion).count(), 1)
+        for intento in intentos:
+            self.assertEqual(intento.resultado, 'exitoso')
+            self.assertEqual(intento.modelo_ia_usado, 'gemini-2.5-flash')
+            self.assertGreater(intento.tokens_entrada, 0)
+            for campo, _ in IntentoProcesamientoIA.ETAPAS:
+                self.assertIsNotNone(getattr(intento, campo))
+
+    def test_reintentos_ante_429_quedan_contados(self):
+        metricas = MetricasIA()
+
+        response = generar_contenido(ModeloFallaUnaVez(), 'hola', metricas)
+
+        self.assertTrue(response.text)
+        self.assertEqual((metricas.reintentos, metricas.llamadas), (1, 1))
+
+    def test_estadisticas_por_etapa_en_json(self):
+        GeminiTranscriptionService().procesar_peticion_completa(self.crear_peticion())
+        self.client.force_login(self.crear_usuario())
+
+        data = self.client.get('/procesamiento-ia/estadisticas/?dias=7').json()
+
+        self.assertEqual(data['periodo']['tiempo_transcripcion']['n'], 1)
+        self.assertEqual(len(data['serie']), 1)
+        self.assertIn('p95', data['serie'][0]['etapas']['tiempo_total'])
+
+
+class AsistenteStreamTests(BaseIATestCase):
+
+    def test_stream_entrega_tokens_y_luego_respuesta(self):
+        peticion = self.crear_peticion()
+        self.client.force_login(self.crear_usuario())
+
+        response = self.client.post(
+            f'/peticion/{peticion.radicado}/asistente/procesar-stream/',
+            data={'respuestas': [{'pregunta': '¿Dependencia?', 'respuesta': 'Infraestructura'}]},
+            content_type='application/json'
+        )
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        cuerpo = b''.join(response.streaming_content).decode()
+        eventos = [linea[7:] for linea in cuerpo.splitlines() if linea.startswith('event: ')]
+        self.assertGreater(eventos.count('token'), 1)
+        self.assertEqual(eventos[-2:], ['respuesta', 'fin'])
+
+
+class AsistenteAsincronoTests(BaseIATestCase):
+
+    def crear_peticion_transcrita(self):
+        peticion = self.crear_peticion()
+        peticion.transcripcion_completa = 'Solicito informacion sobre el alumbrado publico'
+        peticion.save()
+        return peticion
+
+    def test_vistas_asincronas_analizan_y_generan_respuesta(self):
+        peticion = self.crear_peticion_transcrita()
+        self.client.force_login(self.crear_usuario())
+
+        analisis = self.client.post(f'/peticion/{peticion.radicado}/asistente/iniciar/').json()
+        respuesta = self.client.post(
+            f'/peticion/{peticion.radicado}/asistente/procesar/',
+            data={'respuestas': [{'pregunta': '¿Dependencia?', 'respuesta': 'Infraestructura'}]},
+            content_type='application/json'
+        ).json()
+
+        self.assertTrue(analisis['success'])
+        self.assertIn('preguntas', analisis['analisis'])
+        self.assertTrue(respuesta['success'])
+        self.assertEqual(respuesta['estado_evaluacion'], 'pendiente')
+
+    def test_permisos_se_validan_en_vista_asincrona(self):
+        peticion = self.crear_peticion_transcrita()
+        peticion.dependencia = Dependencia.objects.create(prefijo='222', nombre_oficina='Oficina 222')
+        peticion.save()
+        self.client.force_login(self.crear_usuario(prefijo='333'))
+
+        response = self.client.post(f'/peticion/{peticion.radicado}/asistente/iniciar/')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(gemini_fake_service.contador.resumen()['llamadas'], 0)
+
+    async def test_stream_asgi_usa_generador_asincrono(self):
+        peticion = await sync_to_async(self.crear_peticion_transcrita)()
+        await self.async_client.aforce_login(await sync_to_async(self.crear_usuario)())
+
+        response = await self.async_client.post(
+            f'/peticion/{peticion.radicado}/asistente/procesar-stream/',
+            data={'respuestas': [{'pregunta': '¿Dependencia?', 'respuesta': 'Infraestructura'}]},
+            content_type='application/json'
+        )
+
+        self.assertTrue(response.is_async)
+        cuerpo = b''.join([parte async for parte in response.streaming_content]).decode()
+        self.assertIn('event: fin', cuerpo)
+
+
+class AnalisisAsistenteCacheTests(BaseIATestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.peticion = self.crear_peticion()
+        self.peticion.transcripcion_completa = 'Solicito informacion sobre el alumbrado publico'
+        self.peticion.save()
+        self.url = f'/peticion/{self.peticion.radicado}/asistente/iniciar/'
+
+    def iniciar(self, **datos):
+        return self.client.post(self.url, data=datos, content_type='application/json').json()
+
+    def test_analisis_se_reutiliza_entre_usuarios(self):
+        self.client.force_login(self.crear_usuario())
+        primero = self.iniciar()
+        self.client.force_login(self.crear_usuario(cedula='1002'))
+        segundo = self.iniciar()
+
+        self.assertFalse(primero['desde_cache'])
+        self.assertTrue(segundo['desde_cache'])
+        self.assertEqual(primero['analisis'], segundo['analisis'])
+        self.assertEqual(gemini_fake_service.contador.resumen()['llamadas'], 1)
+        self.assertEqual(self.client.get(f'/peticion/{self.peticion.radicado}/asistente/').status_code, 200)
+
+    def test_cambio_de_transcripcion_o_regenerar_invalidan(self):
+        self.client.force_login(self.crear_usuario())
+        self.iniciar()
+
+        self.peticion.transcripcion_completa += ' del barrio centro'
+        self.peticion.save()
+        tras_cambio = self.iniciar()
+        regenerado = self.iniciar(regenerar=True)
+
+        self.assertFalse(tras_cambio['desde_cache'])
+        self.assertFalse(regenerado['desde_cache'])
+        self.assertEqual(gemini_fake_service.contador.resumen()['llamadas'], 3)
+        self.assertEqual(AnalisisAsistente.objects.filter(peticion=self.peticion).count(), 1)
+
+
+class BorradorRespuestaTests(BaseIATestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.peticion = self.crear_peticion()
+        self.client.force_login(self.crear_usuario())
+
+    def generar(self, respuesta):
+        return self.client.post(
+            f'/peticion/{self.peticion.radicado}/asistente/procesar/',
+            data={'respuestas': [{'pregunta': '¿Dependencia?', 'respuesta': respuesta}]},
+            content_type='application/json'
+        ).json()
+
+    def test_cada_generacion_queda_como_version(self):
+        primera = self.generar('Infraestructura')
+        segunda = self.generar('Planeacion')
+
+        self.assertEqual((primera['version'], segunda['version']), (1, 2))
+        borrador = BorradorRespuesta.objects.get(peticion=self.peticion, version=2)
+        self.assertEqual(borrador.respuestas_usuario[0]['respuesta'], 'Planeacion')
+        self.assertEqual(borrador.modelo_ia_usado, 'gemini-2.5-pro')
+        self.assertGreater(borrador.tokens_salida, 0)
+        self.assertEqual(borrador.estado_evaluacion, 'pendiente')
+
+    def test_historial_compara_y_descarga_sin_llamar_al_modelo(self):
+        self.generar('Infraestructura')
+        BorradorRespuesta.objects.filter(version=1).update(contenido='Linea comun\nTexto anterior')
+        self.generar('Planeacion')
+        BorradorRespuesta.objects.filter(version=2).update(contenido='Linea comun\nTexto nuevo')
+        llamadas = gemini_fake_service.contador.resumen()['llamadas']
+
+        historial = self.client.get(f'/peticion/{self.peticion.radicado}/asistente/historial/?comparar=1&con=2')
+        word = self.client.get(f'/peticion/{self.peticion.radicado}/asistente/borradores/2/word/')
+
+        self.assertEqual(
+            historial.context['diferencias'],
+            [('igual', 'Linea comun'), ('eliminada', 'Texto anterior'), ('agregada', 'Texto nuevo')]
+        )
+        self.assertEqual(word.status_code, 200)
+        self.assertIn('_v2_', word['Content-Disposition'])
+        self.assertEqual(gemini_fake_service.contador.resumen()['llamadas'], llamadas)
+
+
+class EvaluacionBorradorTests(BaseIATestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.peticion = self.crear_peticion()
+        self.client.force_login(self.crear_usuario())
+
+    def generar(self):
+        return self.client.post(
+            f'/peticion/{self.peticion.radicado}/asistente/procesar/',
+            data={'respuestas': [{'pregunta': '¿Dependencia?', 'respuesta': 'Infraestructura'}]},
+            content_type='application/json'
+        ).json()
+
+    def test_evaluacion_en_segundo_plano_con_modelo_rapido(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            data = self.generar()
+        uso = gemini_fake_service.contador.resumen()['por_modelo']
+
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotIn('gemini-2.5-flash', uso)
+
+        evaluar_borrador(BorradorRespuesta.objects.get(version=data['version']).pk)
+        url = f'/peticion/{self.peticion.radicado}/asistente/borradores/{data["version"]}/evaluacion/'
+        evaluacion = self.client.get(url).json()
+
+        self.assertEqual(evaluacion['estado_evaluacion'], 'completada')
+        self.assertIn('puntuacion_total', evaluacion['evaluacion'])
+        self.assertEqual(gemini_fake_service.contador.resumen()['por_modelo']['gemini-2.5-flash']['llamadas'], 1)
+
+    def test_dependencia_puede_desactivar_evaluacion(self):
+        self.peticion.dependencia = Dependencia.objects.create(
+            prefijo='222', nombre_oficina='Oficina 222', evaluar_respuestas_ia=False
+        )
+        self.peticion.save()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            data = self.generar()
+        self.assertEqual(data['estado_evaluacion'], 'desactivada')
+        self.assertEqual(len(callbacks), 0)
+
+        # Bajo demanda se puede evaluar igual
+        url = f'/peticion/{self.peticion.radicado}/asistente/borradores/{data["version"]}/evaluacion/'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(self.client.post(url).json()['estado_evaluacion'], 'pendiente')
+        self.assertEqual(len(callbacks), 1)
+
+
+class PeticionesSimilaresTests(BaseIATestCase):
+
+    TEXTOS = {
+        'alumbrado': 'Solicito la reparacion de las luminarias del alumbrado publico apagadas en la calle del barrio',
+        'predial': 'Solicito un acuerdo de pago del impuesto predial y revisar el avaluo catastral de mi predio',
+        'suelo': 'Solicito certificado de uso del suelo para abrir un establecimiento de comercio',
+    }
+
+    def setUp(self):
+        super().setUp()
+        similitud_service.indice = similitud_service.IndiceSimilitud()
+        self.respondidas = {}
+        for clave, texto in self.TEXTOS.items():
+            peticion = self.crear_peticion()
+            peticion.transcripcion_completa = texto
+            peticion.estado = 'respondido'
+            peticion.save()
+            BorradorRespuesta.objects.create(
+                peticion=peticion, version=1, contenido=f'Respuesta sobre {clave}',
+                modelo_ia_usado='gemini-2.5-pro', tiempo_generacion=1.0
+            )
+            similitud_service.indexar_peticion(peticion)
+            self.respondidas[clave] = peticion
+        self.nueva = self.crear_peticion()
+        self.nueva.transcripcion_completa = 'Las luminarias de mi calle estan apagadas, pido reparar el alumbrado'
+        self.nueva.save()
+
+    def test_endpoint_devuelve_la_mas_parecida_con_su_respuesta(self):
+        self.client.force_login(self.crear_usuario())
+
+        data = self.client.get(f'/peticion/{self.nueva.radicado}/similares/?k=2').json()
+
+        self.assertEqual(data['similares'][0]['radicado'], self.respondidas['alumbrado'].radicado)
+        self.assertEqual(data['similares'][0]['respuesta'], 'Respuesta sobre alumbrado')
+        self.assertEqual(data['similares'][0]['url'], f"/peticion/{self.respondidas['alumbrado'].radicado}/")
+        self.assertLessEqual(len(data['similares']), 2)
+
+    def test_solo_visibles_y_sin_consultas_por_resultado(self):
+        usuario = self.crear_usuario(prefijo='200')
+        visibles = [self.respondidas['alumbrado'].pk, self.respondidas['suelo'].pk]
+        Peticion.objects.filter(pk__in=visibles).update(dependencia=usuario.dependencia)
+
+        # Cambios del índice, candidatos, respuestas y borradores: cuatro consultas sin importar cuántos resultados haya
+        with self.assertNumQueries(4):
+            similares = similitud_service.peticiones_similares(
+                self.nueva, k=3, visibles=Peticion.objects.visible_para(usuario)
+            )
+            respuestas = [similitud_service.respuesta_final(similar) for similar, _ in similares]
+
+        self.assertLessEqual({similar.pk for similar, _ in similares}, set(visibles))
+        self.assertIn('Respuesta sobre alumbrado', respuestas)
+
+    def test_indice_se_actualiza_incrementalmente(self):
+        alumbrado = self.respondidas['alumbrado']
+        self.assertEqual(similitud_service.peticiones_similares(self.nueva, k=1)[0][0], alumbrado)
+
+        alumbrado.estado = 'sin_responder'
+        alumbrado.save()
+        similitud_service.indexar_peticion(alumbrado)
+
+        radicados = [similar.radicado for similar, _ in similitud_service.peticiones_similares(self.nueva)]
+        self.assertNotIn(alumbrado.radicado, radicados)
+
+    def test_precedentes_se_incluyen_en_el_prompt(self):
+        servicio = AsistenteRespuestaService()
+
+        contexto, instrucciones = async_to_sync(servicio.apreparar_respuesta)(self.nueva, [])
+
+        self.assertEqual([p['radicado'] for p in servicio.precedentes], [self.respondidas['alumbrado'].radicado])
+        self.assertIn('Respuesta sobre alumbrado', instrucciones)
+        self.assertIn(self.nueva.transcripcion_completa, contexto)
+
+
+class PresupuestoTokensTests(BaseIATestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.peticion = self.crear_peticion()
+        self.peticion.transcripcion_completa = 'Solicito la reparacion del alumbrado publico de mi barrio. ' * 200
+        self.peticion.save()
+
+    @override_settings(ASISTENTE_PRESUPUESTO_TOKENS=1500)
+    def test_peticion_extensa_usa_resumen_generado_una_vez(self):
+        with self.assertLogs('peticiones.services.modelo_ia_service', level='INFO') as logs:
+            analizar(self.peticion)
+            generar_respuesta(self.peticion, [])
+
+        uso = gemini_fake_service.contador.resumen()['por_modelo']
+        self.assertEqual(uso['gemini-2.5-flash']['llamadas'], 1)
+        self.assertEqual(uso['gemini-2.5-pro']['llamadas'], 2)
+        # Las llamadas al modelo principal quedan dentro del presupuesto
+        self.assertLess(uso['gemini-2.5-pro']['tokens_entrada'], 2 * 1500)
+        self.assertTrue(any('[analisis]' in linea and 'presupuesto 1500' in linea for linea in logs.output))
+
+        self.peticion.refresh_from_db()
+        self.assertTrue(self.peticion.resumen_condensado)
+
+        # Si la transcripción cambia, el resumen guardado deja de servir
+        self.peticion.transcripcion_completa += ' Adjunto fotografias.'
+        analizar(self.peticion)
+        self.assertEqual(gemini_fake_service.contador.resumen()['por_modelo']['gemini-2.5-flash']['llamadas'], 2)
+
+    def test_peticion_dentro_del_presupuesto_usa_texto_completo(self):
+        analizar(self.peticion)
+
+        self.assertNotIn('gemini-2.5-flash', gemini_fake_service.contador.resumen()['por_modelo'])
+        self.peticion.refresh_from_db()
+        self.assertEqual(self.peticion.resumen_condensado, '')
+
+
+class CacheContextoTests(BaseIATestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.peticion = self.crear_peticion()
+        self.peticion.transcripcion_completa = 'Solicito la poda de los arboles del parque principal. ' * 100
+        self.peticion.save()
+
+    def test_analisis_y_respuesta_comparten_el_contenido_en_cache(self):
+        analizar(self.peticion)
+        generar_respuesta(self.peticion, [])
+
+        uso = gemini_fake_service.contador.resumen()
+        self.assertEqual(uso['contextos_creados'], 1)
+        self.assertEqual(uso['llamadas'], 2)
+        contexto = AsistenteRespuestaService().construir_contexto(self.peticion.transcripcion_completa)
+        self.assertGreaterEqual(uso['tokens_cacheados'], 2 * len(contexto) // 4)
+
+    def test_sin_cache_o_con_cache_vencida_se_envia_en_linea(self):
+        with override_settings(GEMINI_CACHE_CONTEXTO=False):
+            en_linea = analizar(self.peticion)
+        self.assertEqual(gemini_fake_service.contador.resumen()['contextos_creados'], 0)
+
+        analizar(self.peticion)
+        # La API descarta el contenido (vencimiento): la llamada sigue funcionando en línea
+        gemini_fake_service.FakeCachedContent.eliminar_todos()
+        con_cache_vencida = analizar(self.peticion)
+        analizar(self.peticion)
+
+        self.assertEqual(en_linea, con_cache_vencida)
+        uso = gemini_fake_service.contador.resumen()
+        self.assertEqual(uso['contextos_creados'], 2)
+        self.assertEqual(uso['errores'], 0)
+
+
+class ReprocesamientoMasivoTests(BaseIATestCase):
+
+    def test_omite_peticiones_sin_cambios(self):
+        actualizada = self.crear_peticion()
+        self.crear_peticion('Solicito copia del contrato de obra')
+        GeminiTranscriptionService().procesar_peticion_completa(actualizada)
+        gemini_fake_service.reiniciar()
+
+        salida = StringIO()
+        call_command('reprocesar_peticiones', concurrencia=1, stdout=salida)
+
+        lote = LoteReprocesamiento.objects.get()
+        self.assertEqual((lote.estado, lote.total, lote.procesadas, lote.omitidas), ('completado', 2, 1, 1))
+        self.assertEqual(lote.items.get(peticion=actualizada).estado, 'omitido')
+        # Solo la petición nueva llamó al modelo (transcripción y extracción de datos)
+        self.assertEqual(gemini_fake_service.contador.resumen()['llamadas'], 2)
+        self.assertIn('[2/2 100%]', salida.getvalue())
+
+    def test_reanuda_lote_interrumpido(self):
+        primera = self.crear_peticion()
+        self.crear_peticion('Solicito copia del contrato de obra')
+        lote = crear_lote(seleccionar_peticiones(estado='sin_procesar'), concurrencia=1)
+        procesar_item(lote.items.get(peticion=primera).pk)
+        LoteReprocesamiento.objects.filter(pk=lote.pk).update(estado='interrumpido')
+        gemini_fake_service.reiniciar()
+
+        call_command('reprocesar_peticiones', reanudar=lote.pk, stdout=StringIO())
+
+        lote.refresh_from_db()
+        self.assertEqual((lote.estado, lote.procesadas), ('completado', 2))
+        self.assertEqual(gemini_fake_service.contador.resumen()['llamadas'], 2)
+        self.assertFalse(seleccionar_peticiones(estado='sin_procesar').exists())
+
+    def test_peticion_bloqueada_queda_pendiente_para_reanudar(self):
+        bloqueada = self.crear_peticion()
+        self.crear_peticion('Solicito copia del contrato de obra')
+        self.assertTrue(adquirir_bloqueo(bloqueada)[0])
+
+        salida = StringIO()
+        call_command('reprocesar_peticiones', concurrencia=1, stdout=salida)
+
+        lote = LoteReprocesamiento.objects.get()
+        self.assertEqual((lote.estado, lote.procesadas, lote.omitidas), ('interrumpido', 1, 0))
+        self.assertEqual(lote.items.get(peticion=bloqueada).estado, 'pendiente')
+        self.assertIn(f'--reanudar {lote.pk}', salida.getvalue())
+
+        # Terminado el otro procesamiento, el lote se reanuda con ella
+        ProcesamientoIA.objects.filter(peticion=bloqueada).update(estado_procesamiento='error')
+        call_command('reprocesar_peticiones', reanudar=lote.pk, stdout=StringIO())
+        lote.refresh_from_db()
+        self.assertEqual((lote.estado, lote.procesadas, lote.omitidas), ('completado', 2, 0))
+
+    def test_filtro_por_prefijo_y_concurrencia_en_la_cola(self):
+        peticiones = [self.crear_peticion() for _ in range(5)]
+        Peticion.objects.update(dependencia=self.crear_usuario(prefijo='111').dependencia)
+        self.assertEqual(seleccionar_peticiones(dependencia='111').count(), 5)
+        self.assertFalse(seleccionar_peticiones(dependencia='0111').exists())
+
+        lote = crear_lote(peticiones, concurrencia=2)
+        items = {item.pk: item for item in lote.items.all()}
+        candado, activos, maximo = threading.Lock(), [0], [0]
+
+        def procesar(item_id, forzar):
+            with candado:
+                activos[0] += 1
+                maximo[0] = max(maximo[0], activos[0])
+            time.sleep(0.02)
+            with candado:
+                activos[0] -= 1
+            return items[item_id]
+
+        class ColaEnHilos:
+            def __init__(self):
+                self.executor = ThreadPoolExecutor(max_workers=4)
+
+            def encolar(self, peticion, funcion, *args, origen):
+                return self.executor.submit(funcion, *args)
+
+        cola = ColaEnHilos()
+        with mock.patch('peticiones.services.reprocesamiento_service.procesar_item', procesar):
+            ejecutar_lote(lote, cola=cola)
+        cola.executor.shutdown()
+        # La cola tiene 4 trabajadores, pero el lote no ocupa más de su concurrencia
+        self.assertEqual(maximo[0], 2)
+
+
+class ColaIATests(BaseIATestCase):
+
+    def crear_con_vencimiento(self, dias):
+        peticion = self.crear_peticion()
+        peticion.fecha_vencimiento = timezone.localdate() + timedelta(days=dias)
+        peticion.save()
+        return peticion
+
+    def test_orden_por_vencimiento_origen_y_envejecimiento(self):
+        cola = ColaIA(workers=1)
+        lejana, urgente, masiva = (self.crear_con_vencimiento(dias) for dias in (30, 0, 30))
+        antigua = self.crear_con_vencimiento(30)
+
+        ahora = time.time()
+        with mock.patch('peticiones.services.cola_ia_service.time.time', return_value=ahora - 3600):
+            # Una hora esperando equivale a 30 días hábiles menos
+            cola.encolar(antigua, str.upper, 'antigua', origen='masivo', iniciar=False)
+        cola.encolar(masiva, str.upper, 'masiva', origen='masivo', iniciar=False)
+        cola.encolar(lejana, str.upper, 'lejana', iniciar=False)
+        cola.encolar(urgente, str.upper, 'urgente', origen='masivo', iniciar=False)
+
+        self.assertEqual(cola.estadisticas()['niveles']['critica']['en_cola_por_origen']['masivo'], 1)
+
+        orden = []
+        while (trabajo := cola.tomar_siguiente(bloquear=False)) is not None:
+            cola.ejecutar(trabajo)
+            orden.append(trabajo.futuro.result())
+        self.assertEqual(orden, ['ANTIGUA', 'URGENTE', 'LEJANA', 'MASIVA'])
+
+        estadisticas = cola.estadisticas()
+        self.assertEqual(estadisticas['en_cola'], 0)
+        self.assertEqual(estadisticas['niveles']['baja']['completados'], 3)
+        self.assertGreaterEqual(estadisticas['niveles']['baja']['espera_p95'], 3600)
+
+    def test_estadisticas_de_cola_en_json(self):
+        self.client.force_login(self.crear_usuario())
+
+        data = self.client.get('/procesamiento-ia/cola/').json()
+
+        self.assertTrue(data['success'])
+        self.assertEqual(list(data['niveles']), ['critica', 'alta', 'media', 'baja'])
+
+
+class BloqueoProcesamientoTests(BaseIATestCase):
+
+    def test_segunda_solicitud_se_une_al_procesamiento_en_curso(self):
+        peticion = self.crear_peticion()
+        self.client.force_login(self.crear_usuario())
+        url = f'/peticion/{peticion.radicado}/reprocesar/'
+
+        with mock.patch('peticiones.views.cola_ia.encolar') as encolar:
+            primera = self.client.post(url, HTTP_IDEMPOTENCY_KEY='clave-1').json()
+            repetida = self.client.post(url, HTTP_IDEMPOTENCY_KEY='clave-1').json()
+            otra = self.client.post(url, HTTP_IDEMPOTENCY_KEY='clave-2').json()
+
+        self.assertEqual(encolar.call_count, 1)
+        self.assertFalse(primera['en_curso'])
+        self.assertTrue(repetida['en_curso'])
+        self.assertEqual((otra['en_curso'], otra['clave_idempotencia']), (True, 'clave-1'))
+        # Mientras está en curso, procesarla por otra vía no llama al modelo
+        self.assertFalse(GeminiTranscriptionService().procesar_peticion_completa(peticion))
+        self.assertEqual(gemini_fake_service.contador.llamadas, 0)
+
+    def test_bloqueo_se_libera_al_terminar_o_al_vencer(self):
+        peticion = self.crear_peticion()
+
+        adquirido, procesamiento = adquirir_bloqueo(peticion)
+        self.assertTrue(adquirido)
+        self.assertFalse(adquirir_bloqueo(peticion)[0])
+        self.assertTrue(GeminiTranscriptionService().procesar_peticion_completa(
+            peticion, clave_bloqueo=procesamiento.clave_idempotencia
+        ))
+        self.assertTrue(adquirir_bloqueo(peticion)[0])
+
+        # Un procesamiento que quedó 'procesando' (p. ej. el servidor se reinició) no bloquea para siempre
+        ProcesamientoIA.objects.filter(peticion=peticion).update(inicio_proceso=timezone.now() - timedelta(hours=1))
+        adquirido, procesamiento = adquirir_bloqueo(peticion, 'nueva')
+        self.assertTrue(adquirido)
+        self.assertEqual(procesamiento.clave_idempotencia, 'nueva')
+
+    def test_trabajo_encolado_con_bloqueo_vencido_no_se_ejecuta(self):
+        peticion = self.crear_peticion()
+        self.client.force_login(self.crear_usuario())
+        url = f'/peticion/{peticion.radicado}/reprocesar/'
+
+        with mock.patch('peticiones.views.cola_ia.encolar') as encolar:
+            self.client.post(url, HTTP_IDEMPOTENCY_KEY='clave-1')
+            # El primer trabajo sigue en la cola cuando su bloqueo se da por vencido
+            ProcesamientoIA.objects.filter(peticion=peticion).update(inicio_proceso=timezone.now() - timedelta(hours=1))
+            self.client.post(url, HTTP_IDEMPOTENCY_KEY='clave-2')
+        self.assertEqual(encolar.call_count, 2)
+
+        primero, segundo = (llamada.args[1] for llamada in encolar.call_args_list)
+        primero()
+        self.assertEqual(gemini_fake_service.contador.llamadas, 0)
+        segundo()
+        self.assertEqual(ProcesamientoIA.objects.get(peticion=peticion).estado_procesamiento, 'exitoso')
+
+
+class EstadoProcesamientoTests(BaseIATestCase):
+
+    def test_estado_con_etag_y_solo_peticiones_visibles(self):
+        propia, ajena = self.crear_peticion(), self.crear_peticion()
+        self.client.force_login(self.crear_usuario(prefijo='200'))
+        Peticion.objects.filter(pk=propia.pk).update(dependencia=Dependencia.objects.get(prefijo='200'))
+        url = f'/peticiones/estado-procesamiento/?radicados={propia.radicado},{ajena.radicado}'
+
+        response = self.client.get(url)
+        self.assertEqual(response.json()['peticiones'], {
+            propia.radicado: {'estado': 'sin_responder', 'estado_procesamiento': 'sin_procesar', 'transcrita': False}
+        })
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        sin_cambios = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((sin_cambios.status_code, sin_cambios.content), (304, b''))
+
+        adquirir_bloqueo(propia)
+        cambio = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cambio.status_code, 200)
+        self.assertEqual(cambio.json()['peticiones'][propia.radicado]['estado_procesamiento'], 'procesando')
+
+
+class PlantillaWordTests(BaseIATestCase):
+
+    def guardar_plantilla(self, ruta, *runs):
+        from docx import Document
+        documento = Document()
+        parrafo = documento.add_paragraph()
+        for texto in runs:
+            parrafo.add_run(texto)
+        documento.sections[0].header.paragraphs[0].text = 'Radicado {{RADICADO}}'
+        documento.save(ruta)
+
+    def test_marcadores_partidos_en_runs_y_encabezado(self):
+        ruta = f'{self.media_root}/plantilla.docx'
+        self.guardar_plantilla(ruta, 'Ciudad: {{CIU', 'DAD}}', ', {{FECHA}}')
+
+        plantilla = obtener_plantilla(ruta)
+        documento = plantilla.rellenar({'{{CIUDAD}}': 'Rionegro', '{{FECHA}}': 'hoy', '{{RADICADO}}': 'R-1'})
+
+        self.assertIs(obtener_plantilla(ruta), plantilla)
+        self.assertEqual(documento.paragraphs[0].text, 'Ciudad: Rionegro, hoy')
+        self.assertEqual(documento.sections[0].header.paragraphs[0].text, 'Radicado R-1')
+        # La plantilla en caché no se modifica
+        self.assertEqual(plantilla.documento.paragraphs[0].text, 'Ciudad: {{CIUDAD}}, {{FECHA}}')
+
+    def test_plantilla_se_recarga_si_cambia_el_archivo(self):
+        ruta = f'{self.media_root}/plantilla.docx'
+        self.guardar_plantilla(ruta, '{{FECHA}}')
+        anterior = obtener_plantilla(ruta)
+
+        self.guardar_plantilla(ruta, 'Fecha: {{FECHA}}')
+        os.utime(ruta, (anterior.mtime + 10, anterior.mtime + 10))
+
+        self.assertEqual(obtener_plantilla(ruta).rellenar({'{{FECHA}}': 'hoy'}).paragraphs[0].text, 'Fecha: hoy')
+
+
+class LoteWordTests(BaseIATestCase):
+
+    @override_settings(WORD_LOTE_WORKERS=2)
+    def test_zip_con_el_ultimo_borrador_de_cada_peticion(self):
+        peticiones = [self.crear_peticion() for _ in range(3)]
+        for peticion in peticiones[:2]:
+            for version in (1, 2):
+                BorradorRespuesta.objects.create(
+                    peticion=peticion, version=version, contenido=f'Respuesta v{version}',
+                    modelo_ia_usado='gemini-2.5-pro', tiempo_generacion=1.0
+                )
+        self.client.force_login(self.crear_usuario())
+
+        response = self.client.post(
+            '/asistente/descargar-word-lote/',
+            data={'radicados': [peticion.radicado for peticion in peticiones]},
+            content_type='application/json'
+        )
+
+        self.assertTrue(response.streaming)
+        with zipfile.ZipFile(BytesIO(b''.join(response.streaming_content))) as archivo_zip:
+            nombres = archivo_zip.namelist()
+            omitidas = archivo_zip.read('OMITIDAS.txt').decode()
+        self.assertEqual(len(nombres), 3)
+        for peticion in peticiones[:2]:
+            self.assertTrue(any(nombre.startswith(f'Respuesta_{peticion.radicado}_v2_') for nombre in nombres))
+        self.assertIn(peticiones[2].radicado, omitidas)
+
+    def test_json_invalido(self):
+        self.client.force_login(self.crear_usuario())
+        for cuerpo in ('{radicados', '["dpet"]', '{"radicados": "dpet"}'):
+            response = self.client.post('/asistente/descargar-word-lote/', data=cuerpo, content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {'success': False, 'error': 'Solicitud inválida'})
+
+
+class ServirMediaTests(BaseIATestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.peticion = self.crear_peticion()
+        self.url = self.peticion.archivo_pdf.url
+        self.tamano = self.peticion.archivo_pdf.size
+
+    def test_rangos_y_respuesta_304(self):
+        self.client.force_login(self.crear_usuario())
+
+        completo = self.client.get(self.url)
+        self.assertEqual(completo['Accept-Ranges'], 'bytes')
+        self.assertIn('private', completo['Cache-Control'])
+
+        parcial = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(b''.join(parcial.streaming_content), b'%PDF-1.4\n1')
+        self.assertEqual(parcial['Content-Range'], f'bytes 0-9/{self.tamano}')
+
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE=f'bytes={self.tamano}-').status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=completo['ETag']).status_code, 304)
+
+    def test_permisos_y_delegacion_al_proxy(self):
+        self.client.force_login(self.crear_usuario(prefijo='200'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+        Peticion.objects.filter(pk=self.peticion.pk).update(dependencia=Dependencia.objects.get(prefijo='200'))
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/media-protegida/{self.peticion.archivo_pdf.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_busca_el_dueno_sin_join(self):
+        respuesta = RespuestaPeticion(peticion=self.peticion, contenido_respuesta='Respuesta', funcionario_responsable='Jurídica')
+        respuesta.archivo_respuesta.save('respuesta.pdf', ContentFile(crear_pdf('Respuesta')))
+        usuario = self.crear_usuario()
+
+        for nombre in (respuesta.archivo_respuesta.name, self.peticion.archivo_pdf.name, 'miniaturas/otra.png'):
+            with CaptureQueriesContext(connection) as consultas:
+                dueno = peticion_del_archivo(nombre, usuario)
+            self.assertEqual(dueno, None if nombre.startswith('miniaturas/') else self.peticion)
+            self.assertNotIn('JOIN', consultas[0]['sql'])
+
+
+class AlmacenamientoContenidoTests(BaseIATestCase):
+
+    def test_mismo_contenido_se_guarda_una_vez_y_se_borra_sin_referencias(self):
+        primera, segunda = self.crear_peticion(), self.crear_peticion()
+
+        self.assertEqual(primera.archivo_pdf.name, segunda.archivo_pdf.name)
+        self.assertEqual(sha256_de_nombre(primera.archivo_pdf.name), hashlib.sha256(crear_pdf(
+            'Solicito informacion sobre el alumbrado publico')).hexdigest())
+
+        nombre = primera.archivo_pdf.name
+        primera.delete()
+        default_storage.delete(nombre)
+        self.assertTrue(default_storage.exists(nombre))
+
+        segunda.delete()
+        default_storage.delete(nombre)
+        self.assertFalse(default_storage.exists(nombre))
+
+    def test_limpieza_de_huerfanos_y_migracion(self):
+        peticion = self.crear_peticion()
+        huerfano = default_storage.save('peticiones/huerfano.pdf', ContentFile(b'%PDF-1.4 sin registro'))
+        antiguo = 'peticiones/antiguo.pdf'
+        os.makedirs(os.path.join(self.media_root, 'peticiones'), exist_ok=True)
+        with open(os.path.join(self.media_root, antiguo), 'wb') as archivo:
+            archivo.write(crear_pdf('Peticion antigua'))
+        Peticion.objects.filter(pk=peticion.pk).update(archivo_respuesta_firmada=antiguo)
+
+        salida = StringIO()
+        call_command('limpiar_archivos_huerfanos', '--migrar', '--horas=0', stdout=salida)
+
+        peticion.refresh_from_db()
+        self.assertTrue(sha256_de_nombre(peticion.archivo_respuesta_firmada.name))
+        self.assertTrue(default_storage.exists(peticion.archivo_respuesta_firmada.name))
+        self.assertTrue(default_storage.exists(peticion.archivo_pdf.name))
+        self.assertFalse(default_storage.exists(huerfano))
+        self.assertFalse(default_storage.exists(antiguo))
+        self.assertIn('2 archivos huérfanos borrados', salida.getvalue())
+
+
+class AlmacenamientoObjetosTests(BaseIATestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.objetos = override_settings(
+            STORAGES={
+                'default': {'BACKEND': 'peticiones.storage.AlmacenamientoObjetos'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+            OBJETOS_CLIENTE='local',
+            OBJETOS_LOCAL_RAIZ=os.path.join(self.media_root, 'objetos'),
+        )
+        self.objetos.enable()
+
+    def tearDown(self):
+        self.objetos.disable()
+        super().tearDown()
+
+    def test_descarga_por_url_firmada_y_lectura_para_ia(self):
+        peticion = self.crear_peticion()
+        self.client.force_login(self.crear_usuario())
+
+        self.assertTrue(os.path.isfile(os.path.join(self.media_root, 'objetos', 'cividata-dpet', peticion.archivo_pdf.name)))
+        redireccion = self.client.get(peticion.archivo_pdf.url)
+        self.assertEqual(redireccion.status_code, 302)
+        self.assertTrue(redireccion['Location'].startswith('/objetos/cividata-dpet/contenido/'))
+
+        self.client.logout()
+        descarga = self.client.get(redireccion['Location'])
+        self.assertEqual(b''.join(descarga.streaming_content)[:8], b'%PDF-1.4')
+        self.assertEqual(self.client.get(redireccion['Location'].replace('firma=', 'firma=0')).status_code, 403)
+
+        self.assertTrue(GeminiTranscriptionService().procesar_peticion_completa(peticion))
+
+
+@override_settings(CARGAS_TAMANO_FRAGMENTO=256)
+class CargaFragmentadaTests(BaseIATestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cargas = override_settings(CARGAS_DIRECTORIO=os.path.join(self.media_root, 'cargas'))
+        self.cargas.enable()
+        self.client.force_login(self.crear_usuario())
+        self.pdf = crear_pdf('Solicito informacion sobre el alumbrado publico ' * 5)
+
+    def tearDown(self):
+        self.cargas.disable()
+        super().tearDown()
+
+    def subir(self, carga_id, indice):
+        fragmento = self.pdf[indice * 256:(indice + 1) * 256]
+        return self.client.put(
+            f'/cargas/{carga_id}/fragmentos/{indice}/', fragmento, content_type='application/octet-stream',
+            HTTP_X_CHECKSUM_SHA256=hashlib.sha256(fragmento).hexdigest()
+        )
+
+    def test_carga_reanudable_y_creacion_de_peticion(self):
+        inicio = self.client.post('/cargas/', {
+            'nombre': 'peticion.pdf', 'tamano': len(self.pdf), 'sha256': hashlib.sha256(self.pdf).hexdigest()
+        }, content_type='application/json').json()
+        carga_id, total = inicio['carga_id'], inicio['total_fragmentos']
+        self.assertGreater(total, 2)
+
+        # Checksum equivocado: se rechaza sin guardar el fragmento
+        malo = self.client.put(f'/cargas/{carga_id}/fragmentos/0/', self.pdf[:256],
+                               content_type='application/octet-stream', HTTP_X_CHECKSUM_SHA256='0' * 64)
+        self.assertEqual(malo.status_code, 400)
+
+        self.subir(carga_id, 0)
+        self.subir(carga_id, 2)
+        self.assertEqual(self.client.get(f'/cargas/{carga_id}/').json()['recibidos'], [0, 2])
+        self.assertEqual(self.client.post(f'/cargas/{carga_id}/completar/').status_code, 400)
+
+        for indice in range(total):
+            if indice not in (0, 2):
+                self.subir(carga_id, indice)
+        completada = self.client.post(f'/cargas/{carga_id}/completar/').json()
+        self.assertEqual(completada['estado'], 'completada')
+
+        with mock.patch('peticiones.views.cola_ia.encolar'):
+            response = self.client.post('/crear/', {
+                'fecha_radicacion': timezone.now().strftime('%Y-%m-%dT%H:%M'),
+                'fuente': 'presencial',
+                'carga_id': carga_id,
+            })
+        self.assertEqual(response.status_code, 302)
+        peticion = Peticion.objects.get()
+        self.assertEqual(peticion.archivo_pdf.read(), self.pdf)
+        self.assertEqual(sha256_de_nombre(peticion.archivo_pdf.name), hashlib.sha256(self.pdf).hexdigest())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'cargas', carga_id)))
+
+        # Una carga ya usada no sirve para otra petición
+        with mock.patch('peticiones.views.cola_ia.encolar'):
+            otra = self.client.post('/crear/', {
+                'fecha_radicacion': timezone.now().strftime('%Y-%m-%dT%H:%M'),
+                'fuente': 'presencial',
+                'carga_id': carga_id,
+            })
+        self.assertEqual(otra.status_code, 200)
+        self.assertEqual(Peticion.objects.count(), 1)
+
+
+class ValidacionPDFTests(BaseIATestCase):
+
+    def test_metadatos_y_rechazo_de_archivos_que_no_son_pdf(self):
+        self.assertEqual(analizar_pdf(BytesIO(crear_pdf('Solicito informacion sobre el alumbrado publico'))),
+                         {'paginas': 1, 'cifrado': False, 'escaneado': False})
+        self.assertTrue(analizar_pdf(BytesIO(crear_pdf('')))['escaneado'])
+
+        for contenido in (b'PK\x03\x04 no es un pdf', b'%PDF-1.4\n1 0 obj\n<< /Type /Catalog'):
+            with self.assertRaises(ValidationError):
+                analizar_pdf(BytesIO(contenido))
+
+    def test_formulario_rechaza_pdf_danado_sin_consumir_radicado(self):
+        self.client.force_login(self.crear_usuario())
+        datos = {'fecha_radicacion': timezone.now().strftime('%Y-%m-%dT%H:%M'), 'fuente': 'presencial'}
+
+        response = self.client.post('/crear/', {**datos, 'archivo_pdf': ContentFile(b'%PDF-1.4 truncado', name='dano.pdf')})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Peticion.objects.exists())
+
+        with mock.patch('peticiones.views.cola_ia.encolar'):
+            self.client.post('/crear/', {**datos, 'archivo_pdf': ContentFile(crear_pdf(''), name='escaneado.pdf')})
+        peticion = Peticion.objects.get()
+        self.assertEqual((peticion.pdf_paginas, peticion.pdf_escaneado), (1, True))
+
+
+class MiniaturaTests(BaseIATestCase):
+
+    def test_miniatura_una_vez_por_documento_y_cache_larga(self):
+        primera, segunda = self.crear_peticion(), self.crear_peticion()
+        self.assertTrue(GeminiTranscriptionService().procesar_peticion_completa(primera))
+
+        primera.refresh_from_db()
+        with primera.miniatura.open('rb') as archivo:
+            imagen = Image.open(archivo)
+            self.assertEqual((imagen.format, imagen.width), ('PNG', 200))
+        self.assertTrue(primera.vista_previa.name.endswith('.jpg'))
+
+        # Mismo PDF: se reutilizan las imágenes sin renderizar de nuevo
+        with mock.patch('peticiones.services.miniatura_service.renderizar_paginas') as renderizar:
+            self.assertTrue(generar_miniaturas(segunda))
+        renderizar.assert_not_called()
+        segunda.refresh_from_db()
+        self.assertEqual(segunda.miniatura.name, primera.miniatura.name)
+
+        self.client.force_login(self.crear_usuario())
+        response = self.client.get(primera.miniatura.url)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+
+class VisibilidadPeticionesTests(BaseIATestCase):
+
+    def test_alcance_por_dependencia_en_una_consulta(self):
+        propia, ajena = self.crear_peticion(), self.crear_peticion()
+        usuario = self.crear_usuario(cedula='2002', prefijo='200')
+        Peticion.objects.filter(pk=propia.pk).update(dependencia=usuario.dependencia)
+
+        usuario = Usuario.objects.get(pk=usuario.pk)
+        # Sin consultar la dependencia del usuario: cada listado es una sola consulta
+        with self.assertNumQueries(2):
+            self.assertEqual(list(Peticion.objects.visible_para(usuario)), [propia])
+            self.assertEqual(Peticion.objects.visible_para(usuario).count(), 1)
+        self.assertTrue(Peticion.objects.visible_para(self.crear_usuario()).filter(pk=ajena.pk).exists())
+
+        self.client.force_login(usuario)
+        self.assertEqual(self.client.get(f'/peticion/{propia.radicado}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/peticion/{ajena.radicado}/').status_code, 404)
+
+    def test_endpoints_del_asistente_responden_404_a_otra_dependencia(self):
+        ajena = self.crear_peticion()
+        Peticion.objects.filter(pk=ajena.pk).update(
+            dependencia=self.crear_usuario(cedula='3003', prefijo='300').dependencia,
+            transcripcion_completa='Solicito informacion sobre el alumbrado publico'
+        )
+        self.client.force_login(self.crear_usuario(cedula='2002', prefijo='200'))
+
+        for ruta, datos in [
+            ('asistente/iniciar/', {}),
+            ('asistente/procesar/', {'respuestas': [{'pregunta': '¿Dependencia?', 'respuesta': 'Infraestructura'}]}),
+            ('asistente/descargar-word/', {'contenido_respuesta': 'Respuesta'}),
+        ]:
+            respuesta = self.client.post(f'/peticion/{ajena.radicado}/{ruta}', data=datos, content_type='application/json')
+            self.assertEqual(respuesta.status_code, 404, ruta)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', CORREO_ESPERA_REINTENTO=60)
+class BandejaSalidaTests(BaseIATestCase):
+
+    def test_registro_encola_y_el_lote_usa_una_conexion(self):
+        jefe = self.crear_usuario()
+        self.client.force_login(jefe)
+        with mock.patch('peticiones.services.correo_service.remitente_correo.despertar'):
+            self.client.post('/usuarios/registro/', {
+                'cedula': '3003', 'nombre_completo': 'Nuevo Funcionario', 'email': 'nuevo@municipio.gov.co',
+                'cargo': 'Técnico', 'dependencia': '111',
+            })
+        self.assertEqual(len(mail.outbox), 0)
+        encolar_correo('Aviso', 'Cuerpo', ['otro@municipio.gov.co'])
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as abrir:
+            self.assertEqual(enviar_pendientes(), (2, 0))
+        abrir.assert_called_once()
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['nuevo@municipio.gov.co', 'otro@municipio.gov.co'])
+        self.assertFalse(CorreoSaliente.objects.exclude(cuerpo='').exists())
+
+    def test_reintento_con_espera_exponencial(self):
+        correo = encolar_correo('Aviso', 'Cuerpo', ['otro@municipio.gov.co'])
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('SMTP caído')):
+            self.assertEqual(enviar_pendientes(), (0, 1))
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ('pendiente', 1))
+        # Aún no toca el reintento
+        self.assertEqual(enviar_pendientes(), (0, 0))
+
+        CorreoSaliente.objects.filter(pk=correo.pk).update(proximo_intento=timezone.now())
+        self.assertEqual(enviar_pendientes(), (1, 0))
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ('enviado', 2))
+
+
+class AlertasVencimientoTests(BaseIATestCase):
+
+    def test_calendario_coincide_con_el_servicio(self):
+        DiaNoHabil.objects.create(fecha=date(2026, 10, 20), descripcion='Día cívico')
+        calendario = CalendarioHabil(date(2026, 9, 25), date(2026, 11, 20))
+
+        with self.assertNumQueries(0):
+            conteos = [calendario.contar_dias_habiles_entre_fechas(date(2026, 10, 1), date(2026, 10, 1) + timedelta(days=n))
+                       for n in range(45)]
+        esperados = [DiasHabilesService.contar_dias_habiles_entre_fechas(date(2026, 10, 1), date(2026, 10, 1) + timedelta(days=n))
+                     for n in range(45)]
+        self.assertEqual(conteos, esperados)
+        self.assertEqual(calendario.dias_habiles_restantes(date(2026, 10, 19), date(2026, 10, 14)), -3)
+
+    def test_un_resumen_por_responsable_sin_repetir(self):
+        responsable = self.crear_usuario(cedula='2002', prefijo='222')
+        self.crear_usuario(cedula='3003', prefijo='333')
+        vencimientos = {'vencida': date(2026, 10, 14), 'por_vencer': date(2026, 10, 21), 'lejana': date(2026, 11, 30)}
+        for vencimiento in vencimientos.values():
+            peticion = self.crear_peticion()
+            Peticion.objects.filter(pk=peticion.pk).update(
+                dependencia=responsable.dependencia, fecha_vencimiento=vencimiento
+            )
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as abrir:
+            call_command('enviar_alertas_vencimiento', fecha='2026-10-19', stdout=StringIO())
+        abrir.assert_called_once()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['2002@municipio.gov.co'])
+        self.assertIn('VENCIDAS (1)', mail.outbox[0].body)
+        self.assertIn('en 2 días hábiles', mail.outbox[0].body)
+        self.assertEqual(AlertaVencimientoEnviada.objects.count(), 2)
+
+        # Una segunda corrida el mismo día no repite alertas
+        call_command('enviar_alertas_vencimiento', fecha='2026-10-19', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_vencida_el_viernes_en_fin_de_semana(self):
+        responsable = self.crear_usuario(cedula='2002', prefijo='222')
+        peticion = self.crear_peticion()
+        Peticion.objects.filter(pk=peticion.pk).update(
+            dependencia=responsable.dependencia, fecha_vencimiento=date(2026, 10, 16)
+        )
+
+        call_command('enviar_alertas_vencimiento', fecha='2026-10-17', stdout=StringIO())
+        alerta = AlertaVencimientoEnviada.objects.get()
+        self.assertEqual((alerta.tipo, alerta.dias_habiles_restantes), ('vencida', -1))
+        self.assertIn('VENCIDAS (1)', mail.outbox[0].body)
+        self.assertNotIn('vence HOY', mail.outbox[0].body)
+
+        # El lunes sigue vencida: no se envía otro resumen
+        call_command('enviar_alertas_vencimiento', fecha='2026-10-19', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_tablero_cuenta_las_vencidas_como_proximas_a_vencer(self):
+        usuario = self.crear_usuario(cedula='2002', prefijo='222')
+        hoy = date.today()
+        for vencimiento in (hoy - timedelta(days=10), hoy, hoy + timedelta(days=60)):
+            peticion = self.crear_peticion()
+            Peticion.objects.filter(pk=peticion.pk).update(dependencia=usuario.dependencia, fecha_vencimiento=vencimiento)
+        self.client.force_login(usuario)
+
+        self.assertEqual(self.client.get('/').context['proximas_vencer'], 2)
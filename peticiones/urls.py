@@ -28,17 +28,29 @@ urlpatterns = [
     # Peticiones
     path('', views.index, name='index'),
     path('crear/', views.crear_peticion, name='crear_peticion'),
+    path('cargas/', views.iniciar_carga_fragmentada, name='iniciar_carga_fragmentada'),
+    path('cargas/<uuid:carga_id>/', views.estado_carga_fragmentada, name='estado_carga_fragmentada'),
+    path('cargas/<uuid:carga_id>/fragmentos/<int:indice>/', views.subir_fragmento, name='subir_fragmento'),
+    path('cargas/<uuid:carga_id>/completar/', views.completar_carga_fragmentada, name='completar_carga_fragmentada'),
     path('lista/', views.ListaPeticiones.as_view(), name='lista_peticiones'),
+    path('peticiones/estado-procesamiento/', views.estado_procesamiento_peticiones, name='estado_procesamiento_peticiones'),
     path('peticion/<str:radicado>/', views.detalle_peticion, name='detalle_peticion'),
     path('peticion/<str:radicado>/reprocesar/', views.reprocesar_peticion, name='reprocesar_peticion'),
     path('peticion/<str:radicado>/cambiar-estado/', views.cambiar_estado_peticion, name='cambiar_estado_peticion'),
     path('peticion/<str:radicado>/editar-peticionario/', views.editar_peticionario, name='editar_peticionario'),
     path('peticion/<str:radicado>/datos-peticionario/', views.obtener_datos_peticionario, name='obtener_datos_peticionario'),
+    path('procesamiento-ia/estadisticas/', views.estadisticas_procesamiento_ia, name='estadisticas_procesamiento_ia'),
+    path('procesamiento-ia/cola/', views.estadisticas_cola_ia, name='estadisticas_cola_ia'),
     
     # Asistente IA
+    path('asistente/descargar-word-lote/', views.descargar_lote_word, name='descargar_lote_word'),
+    path('peticion/<str:radicado>/similares/', views.buscar_peticiones_similares, name='buscar_peticiones_similares'),
     path('peticion/<str:radicado>/asistente/iniciar/', views.iniciar_asistente_respuesta, name='iniciar_asistente_respuesta'),
     path('peticion/<str:radicado>/asistente/', views.mostrar_asistente_respuesta, name='mostrar_asistente_respuesta'),
     path('peticion/<str:radicado>/asistente/procesar/', views.procesar_respuestas_asistente, name='procesar_respuestas_asistente'),
+    path('peticion/<str:radicado>/asistente/procesar-stream/', views.procesar_respuestas_asistente_stream, name='procesar_respuestas_asistente_stream'),
     path('peticion/<str:radicado>/asistente/historial/', views.historial_asistente, name='historial_asistente'),
     path('peticion/<str:radicado>/asistente/descargar-word/', views.descargar_respuesta_word, name='descargar_respuesta_word'),
+    path('peticion/<str:radicado>/asistente/borradores/<int:version>/evaluacion/', views.evaluacion_borrador, name='evaluacion_borrador'),
+    path('peticion/<str:radicado>/asistente/borradores/<int:version>/word/', views.descargar_borrador_word, name='descargar_borrador_word'),
 ]
\ No newline at end of file
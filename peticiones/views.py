@@ -1,21 +1,40 @@
 # views.py - ARCHIVO COMPLETO ACTUALIZADO
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.urls import reverse
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponseForbidden
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.http import HttpResponse, JsonResponse, HttpResponseForbidden, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.generic import ListView, DetailView
 from datetime import timedelta
-from .models import Peticion, ProcesamientoIA
+from .models import Peticion, ProcesamientoIA, BorradorRespuesta, Usuario, CargaFragmentada
 from .forms import PeticionForm
-from .services.gemini_service import GeminiTranscriptionService
-from .services.asistente_respuesta_service import AsistenteRespuestaService
-import threading
+from .services.gemini_service import GeminiTranscriptionService, adquirir_bloqueo
+from .services.asistente_respuesta_service import (
+    AsistenteRespuestaService, analisis_guardado, comparar_borradores, programar_evaluacion
+)
+from .services.documento_word_service import DocumentoWordService, CONTENT_TYPE_DOCX, zip_en_stream
+from .services.similitud_service import indexar_peticion, peticiones_similares, respuesta_final
+from .services.cola_ia_service import cola_ia
+from .services.carga_fragmentada_service import (
+    iniciar_carga, guardar_fragmento, fragmentos_recibidos, completar_carga
+)
+from .auth_views import is_jefe_juridica
+import hashlib
 import json
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -27,30 +46,23 @@ def puede_ver_peticion(user, peticion):
     - Oficina Jurídica (prefijo 111) puede ver TODAS las peticiones
     - Superuser puede ver TODAS las peticiones
     - Otras dependencias solo pueden ver sus propias peticiones
-    """
-    # Oficina Jurídica o superuser pueden ver todo
-    if (user.dependencia and user.dependencia.prefijo == '111') or \
-       (user.cedula == '1020458606' and user.is_superuser):
-        return True
     
-    # Otras dependencias solo ven sus propias peticiones
-    return peticion.dependencia == user.dependencia
+    Para consultar peticiones use Peticion.objects.visible_para(user); esta
+    función es para las que ya están cargadas y no hace consultas.
+    """
+    return user.ve_todas_las_peticiones or peticion.dependencia_id == user.dependencia_id
 
 
 @login_required
 def index(request):
     """Vista principal con estadísticas"""
     from datetime import date
-    from .services.dias_habiles_service import DiasHabilesService
+    from .services.alertas_vencimiento_service import limite_calendario
+    from .services.dias_habiles_service import CalendarioHabil
     
     # Filtrar peticiones según dependencia del usuario
     # Si es Jefe Jurídica (dependencia 111) o superuser, puede ver todas
-    if (request.user.dependencia and request.user.dependencia.prefijo == '111') or \
-       (request.user.cedula == '1020458606' and request.user.is_superuser):
-        peticiones_queryset = Peticion.objects.all()
-    else:
-        # Solo ver peticiones de su dependencia
-        peticiones_queryset = Peticion.objects.filter(dependencia=request.user.dependencia)
+    peticiones_queryset = Peticion.objects.visible_para(request.user)
     
     total_peticiones = peticiones_queryset.count()
     sin_responder = peticiones_queryset.filter(estado='sin_responder').count()
@@ -58,22 +70,23 @@ def index(request):
     
     # Calcular peticiones próximas a vencer (menos de 3 días hábiles restantes)
     hoy = date.today()
-    proximas_vencer = 0
+    limite = limite_calendario(hoy, 3)
     
-    # Obtener peticiones sin responder con fecha de vencimiento
-    peticiones_sin_responder = peticiones_queryset.filter(
+    # Las que vencen después del límite no pueden quedar a 3 días hábiles o menos;
+    # las ya vencidas cuentan (0 días hábiles restantes)
+    vencimientos = list(peticiones_queryset.filter(
         estado='sin_responder',
-        fecha_vencimiento__isnull=False
+        fecha_vencimiento__isnull=False,
+        fecha_vencimiento__lte=limite
+    ).order_by('fecha_vencimiento').values_list('fecha_vencimiento', flat=True))
+    
+    # Un calendario precalculado: sin consultas por petición ni por día
+    calendario = CalendarioHabil(min(vencimientos[0], hoy) if vencimientos else hoy, limite)
+    proximas_vencer = sum(
+        1 for vencimiento in vencimientos
+        if calendario.contar_dias_habiles_entre_fechas(hoy, vencimiento) <= 3
     )
     
-    for peticion in peticiones_sin_responder:
-        # Calcular días hábiles restantes
-        dias_restantes = DiasHabilesService.contar_dias_habiles_entre_fechas(hoy, peticion.fecha_vencimiento)
-        
-        # Si quedan 3 días hábiles o menos, está próxima a vencer
-        if 0 <= dias_restantes <= 3:
-            proximas_vencer += 1
-    
     peticiones_recientes = peticiones_queryset.order_by('-fecha_radicacion')[:5]
     
     context = {
@@ -99,15 +112,18 @@ def crear_peticion(request):
             
             peticion.save()
             
-            # Procesar PDF con IA en segundo plano
+            # Queda 'procesando' desde ya, así un reprocesamiento pedido antes de
+            # que la cola lo atienda no duplica el trabajo
+            _, procesamiento = adquirir_bloqueo(peticion)
+            clave_bloqueo = procesamiento.clave_idempotencia
+            
+            # Procesar PDF con IA en segundo plano (si al empezar el bloqueo ya es de otra solicitud, no se ejecuta)
             def procesar_en_background():
                 gemini_service = GeminiTranscriptionService()
-                gemini_service.procesar_peticion_completa(peticion)
+                gemini_service.procesar_peticion_completa(peticion, clave_bloqueo=clave_bloqueo)
             
-            # Ejecutar procesamiento en hilo separado
-            thread = threading.Thread(target=procesar_en_background)
-            thread.daemon = True
-            thread.start()
+            # Encolar con la prioridad que da su fecha de vencimiento
+            cola_ia.encolar(peticion, procesar_en_background)
             
             messages.success(
                 request, 
@@ -121,6 +137,64 @@ def crear_peticion(request):
     return render(request, 'peticiones/crear_peticion.html', {'form': form})
 
 
+def datos_carga(carga):
+    return {
+        'success': True,
+        'carga_id': str(carga.pk),
+        'estado': carga.estado,
+        'tamano_fragmento': carga.tamano_fragmento,
+        'total_fragmentos': carga.total_fragmentos,
+        'recibidos': fragmentos_recibidos(carga) if carga.estado == 'en_curso' else [],
+    }
+
+
+@login_required
+@require_http_methods(['POST'])
+def iniciar_carga_fragmentada(request):
+    """Vista AJAX que registra una subida por fragmentos ({nombre, tamano, sha256})"""
+    try:
+        datos = json.loads(request.body)
+        carga = iniciar_carga(request.user, datos.get('nombre'), int(datos.get('tamano') or 0), datos.get('sha256', ''))
+    except (ValueError, TypeError):
+        return JsonResponse({'success': False, 'message': 'Datos de la carga inválidos'}, status=400)
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'message': e.messages[0]}, status=400)
+    return JsonResponse(datos_carga(carga), status=201)
+
+
+@login_required
+@require_http_methods(['GET'])
+def estado_carga_fragmentada(request, carga_id):
+    """Vista AJAX con los fragmentos ya recibidos, para reanudar una carga"""
+    carga = get_object_or_404(CargaFragmentada, pk=carga_id, usuario=request.user)
+    return JsonResponse(datos_carga(carga))
+
+
+@login_required
+@require_http_methods(['PUT'])
+def subir_fragmento(request, carga_id, indice):
+    """Recibe un fragmento en el cuerpo, con su SHA-256 en X-Checksum-SHA256"""
+    carga = get_object_or_404(CargaFragmentada, pk=carga_id, usuario=request.user)
+    try:
+        guardar_fragmento(carga, indice, request.body, request.headers.get('X-Checksum-SHA256', ''))
+    except ValidationError as e:
+        return JsonResponse({'success': False, 'message': e.messages[0]}, status=400)
+    return JsonResponse({'success': True, 'indice': indice})
+
+
+@login_required
+@require_http_methods(['POST'])
+def completar_carga_fragmentada(request, carga_id):
+    """Arma el archivo de una carga con todos sus fragmentos"""
+    carga = get_object_or_404(CargaFragmentada, pk=carga_id, usuario=request.user)
+    try:
+        carga = completar_carga(carga)
+    except ValidationError as e:
+        logger.warning(f"Carga {carga.pk} no se pudo completar: {e.messages[0]}")
+        return JsonResponse({'success': False, 'message': e.messages[0]}, status=400)
+    return JsonResponse(datos_carga(carga))
+
+
 class ListaPeticiones(LoginRequiredMixin, ListView):
     """Vista para listar todas las peticiones"""
     model = Peticion
@@ -131,13 +205,7 @@ class ListaPeticiones(LoginRequiredMixin, ListView):
     def get_queryset(self):
         # Filtrar por dependencia del usuario
         # Si es Jefe Jurídica (111) o superuser, puede ver todas
-        if (self.request.user.dependencia and self.request.user.dependencia.prefijo == '111') or \
-           (self.request.user.cedula == '1020458606' and self.request.user.is_superuser):
-            # Jefe Jurídica o superuser pueden ver todas las peticiones
-            queryset = Peticion.objects.select_related('dependencia').all()
-        else:
-            # Solo ver peticiones de su dependencia
-            queryset = Peticion.objects.select_related('dependencia').filter(dependencia=self.request.user.dependencia)
+        queryset = Peticion.objects.visible_para(self.request.user).select_related('dependencia', 'procesamiento_ia')
         
         # Filtros de búsqueda
         search = self.request.GET.get('search')
@@ -169,12 +237,8 @@ class ListaPeticiones(LoginRequiredMixin, ListView):
 @login_required
 def detalle_peticion(request, radicado):
     """Vista detalle de una petición específica"""
-    peticion = get_object_or_404(Peticion, radicado=radicado)
-    
-    # Verificar permisos de acceso
-    if not puede_ver_peticion(request.user, peticion):
-        messages.error(request, 'No tienes permiso para ver esta petición.')
-        return redirect('index')
+    # Solo la encuentra si el usuario puede verla (si no, 404)
+    peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
     
     # Obtener información del procesamiento IA si existe
     try:
@@ -191,32 +255,103 @@ def detalle_peticion(request, radicado):
 
 @login_required
 @csrf_exempt
-def reprocesar_peticion(request, radicado):
+async def reprocesar_peticion(request, radicado):
     """Vista AJAX para reprocesar una petición con IA"""
     if request.method == 'POST':
-        peticion = get_object_or_404(Peticion, radicado=radicado)
+        # Solo la encuentra si el usuario puede verla (si no, 404)
+        visibles = await sync_to_async(Peticion.objects.visible_para)(await request.auser())
+        peticion = await aget_object_or_404(visibles.select_related('dependencia'), radicado=radicado)
+        
+        # Un reintento del cliente con la misma clave (doble clic, red inestable)
+        # no vuelve a lanzar el trabajo: recibe el estado del que ya se pidió
+        clave = (request.headers.get('Idempotency-Key') or request.POST.get('clave_idempotencia', ''))[:64]
+        procesamiento = await ProcesamientoIA.objects.filter(peticion=peticion).afirst()
+        if clave and procesamiento and procesamiento.clave_idempotencia == clave:
+            return JsonResponse({
+                'success': True,
+                'en_curso': procesamiento.estado_procesamiento == 'procesando',
+                'clave_idempotencia': clave,
+                'estado': procesamiento.estado_procesamiento,
+                'message': 'La solicitud ya había sido recibida'
+            })
         
-        # Verificar permisos de acceso
-        if not puede_ver_peticion(request.user, peticion):
-            return JsonResponse({'success': False, 'message': 'No tienes permiso para esta acción'})
+        adquirido, procesamiento = await sync_to_async(adquirir_bloqueo)(peticion, clave)
+        if not adquirido:
+            # Ya hay un procesamiento en curso: esta solicitud se une a él
+            return JsonResponse({
+                'success': True,
+                'en_curso': True,
+                'clave_idempotencia': procesamiento.clave_idempotencia,
+                'estado': procesamiento.estado_procesamiento,
+                'message': 'La petición ya se está procesando'
+            })
         
+        # Si espera en la cola hasta que el bloqueo parezca vencido y otra
+        # solicitud lo toma, este trabajo no se ejecuta (confirmar_bloqueo)
         def reprocesar_en_background():
             gemini_service = GeminiTranscriptionService()
-            gemini_service.reanalizar_peticion(peticion)
+            gemini_service.reanalizar_peticion(peticion, clave_bloqueo=procesamiento.clave_idempotencia)
         
-        # Ejecutar reprocesamiento en hilo separado
-        thread = threading.Thread(target=reprocesar_en_background)
-        thread.daemon = True
-        thread.start()
+        # Encolar con la prioridad que da su fecha de vencimiento
+        await sync_to_async(cola_ia.encolar)(peticion, reprocesar_en_background)
         
         return JsonResponse({
             'success': True,
+            'en_curso': False,
+            'clave_idempotencia': procesamiento.clave_idempotencia,
+            'estado': procesamiento.estado_procesamiento,
             'message': 'Reprocesamiento iniciado correctamente'
         })
     
     return JsonResponse({'success': False, 'message': 'Método no permitido'})
 
 
+# Radicados que se pueden consultar en una sola llamada al endpoint de estado
+MAXIMO_RADICADOS_ESTADO = 100
+
+
+@login_required
+def estado_procesamiento_peticiones(request):
+    """
+    Vista AJAX con el estado del procesamiento IA de varias peticiones
+    (?radicados=a,b,c), para actualizar los indicadores de la lista y del
+    detalle sin recargar la página.
+    
+    Responde con ETag y Last-Modified: si nada cambió desde la consulta
+    anterior retorna 304 sin cuerpo.
+    """
+    radicados = [r for r in request.GET.get('radicados', '').split(',') if r][:MAXIMO_RADICADOS_ESTADO]
+    
+    peticiones = Peticion.objects.visible_para(request.user).filter(radicado__in=radicados)
+    
+    estados = {}
+    fechas = []
+    for peticion in peticiones.select_related('procesamiento_ia').only(
+        'radicado', 'estado', 'fecha_actualizacion', 'transcripcion_completa',
+        'procesamiento_ia__estado_procesamiento', 'procesamiento_ia__fecha_actualizacion'
+    ):
+        procesamiento = getattr(peticion, 'procesamiento_ia', None)
+        fechas.append(peticion.fecha_actualizacion)
+        if procesamiento:
+            fechas.append(procesamiento.fecha_actualizacion)
+        estados[peticion.radicado] = {
+            'estado': peticion.estado,
+            'estado_procesamiento': procesamiento.estado_procesamiento if procesamiento else 'sin_procesar',
+            'transcrita': bool(peticion.transcripcion_completa),
+        }
+    
+    response = JsonResponse({'success': True, 'peticiones': estados}, json_dumps_params={'sort_keys': True})
+    etag = f'"{hashlib.md5(response.content).hexdigest()}"'
+    last_modified = int(max(fechas).timestamp()) if fechas else None
+    
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # El navegador puede guardarla pero debe revalidar en cada consulta
+    patch_cache_control(response, private=True, no_cache=True)
+    return get_conditional_response(request, etag=etag, last_modified=last_modified, response=response)
+
+
 @login_required
 def cambiar_estado_peticion(request, radicado):
     """Vista para cambiar el estado de una petición con archivos adjuntos"""
@@ -224,12 +359,8 @@ def cambiar_estado_peticion(request, radicado):
         from .forms import MarcarRespondidoForm
         from django.utils import timezone
         
-        peticion = get_object_or_404(Peticion, radicado=radicado)
-        
-        # Verificar permisos de acceso
-        if not puede_ver_peticion(request.user, peticion):
-            messages.error(request, 'No tienes permiso para modificar esta petición.')
-            return redirect('index')
+        # Solo la encuentra si el usuario puede verla (si no, 404)
+        peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
         nuevo_estado = request.POST.get('nuevo_estado')
         
         if nuevo_estado == 'respondido':
@@ -241,6 +372,7 @@ def cambiar_estado_peticion(request, radicado):
                 peticion.estado = 'respondido'
                 peticion.fecha_respuesta = timezone.now()
                 peticion.save()
+                indexar_peticion(peticion)
                 
                 messages.success(
                     request, 
@@ -255,6 +387,7 @@ def cambiar_estado_peticion(request, radicado):
         elif nuevo_estado == 'sin_responder':
             peticion.estado = nuevo_estado
             peticion.save()
+            indexar_peticion(peticion)
             
             messages.success(
                 request, 
@@ -269,12 +402,8 @@ def cambiar_estado_peticion(request, radicado):
 @login_required
 def editar_peticionario(request, radicado):
     """Vista para editar los datos del peticionario"""
-    peticion = get_object_or_404(Peticion, radicado=radicado)
-    
-    # Verificar permisos de acceso
-    if not puede_ver_peticion(request.user, peticion):
-        messages.error(request, 'No tienes permiso para editar esta petición.')
-        return redirect('index')
+    # Solo la encuentra si el usuario puede verla (si no, 404)
+    peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
     
     if request.method == 'POST':
         form = EditarPeticionarioForm(request.POST, instance=peticion)
@@ -323,11 +452,8 @@ def editar_peticionario(request, radicado):
 def obtener_datos_peticionario(request, radicado):
     """Vista AJAX para obtener los datos actuales del peticionario"""
     if request.method == 'GET':
-        peticion = get_object_or_404(Peticion, radicado=radicado)
-        
-        # Verificar permisos de acceso
-        if not puede_ver_peticion(request.user, peticion):
-            return JsonResponse({'success': False, 'message': 'No tienes permiso para esta acción'})
+        # Solo la encuentra si el usuario puede verla (si no, 404)
+        peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
         
         return JsonResponse({
             'success': True,
@@ -341,24 +467,96 @@ def obtener_datos_peticionario(request, radicado):
     return JsonResponse({'success': False, 'message': 'Método no permitido'})
 
 
+@login_required
+def buscar_peticiones_similares(request, radicado):
+    """
+    Peticiones respondidas más parecidas a esta (índice TF-IDF local), con su
+    respuesta final, para consultar precedentes. Solo incluye las que el
+    usuario puede ver.
+    """
+    # Solo la encuentra si el usuario puede verla (si no, 404)
+    peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
+    
+    try:
+        k = min(max(int(request.GET.get('k', 5)), 1), 20)
+    except ValueError:
+        k = 5
+    
+    inicio = time.time()
+    # Las de otras dependencias se filtran en la consulta; las respuestas vienen precargadas
+    similares = peticiones_similares(peticion, k=k, visibles=Peticion.objects.visible_para(request.user))
+    
+    return JsonResponse({
+        'success': True,
+        'similares': [
+            {
+                'radicado': similar.radicado,
+                'url': reverse('detalle_peticion', args=[similar.radicado]),
+                'similitud': round(similitud, 3),
+                'resumen': similar.transcripcion_completa[:300],
+                'respuesta': respuesta_final(similar),
+                'fecha_respuesta': similar.fecha_respuesta.strftime('%Y-%m-%d') if similar.fecha_respuesta else None
+            }
+            for similar, similitud in similares
+        ],
+        'tiempo_ms': round((time.time() - inicio) * 1000, 1)
+    })
+
+
+@user_passes_test(is_jefe_juridica)
+def estadisticas_cola_ia(request):
+    """
+    Vista AJAX con la profundidad y los tiempos de espera de la cola de
+    trabajos IA de este proceso, por nivel de prioridad (solo Jefe Jurídica)
+    """
+    return JsonResponse({
+        'success': True,
+        **cola_ia.estadisticas()
+    })
+
+
+@user_passes_test(is_jefe_juridica)
+def estadisticas_procesamiento_ia(request):
+    """
+    Vista AJAX con p50/p95 de cada etapa del procesamiento IA por día
+    (solo Jefe Jurídica - dependencia 111)
+    """
+    from .services.metricas_ia_service import estadisticas_por_etapa
+    
+    try:
+        dias = min(max(int(request.GET.get('dias', 30)), 1), 365)
+    except ValueError:
+        dias = 30
+    
+    return JsonResponse({
+        'success': True,
+        **estadisticas_por_etapa(dias=dias)
+    })
+
+
 # ========================================
 # NUEVAS VISTAS PARA ASISTENTE IA
 # ========================================
 
 @login_required
 @csrf_exempt
-def iniciar_asistente_respuesta(request, radicado):
+async def iniciar_asistente_respuesta(request, radicado):
     """
     Inicia el proceso de asistente inteligente para generar respuesta
+    
+    El análisis se guarda por hash de la transcripción y se sirve a cualquier
+    usuario autorizado; solo se vuelve a generar si la transcripción cambia
+    o si se envía {"regenerar": true}.
+    
+    Es asíncrona: bajo ASGI la espera al modelo no ocupa un worker.
     """
     if request.method == 'POST':
+        user = await request.auser()
+        # Solo la encuentra si el usuario puede verla (si no, 404)
+        visibles = await sync_to_async(Peticion.objects.visible_para)(user)
+        peticion = await aget_object_or_404(visibles.select_related('dependencia'), radicado=radicado)
+        
         try:
-            peticion = get_object_or_404(Peticion, radicado=radicado)
-            
-            # Verificar permisos de acceso
-            if not puede_ver_peticion(request.user, peticion):
-                return JsonResponse({'success': False, 'error': 'No tienes permiso para esta acción'})
-            
             # Verificar que la petición tenga transcripción
             if not peticion.transcripcion_completa:
                 return JsonResponse({
@@ -366,16 +564,23 @@ def iniciar_asistente_respuesta(request, radicado):
                     'error': 'La petición debe estar procesada por IA primero'
                 })
             
-            # Iniciar análisis con IA
-            asistente_service = AsistenteRespuestaService()
-            analisis = asistente_service.analizar_peticion_y_generar_preguntas(peticion)
+            # Regenerar solo si el usuario lo pide explícitamente
+            try:
+                regenerar = bool(json.loads(request.body or b'{}').get('regenerar'))
+            except (ValueError, AttributeError):
+                regenerar = False
             
-            # Guardar análisis en sesión
-            request.session[f'analisis_{radicado}'] = analisis
+            # Reutilizar el análisis guardado para esta transcripción o generarlo con IA
+            asistente_service = AsistenteRespuestaService()
+            registro, desde_cache = await asistente_service.aobtener_analisis(
+                peticion, usuario=user, regenerar=regenerar
+            )
             
             return JsonResponse({
                 'success': True,
-                'analisis': analisis
+                'analisis': registro.analisis,
+                'desde_cache': desde_cache,
+                'fecha_generacion': timezone.localtime(registro.fecha_generacion).strftime('%Y-%m-%d %H:%M:%S')
             })
             
         except Exception as e:
@@ -393,23 +598,20 @@ def mostrar_asistente_respuesta(request, radicado):
     """
     Muestra la interfaz del asistente con las preguntas generadas
     """
-    peticion = get_object_or_404(Peticion, radicado=radicado)
-    
-    # Verificar permisos de acceso
-    if not puede_ver_peticion(request.user, peticion):
-        messages.error(request, 'No tienes permiso para acceder a esta petición.')
-        return redirect('index')
+    # Solo la encuentra si el usuario puede verla (si no, 404)
+    peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
     
-    # Obtener análisis de la sesión
-    analisis = request.session.get(f'analisis_{radicado}')
+    # Obtener el análisis guardado para la transcripción actual
+    registro = analisis_guardado(peticion)
     
-    if not analisis:
+    if not registro:
         messages.error(request, 'Debe iniciar el análisis primero')
         return redirect('detalle_peticion', radicado=radicado)
     
     context = {
         'peticion': peticion,
-        'analisis': analisis
+        'analisis': registro.analisis,
+        'analisis_registro': registro
     }
     
     return render(request, 'peticiones/asistente_respuesta.html', context)
@@ -417,18 +619,19 @@ def mostrar_asistente_respuesta(request, radicado):
 
 @login_required
 @csrf_exempt
-def procesar_respuestas_asistente(request, radicado):
+async def procesar_respuestas_asistente(request, radicado):
     """
     Procesa las respuestas del usuario y genera la respuesta sugerida
+    
+    Es asíncrona: bajo ASGI la espera al modelo no ocupa un worker.
     """
     if request.method == 'POST':
+        user = await request.auser()
+        # Solo la encuentra si el usuario puede verla (si no, 404)
+        visibles = await sync_to_async(Peticion.objects.visible_para)(user)
+        peticion = await aget_object_or_404(visibles.select_related('dependencia'), radicado=radicado)
+        
         try:
-            peticion = get_object_or_404(Peticion, radicado=radicado)
-            
-            # Verificar permisos de acceso
-            if not puede_ver_peticion(request.user, peticion):
-                return JsonResponse({'success': False, 'error': 'No tienes permiso para esta acción'})
-            
             # Obtener respuestas del formulario
             data = json.loads(request.body)
             respuestas_usuario = data.get('respuestas', [])
@@ -441,16 +644,24 @@ def procesar_respuestas_asistente(request, radicado):
             
             # Generar respuesta con IA
             asistente_service = AsistenteRespuestaService()
-            resultado = asistente_service.generar_respuesta_sugerida(peticion, respuestas_usuario)
+            inicio = time.time()
+            resultado = await asistente_service.agenerar_respuesta_sugerida(peticion, respuestas_usuario)
             
-            # Evaluar calidad de la respuesta
-            evaluacion = asistente_service.evaluar_calidad_respuesta(resultado['respuesta_sugerida'])
+            # Guardar la respuesta como nueva versión de borrador
+            borrador = await sync_to_async(asistente_service.guardar_borrador)(
+                peticion, resultado['respuesta_sugerida'], respuestas_usuario, time.time() - inicio, user
+            )
+            
+            # La evaluación de calidad corre en segundo plano; se consulta aparte
+            await sync_to_async(programar_evaluacion)(borrador)
             
             return JsonResponse({
                 'success': True,
                 'respuesta_sugerida': resultado['respuesta_sugerida'],
-                'evaluacion': evaluacion,
-                'fecha_generacion': resultado['fecha_generacion']
+                'fecha_generacion': resultado['fecha_generacion'],
+                'version': borrador.version,
+                'estado_evaluacion': borrador.estado_evaluacion,
+                'precedentes': [precedente['radicado'] for precedente in asistente_service.precedentes]
             })
             
         except Exception as e:
@@ -463,52 +674,201 @@ def procesar_respuestas_asistente(request, radicado):
     return JsonResponse({'success': False, 'error': 'Método no permitido'})
 
 
+def evento_sse(evento, datos):
+    """Formatea un evento Server-Sent Events con datos JSON"""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
+
+@login_required
+@csrf_exempt
+async def procesar_respuestas_asistente_stream(request, radicado):
+    """
+    Igual que procesar_respuestas_asistente, pero transmite la respuesta por
+    Server-Sent Events a medida que el modelo la escribe:
+    - token: fragmento de texto generado
+    - respuesta: texto completo, fecha y versión del borrador guardado
+    - error / fin
+    
+    La evaluación de calidad no viaja en el stream: se consulta en
+    evaluacion_borrador cuando termine.
+    
+    Django acumula los iteradores síncronos bajo ASGI y los asíncronos bajo
+    WSGI, así que el generador se elige según el servidor que atiende.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+    
+    user = await request.auser()
+    # Solo la encuentra si el usuario puede verla (si no, 404)
+    visibles = await sync_to_async(Peticion.objects.visible_para)(user)
+    peticion = await aget_object_or_404(visibles.select_related('dependencia'), radicado=radicado)
+    
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Solicitud inválida'})
+    
+    respuestas_usuario = data.get('respuestas', [])
+    if not respuestas_usuario:
+        return JsonResponse({
+            'success': False,
+            'error': 'No se proporcionaron respuestas'
+        })
+    
+    def evento_respuesta(borrador):
+        return evento_sse('respuesta', {
+            'respuesta_sugerida': borrador.contenido,
+            'fecha_generacion': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'version': borrador.version,
+            'estado_evaluacion': borrador.estado_evaluacion
+        })
+    
+    def eventos():
+        # Comentario inicial para que proxies y navegador abran el stream de inmediato
+        yield ': inicio\n\n'
+        
+        asistente_service = AsistenteRespuestaService()
+        inicio = time.time()
+        partes = []
+        try:
+            for fragmento in asistente_service.generar_respuesta_sugerida_stream(peticion, respuestas_usuario):
+                partes.append(fragmento)
+                yield evento_sse('token', {'texto': fragmento})
+            
+            borrador = asistente_service.guardar_borrador(
+                peticion, ''.join(partes).strip(), respuestas_usuario, time.time() - inicio, user
+            )
+            # La evaluación de calidad corre en segundo plano; se consulta aparte
+            programar_evaluacion(borrador)
+            yield evento_respuesta(borrador)
+            
+        except Exception as e:
+            logger.error(f"Error en streaming de respuesta para {radicado}: {str(e)}")
+            yield evento_sse('error', {'error': str(e)})
+        
+        yield evento_sse('fin', {})
+    
+    async def aeventos():
+        yield ': inicio\n\n'
+        
+        asistente_service = AsistenteRespuestaService()
+        inicio = time.time()
+        partes = []
+        try:
+            async for fragmento in asistente_service.agenerar_respuesta_sugerida_stream(peticion, respuestas_usuario):
+                partes.append(fragmento)
+                yield evento_sse('token', {'texto': fragmento})
+            
+            borrador = await sync_to_async(asistente_service.guardar_borrador)(
+                peticion, ''.join(partes).strip(), respuestas_usuario, time.time() - inicio, user
+            )
+            await sync_to_async(programar_evaluacion)(borrador)
+            yield evento_respuesta(borrador)
+            
+        except Exception as e:
+            logger.error(f"Error en streaming de respuesta para {radicado}: {str(e)}")
+            yield evento_sse('error', {'error': str(e)})
+        
+        yield evento_sse('fin', {})
+    
+    generador = aeventos() if isinstance(request, ASGIRequest) else eventos()
+    response = StreamingHttpResponse(generador, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Evitar que nginx acumule el stream
+    return response
+
+
 @login_required
 def historial_asistente(request, radicado):
     """
-    Muestra el historial de respuestas generadas por el asistente
+    Muestra el historial de respuestas generadas por el asistente (borradores
+    versionados) y, con ?comparar=<v1>&con=<v2>, las diferencias entre dos versiones
     """
-    peticion = get_object_or_404(Peticion, radicado=radicado)
+    # Solo la encuentra si el usuario puede verla (si no, 404)
+    peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
     
-    # Verificar permisos de acceso
-    if not puede_ver_peticion(request.user, peticion):
-        messages.error(request, 'No tienes permiso para acceder a esta petición.')
-        return redirect('index')
+    borradores = list(peticion.borradores.select_related('creado_por'))
     
-    # Aquí podrías implementar un modelo para guardar el historial
-    # Por ahora, mostraremos la última respuesta de la sesión
+    diferencias = None
+    comparacion = None
+    por_version = {borrador.version: borrador for borrador in borradores}
+    try:
+        version_anterior = int(request.GET.get('comparar', ''))
+        version_actual = int(request.GET.get('con', ''))
+    except ValueError:
+        version_anterior = version_actual = None
+    
+    if version_anterior in por_version and version_actual in por_version:
+        comparacion = (por_version[version_anterior], por_version[version_actual])
+        diferencias = comparar_borradores(*comparacion)
     
     context = {
-        'peticion': peticion
+        'peticion': peticion,
+        'borradores': borradores,
+        'comparacion': comparacion,
+        'diferencias': diferencias
     }
     
     return render(request, 'peticiones/historial_asistente.html', context)
 
 
+@login_required
+@csrf_exempt
+def evaluacion_borrador(request, radicado, version):
+    """
+    Estado y resultado de la evaluación de calidad de un borrador.
+    Con POST se solicita (de nuevo) la evaluación, aunque la dependencia la
+    tenga desactivada.
+    """
+    # Solo la encuentra si el usuario puede verla (si no, 404)
+    peticion = get_object_or_404(Peticion.objects.visible_para(request.user).select_related('dependencia'), radicado=radicado)
+    
+    borrador = get_object_or_404(peticion.borradores, version=version)
+    
+    if request.method == 'POST' and borrador.estado_evaluacion not in ('pendiente', 'en_proceso'):
+        programar_evaluacion(borrador, forzar=True)
+    
+    return JsonResponse({
+        'success': True,
+        'version': borrador.version,
+        'estado_evaluacion': borrador.estado_evaluacion,
+        'evaluacion': borrador.evaluacion
+    })
+
+
+def respuesta_word(peticion, contenido_respuesta, usuario, version=None):
+    """Arma la descarga del documento Word de respuesta"""
+    word_service = DocumentoWordService()
+    response = HttpResponse(
+        word_service.generar(peticion, contenido_respuesta, usuario),
+        content_type=CONTENT_TYPE_DOCX
+    )
+    filename = word_service.nombre_archivo(peticion, version)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @login_required
 @csrf_exempt
 def descargar_respuesta_word(request, radicado):
     """
     Descarga la respuesta generada en formato Word (.docx) usando plantilla institucional
+    
+    Recibe el texto en ``contenido_respuesta`` o la versión de un borrador
+    guardado en ``version``.
     """
     if request.method == 'POST':
+        # Solo la encuentra si el usuario puede verla (si no, 404)
+        peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
+        
         try:
-            from docx import Document
-            from django.http import HttpResponse
-            from datetime import datetime
-            from django.conf import settings
-            import io
-            import os
-            
-            peticion = get_object_or_404(Peticion, radicado=radicado)
-            
-            # Verificar permisos de acceso
-            if not puede_ver_peticion(request.user, peticion):
-                return JsonResponse({'success': False, 'error': 'No tienes permiso para esta acción'})
-            
             # Obtener el contenido de la respuesta del POST
             data = json.loads(request.body)
-            contenido_respuesta = data.get('contenido_respuesta', '')
+            version = data.get('version')
+            if version:
+                contenido_respuesta = get_object_or_404(peticion.borradores, version=version).contenido
+            else:
+                contenido_respuesta = data.get('contenido_respuesta', '')
             
             if not contenido_respuesta:
                 return JsonResponse({
@@ -516,95 +876,7 @@ def descargar_respuesta_word(request, radicado):
                     'error': 'No se proporcionó contenido para la respuesta'
                 })
             
-            # Obtener datos del usuario autenticado
-            if not request.user.is_authenticated:
-                return JsonResponse({
-                    'success': False,
-                    'error': 'Debe iniciar sesión para generar documentos'
-                })
-            
-            usuario = request.user
-            # Obtener ciudad de la dependencia, o usar valor por defecto
-            if usuario.dependencia and usuario.dependencia.ciudad:
-                ciudad = usuario.dependencia.ciudad
-            else:
-                ciudad = 'Ciudad'
-            nombre_funcionario = usuario.nombre_completo
-            cargo_funcionario = usuario.cargo
-            
-            # Ruta de la plantilla
-            plantilla_path = os.path.join(settings.BASE_DIR, 'plantillas_word', 'plantilla_respuesta_peticion.docx')
-            
-            # Verificar que existe la plantilla
-            if not os.path.exists(plantilla_path):
-                return JsonResponse({
-                    'success': False,
-                    'error': 'No se encontró la plantilla de Word. Por favor contacte al administrador.'
-                })
-            
-            # Cargar la plantilla
-            doc = Document(plantilla_path)
-            
-            # Preparar datos para reemplazo
-            fecha_actual = datetime.now()
-            
-            # Usar diccionario de meses en español (independiente del locale del sistema)
-            meses_espanol = {
-                1: 'enero', 2: 'febrero', 3: 'marzo', 4: 'abril',
-                5: 'mayo', 6: 'junio', 7: 'julio', 8: 'agosto',
-                9: 'septiembre', 10: 'octubre', 11: 'noviembre', 12: 'diciembre'
-            }
-            fecha_formateada = f"{fecha_actual.day} de {meses_espanol[fecha_actual.month]} de {fecha_actual.year}"
-            
-            # Diccionario de reemplazos
-            reemplazos = {
-                '{{CIUDAD}}': ciudad,
-                '{{FECHA}}': fecha_formateada,
-                '{{NOMBRE_PETICIONARIO}}': peticion.peticionario_nombre or 'Ciudadano(a)',
-                '{{DIRECCION_PETICIONARIO}}': peticion.peticionario_direccion or 'Dirección no especificada',
-                '{{RADICADO}}': peticion.radicado,
-                '{{CUERPO_RESPUESTA}}': contenido_respuesta,
-                '{{NOMBRE_FUNCIONARIO}}': nombre_funcionario,
-                '{{CARGO_FUNCIONARIO}}': cargo_funcionario
-            }
-            
-            # Función para reemplazar texto en párrafos
-            def reemplazar_en_parrafo(parrafo, reemplazos):
-                for clave, valor in reemplazos.items():
-                    if clave in parrafo.text:
-                        # Guardar el formato del párrafo
-                        inline = parrafo.runs
-                        for i in range(len(inline)):
-                            if clave in inline[i].text:
-                                # Reemplazar el texto manteniendo el formato
-                                inline[i].text = inline[i].text.replace(clave, valor)
-            
-            # Reemplazar en todos los párrafos del documento
-            for parrafo in doc.paragraphs:
-                reemplazar_en_parrafo(parrafo, reemplazos)
-            
-            # Reemplazar en tablas si las hay
-            for tabla in doc.tables:
-                for fila in tabla.rows:
-                    for celda in fila.cells:
-                        for parrafo in celda.paragraphs:
-                            reemplazar_en_parrafo(parrafo, reemplazos)
-            
-            # Guardar documento en memoria
-            file_stream = io.BytesIO()
-            doc.save(file_stream)
-            file_stream.seek(0)
-            
-            # Preparar respuesta HTTP
-            response = HttpResponse(
-                file_stream.read(),
-                content_type='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-            )
-            
-            filename = f'Respuesta_{peticion.radicado}_{datetime.now().strftime("%Y%m%d")}.docx'
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-            
-            return response
+            return respuesta_word(peticion, contenido_respuesta, request.user, version)
             
         except Exception as e:
             logger.error(f"Error generando documento Word para {radicado}: {str(e)}")
@@ -613,4 +885,85 @@ def descargar_respuesta_word(request, radicado):
                 'error': str(e)
             })
     
-    return JsonResponse({'success': False, 'error': 'Método no permitido'})
\ No newline at end of file
+    return JsonResponse({'success': False, 'error': 'Método no permitido'})
+
+
+@login_required
+@csrf_exempt
+def descargar_lote_word(request):
+    """
+    Descarga en un ZIP el Word del último borrador guardado de cada petición
+    indicada (``radicados`` en JSON o en el formulario). Los documentos se
+    generan en paralelo y el ZIP se envía a medida que se producen; las
+    peticiones sin borrador, sin permiso o con error quedan en OMITIDAS.txt.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Método no permitido'})
+    
+    if request.content_type == 'application/json':
+        try:
+            radicados = json.loads(request.body or '{}').get('radicados', [])
+        except (ValueError, AttributeError):
+            return JsonResponse({'success': False, 'error': 'Solicitud inválida'})
+    else:
+        radicados = request.POST.getlist('radicados')
+    if not isinstance(radicados, list) or not all(isinstance(radicado, str) for radicado in radicados):
+        return JsonResponse({'success': False, 'error': 'Solicitud inválida'})
+    radicados = list(dict.fromkeys(radicados))
+    
+    if not radicados:
+        return JsonResponse({'success': False, 'error': 'No se indicaron peticiones'})
+    if len(radicados) > settings.WORD_LOTE_MAXIMO:
+        return JsonResponse({
+            'success': False,
+            'error': f'Se pueden descargar máximo {settings.WORD_LOTE_MAXIMO} peticiones por lote'
+        })
+    
+    peticiones = Peticion.objects.visible_para(request.user).select_related('dependencia').filter(radicado__in=radicados)
+    peticiones = {peticion.pk: peticion for peticion in peticiones}
+    
+    # Último borrador de cada petición
+    ultimos = {}
+    for borrador in BorradorRespuesta.objects.filter(peticion_id__in=peticiones).order_by('peticion_id', 'version'):
+        ultimos[borrador.peticion_id] = borrador
+    
+    if not ultimos:
+        return JsonResponse({'success': False, 'error': 'Ninguna de las peticiones tiene borradores guardados'})
+    
+    # Los hilos que generan los documentos no consultan la base de datos
+    usuario = Usuario.objects.select_related('dependencia').get(pk=request.user.pk)
+    documentos = [(peticiones[pk], borrador.contenido, borrador.version) for pk, borrador in ultimos.items()]
+    encontrados = {peticion.radicado for peticion, _, _ in documentos}
+    omitidas = [f'{radicado}: sin borradores guardados o sin permiso' for radicado in radicados if radicado not in encontrados]
+    
+    def archivos():
+        for peticion, nombre, contenido, error in DocumentoWordService().generar_lote(documentos, usuario):
+            if contenido is None:
+                omitidas.append(f'{peticion.radicado}: {error}')
+            else:
+                yield nombre, contenido
+        if omitidas:
+            yield 'OMITIDAS.txt', '\n'.join(omitidas).encode('utf-8')
+    
+    logger.info(f"Descarga en lote de {len(documentos)} documentos Word por {request.user.cedula}")
+    response = StreamingHttpResponse(zip_en_stream(archivos()), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="Respuestas_{timezone.now().strftime("%Y%m%d_%H%M")}.zip"'
+    return response
+
+
+@login_required
+def descargar_borrador_word(request, radicado, version):
+    """
+    Descarga en Word un borrador guardado, sin volver a llamar al modelo
+    """
+    # Solo la encuentra si el usuario puede verla (si no, 404)
+    peticion = get_object_or_404(Peticion.objects.visible_para(request.user), radicado=radicado)
+    
+    borrador = get_object_or_404(peticion.borradores, version=version)
+    
+    try:
+        return respuesta_word(peticion, borrador.contenido, request.user, borrador.version)
+    except Exception as e:
+        logger.error(f"Error generando documento Word para {radicado} v{version}: {str(e)}")
+        messages.error(request, f'No se pudo generar el documento Word: {str(e)}')
+        return redirect('historial_asistente', radicado=radicado)